@@ -118,11 +118,11 @@ export default function App() {
     }
     
     if (data.premium_customers && Array.isArray(data.premium_customers)) {
-      return `👑 Premium customers (${data.premium_customers.length}):\n\n${data.premium_customers.slice(0, 5).map(c => `• ${c.FNAME1} ${c.LNAME} - ${c.Email}`).join('\n')}${data.premium_customers.length > 5 ? '\n...and more' : ''}`;
+      return `👑 Premium customers (${data.total ?? data.premium_customers.length}):\n\n${data.premium_customers.slice(0, 5).map(c => `• ${c.FNAME1} ${c.LNAME} - ${c.Email}`).join('\n')}${(data.total ?? data.premium_customers.length) > 5 ? '\n...and more' : ''}`;
     }
     
     if (data.standard_customers && Array.isArray(data.standard_customers)) {
-      return `👤 Standard customers (${data.standard_customers.length}):\n\n${data.standard_customers.slice(0, 5).map(c => `• ${c.FNAME1} ${c.LNAME} - ${c.Email}`).join('\n')}${data.standard_customers.length > 5 ? '\n...and more' : ''}`;
+      return `👤 Standard customers (${data.total ?? data.standard_customers.length}):\n\n${data.standard_customers.slice(0, 5).map(c => `• ${c.FNAME1} ${c.LNAME} - ${c.Email}`).join('\n')}${(data.total ?? data.standard_customers.length) > 5 ? '\n...and more' : ''}`;
     }
     
     if (data.top_customers_by_revenue) {
@@ -260,11 +260,11 @@ export default function App() {
     
     // Legacy responses
     if (data.customers && Array.isArray(data.customers)) {
-      return `👥 Found ${data.customers.length} customers:\n\n${data.customers.slice(0, 3).map(c => `• ${c.FNAME1} ${c.LNAME} (${c.Customer_Type}) - ${c.Email}`).join('\n')}${data.customers.length > 3 ? '\n...and more' : ''}`;
+      return `👥 Found ${data.total ?? data.customers.length} customers:\n\n${data.customers.slice(0, 3).map(c => `• ${c.FNAME1} ${c.LNAME} (${c.Customer_Type}) - ${c.Email}`).join('\n')}${(data.total ?? data.customers.length) > 3 ? '\n...and more' : ''}`;
     }
     
     if (data.products && Array.isArray(data.products)) {
-      return `🛍️ Found ${data.products.length} products:\n\n${data.products.slice(0, 3).map(p => `• ${p.name} - $${p.baseprice}`).join('\n')}${data.products.length > 3 ? '\n...and more' : ''}`;
+      return `🛍️ Found ${data.total ?? data.products.length} products:\n\n${data.products.slice(0, 3).map(p => `• ${p.name} - $${p.baseprice}`).join('\n')}${(data.total ?? data.products.length) > 3 ? '\n...and more' : ''}`;
     }
     
     if (data.top_products) {
@@ -1,44 +1,415 @@
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
 import os
-from datetime import datetime
+from datetime import datetime, date
 import json
 import plotly.graph_objects as go
 import plotly.express as px
-from plotly.utils import PlotlyJSONEncoder
 import base64
+import binascii
+import io
 from io import BytesIO
+import hashlib
+import threading
+import time
+import contextvars
+import re
+import functools
+import math
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from snapshot import SnapshotStore
+from chunked import CHUNKED_TABLES, IN_MEMORY_EXPANSION, ChunkedAggregates, rows_per_chunk
+from cube import AggregateCube
+from sql_backend import (SQLiteStore, SQL_INDEXES, SQL_LOAD_CHUNK_ROWS, MERGED_SQL, sql_query, sql_row, sql_cube,
+                         sql_range_summary, sql_range_rows, sql_sketches, sql_rows)
+from search_index import Postings, SearchIndex, tokenize
+from sketches import DailySketches, LineSketch
+from tables import (SOURCE_FILES, TABLE_SCHEMAS, SCHEMA_VERSION, DATE_SORTED_TABLES, NAT_INT64, NS_PER_DAY,
+                    read_typed_csv, read_typed_csv_chunks, sort_by_date)
+from telemetry import REGISTRY, span, count_rows, annotate, start_trace, end_trace, normalize_query
+
+# Copy-on-write lets cached frames be handed out as cheap shallow copies:
+# a handler that assigns or edits columns only ever touches its own copy.
+pd.set_option('mode.copy_on_write', True)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_safe(obj):
+    """obj with NaN and infinite floats made None and numpy dict keys Python ones, also inside dicts and lists"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key.item() if isinstance(key, np.generic) else key: json_safe(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [json_safe(value) for value in obj]
+    return obj
+
+class DataJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes numpy, pandas and Plotly objects natively in one pass
+    
+    Uses orjson (numpy arrays and scalars are encoded in C) when it is
+    installed, otherwise the standard library encoder with the same hooks.
+    Either way NaN and infinite floats are written as null, which is what
+    orjson does and the only valid JSON for them.
+    """
+    ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS) if orjson else 0
+    
+    @staticmethod
+    def default(obj):
+        if isinstance(obj, np.ndarray):
+            return json_safe(obj.tolist())
+        if isinstance(obj, np.generic):
+            return json_safe(obj.item())
+        if isinstance(obj, (pd.Series, pd.Index)):
+            return json_safe(obj.tolist())
+        if isinstance(obj, pd.DataFrame):
+            return json_safe(obj.to_dict('records'))
+        if obj is pd.NaT:
+            return None
+        if isinstance(obj, (datetime, pd.Timestamp, date)):
+            return obj.isoformat()
+        if isinstance(obj, pd.Period):
+            return str(obj)
+        # Last, since resolving go.Figure goes through plotly's lazy imports on every call
+        if isinstance(obj, go.Figure):
+            return obj.to_plotly_json()
+        return DefaultJSONProvider.default(obj)
+    
+    def encode(self, obj):
+        """Serialize obj to UTF-8 JSON bytes"""
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=self.default, option=self.ORJSON_OPTIONS)
+            except TypeError:
+                # e.g. numpy integers as dict keys; the standard encoder copes with the rest
+                pass
+        return json.dumps(json_safe(obj), default=self.default, sort_keys=self.sort_keys,
+                          ensure_ascii=self.ensure_ascii).encode()
+    
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', self.default)
+            return json.dumps(json_safe(obj), **kwargs)
+        return self.encode(obj).decode()
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with span('serialize'):
+            body = self.encode(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
 
 app = Flask(__name__)
+app.json = DataJSONProvider(app)
 CORS(app)
 
-class CSVDataManager:
-    def __init__(self, data_dir='../data'):
-        self.data_dir = data_dir
-        self.customer_df = None
-        self.inventory_df = None
-        self.detail_df = None
-        self.pricelist_df = None
-        self.load_all_data()
-    
-    def load_all_data(self):
-        """Load all CSV files into memory"""
+REQUEST_SECONDS = REGISTRY.histogram('smrt_request_seconds', 'HTTP request latency per endpoint')
+QUERY_SECONDS = REGISTRY.histogram('smrt_query_seconds', 'Time to answer a routed query per intent')
+CACHE_LOOKUPS = REGISTRY.counter('smrt_cache_lookups_total', 'Result cache lookups per cache and outcome')
+DATA_LOADS = REGISTRY.counter('smrt_data_loads_total', 'Full data (re)loads and incremental ingests')
+
+# Requests slower than this are logged with their stage breakdown; 0 disables the log
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '1000'))
+
+# Relative periods understood by /api/query, in the order they are checked
+TIME_PERIODS = ('today', 'yesterday', 'this week', 'this month', 'this year')
+
+# Orders placed on or after this date count as recent
+RECENT_ORDERS_SINCE = '2025-01-01'
+
+# Tables whose files the POS only ever appends to; new rows in them are
+# ingested as deltas instead of triggering a full reload
+APPEND_ONLY_TABLES = ('inventory_df', 'detail_df')
+
+# How many bytes before the last read position are compared to tell an
+# append from a rewrite
+TAIL_CHECK_BYTES = 256
+
+# How the canonical columns the query code reads are derived from the POS
+# export, per table. Each rule is evaluated vectorized whenever rows are
+# loaded or appended, so handlers never rebuild them per request:
+#   {'source': column}                       copy a column
+#   {'concat': [columns], 'sep': ' '}        join text columns
+#   {'expr': 'a * b + c'}                    arithmetic via DataFrame.eval
+#   {'map': column, 'values': {...}, 'default': label}
+#                                            relabel values (case-insensitive)
+# Other exports can override rules with a JSON file named by COLUMN_MAPPING_FILE.
+COLUMN_MAPPING = {
+    'customer_df': {
+        'Customer_Name': {'concat': ['FNAME1', 'LNAME'], 'sep': ' '},
+        # Customers on any price table other than the standard one are premium
+        'Customer_Type': {'map': 'PRICETBL', 'values': {'STANDARD': 'Standard'}, 'default': 'Premium'}
+    },
+    'inventory_df': {
+        'Order_Date': {'source': 'INDATE'},
+        'Status': {'map': 'PIF', 'values': {'Y': 'Completed', 'N': 'Pending'}, 'default': 'Unknown'}
+    },
+    'detail_df': {
+        'Product_Name': {'source': 'item_name'},
+        'Category': {'source': 'dept_name'},
+        'Total_Price': {'source': 'standardSubtotal'}
+    },
+    'pricelist_df': {
+        'price_table_item_id': {'source': 'item_id'}
+    }
+}
+
+def load_column_mapping(path=None):
+    """COLUMN_MAPPING with any per-table overrides from a JSON file applied"""
+    mapping = {attr: dict(rules) for attr, rules in COLUMN_MAPPING.items()}
+    if path:
+        with open(path) as f:
+            for attr, rules in json.load(f).items():
+                mapping.setdefault(attr, {}).update(rules)
+    return mapping
+
+def derive_columns(frame, rules):
+    """Add the canonical columns described by rules to a table"""
+    derived = {}
+    for name, rule in rules.items():
         try:
-            self.customer_df = pd.read_csv(os.path.join(self.data_dir, 'Customer.csv'))
-            self.inventory_df = pd.read_csv(os.path.join(self.data_dir, 'Inventory.csv'))
-            self.detail_df = pd.read_csv(os.path.join(self.data_dir, 'Detail.csv'))
-            self.pricelist_df = pd.read_csv(os.path.join(self.data_dir, 'Pricelist.csv'))
-            print("All CSV files loaded successfully")
-        except Exception as e:
-            print(f"Error loading CSV files: {e}")
+            if 'source' in rule:
+                derived[name] = frame[rule['source']]
+            elif 'concat' in rule:
+                parts = [frame[column].astype(object).fillna('').astype(str) for column in rule['concat']]
+                joined = parts[0]
+                for part in parts[1:]:
+                    joined = joined + rule.get('sep', ' ') + part
+                derived[name] = joined.str.strip()
+            elif 'expr' in rule:
+                derived[name] = frame.eval(rule['expr'])
+            elif 'map' in rule:
+                values = {str(key).upper(): label for key, label in rule['values'].items()}
+                labels = frame[rule['map']].astype(object).fillna('').astype(str).str.upper().map(values)
+                derived[name] = labels.fillna(rule.get('default')).astype('category')
+            else:
+                raise ValueError(f"unknown rule {rule}")
+        except (KeyError, ValueError, SyntaxError) as e:
+            print(f"Could not derive column {name}: {e}")
+    return frame.assign(**derived) if derived else frame
+
+class FilePrefix(io.RawIOBase):
+    """The first length bytes of a file, so a parse stops where the file ended when it was stat'ed"""
+    def __init__(self, path, length):
+        self._file = open(path, 'rb')
+        self._remaining = length
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        data = self._file.read(min(len(buffer), self._remaining))
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+    
+    def close(self):
+        self._file.close()
+        super().close()
+
+def append_rows(frame, rows):
+    """Concatenate rows onto a frame, widening categories so categorical columns stay categorical"""
+    frame_columns = {}
+    row_columns = {}
+    for column in frame.columns:
+        if isinstance(frame[column].dtype, pd.CategoricalDtype) and column in rows.columns:
+            categories = frame[column].cat.categories
+            missing = pd.Index(rows[column].dropna().unique()).difference(categories)
+            dtype = pd.CategoricalDtype(categories.append(missing))
+            frame_columns[column] = frame[column].astype(dtype)
+            row_columns[column] = rows[column].astype(dtype)
+    if frame_columns:
+        frame = frame.assign(**frame_columns)
+        rows = rows.assign(**row_columns)
+    return pd.concat([frame, rows], ignore_index=True)
+
+# SQLite storage (STORAGE_BACKEND=sqlite): the tables are copied once into an
+# indexed database file (see sql_backend.SQLiteStore) that is reused across
+# restarts. Customer and Pricelist are also held in memory for the list
+# intents; the cube, the table-wide metrics (SQL_METRICS) and date range
+# summaries are answered by SQL over sql_backend.MERGED_SQL.
+
+STORAGE_BACKENDS = ('pandas', 'sqlite')
+
+# Columns the tables are joined on; a load without them is never published
+JOIN_COLUMNS = {
+    'customer_df': ['CID'],
+    'inventory_df': ['IID', 'CID'],
+    'detail_df': ['IID', 'price_table_item_id'],
+    'pricelist_df': ['price_table_item_id']
+}
+
+# Intents answering for the one customer or product a query names, by the
+# kind of entity (see DataSnapshot.get_search_index)
+ENTITY_INTENTS = {'customer': 'customer_details', 'product': 'product_details'}
+
+# Columns of the in-memory tables that rows are looked up by, each through a
+# group index built at load (see DataSnapshot.get_group_index)
+GROUP_INDEXES = {
+    'customer_df': ['CID'],
+    'inventory_df': ['CID', 'IID', 'TICKETNO'],
+    'detail_df': ['IID']
+}
+
+# The snapshot the current request reads, as (manager, snapshot); see CSVDataManager.pin()
+PINNED_SNAPSHOT = contextvars.ContextVar('pinned_snapshot', default=None)
+
+def phone_digits(column):
+    """A phone number column as strings of its digits"""
+    if column.dtype.kind in 'iuf':
+        column = column.astype('Int64')
+    return column.astype(str).str.replace(r'\D', '', regex=True)
+
+def customer_identifiers(customers):
+    """Values that identify a customer exactly when a question mentions them: email, phone and area code plus phone"""
+    identifiers = []
+    if 'EMAIL' in customers:
+        identifiers.append(customers['EMAIL'])
+    if 'HPHONE' in customers:
+        phone = phone_digits(customers['HPHONE'])
+        identifiers.append(phone)
+        if 'HAREA' in customers:
+            identifiers.append((phone_digits(customers['HAREA']) + phone).where(phone != '', ''))
+    return identifiers
+
+def print_table_sizes(tables):
+    """Print the in-memory size of each loaded table"""
+    for attr in SOURCE_FILES:
+        frame = tables.get(attr)
+        if frame is not None:
+            size = frame.memory_usage(deep=True).sum()
+            print(f"  {attr}: {len(frame):,} rows, {size / 1024 / 1024:,.2f} MB")
+
+class DataSnapshot:
+    """The tables of one data version and the structures derived from them
+    
+    Never changed once published: reloads and ingestion build a new
+    snapshot and CSVDataManager swaps it in whole, so whoever holds this
+    one keeps a consistent view of the data for as long as it holds it.
+    Derived structures are built on first use, once per snapshot.
+    """
+    def __init__(self, manager, tables, data_version, out_of_core=False, sql_bounds=None):
+        self.data_dir = manager.data_dir
+        self.column_mapping = manager.column_mapping
+        self.memory_budget_mb = manager.memory_budget_mb
+        self.spill_dir = manager.spill_dir
+        self.sql_store = manager.sql_store
+        self._derive = manager._derive
+        # Whether this version is too large to hold in memory and is processed in chunks
+        self.out_of_core = out_of_core
+        # Row counts of the SQLite Inventory and Detail tables at this data version
+        self.sql_bounds = sql_bounds or {}
+        for attr in SOURCE_FILES:
+            setattr(self, attr, tables.get(attr))
+        self.data_version = data_version
+        self._derived = {}
+        self._lock = threading.RLock()
+    
+    @property
+    def in_memory(self):
+        """Whether the large tables and their merge are held in memory, rather than chunked or in SQLite"""
+        return self.sql_store is None and not self.out_of_core
+    
+    def refresh(self):
+        return self.data_version
+    
+    def snapshot(self):
+        return self
+    
+    def _get_derived(self, name, builder):
+        """Return a structure derived from the tables, building it on first use"""
+        value = self._derived.get(name)
+        if value is None:
+            with self._lock:
+                value = self._derived.get(name)
+                if value is None:
+                    value = self._derived[name] = builder()
+        return value
     
     def get_merged_data(self):
-        """Get fully merged dataset for comprehensive queries"""
+        """Get fully merged dataset for comprehensive queries
+        
+        The merge is materialized once per data version and handed out as a
+        shallow copy, so callers can treat it as their own without paying for
+        the merge or affecting other requests.
+        """
+        if not self.in_memory:
+            raise RuntimeError('The merged table is not held in memory with chunked execution or SQLite storage')
+        return self._get_derived('merged', self._build_merged_data).copy(deep=False)
+    
+    def get_aggregates(self):
+        """Get the precomputed customer/product/category/order rollups"""
+        if self.out_of_core:
+            return self.get_chunked().cube
+        if self.sql_store is not None:
+            return self._get_derived('aggregates', lambda: sql_cube(self))
+        
+        def build():
+            merged = self.get_merged_data()
+            with span('aggregate'):
+                count_rows('aggregate', len(merged))
+                return AggregateCube(merged)
+        return self._get_derived('aggregates', build)
+    
+    def get_metrics(self):
+        """Get the memo of named metrics (see METRICS) for this data version"""
+        def build():
+            if self.sql_store is not None:
+                return MetricMemo(self, functions=SQL_METRICS)
+            return MetricMemo(self, self.get_chunked().metrics if self.out_of_core else None)
+        return self._get_derived('metrics', build)
+    
+    def get_chunked(self):
+        """Get the result of the chunked pass over the CSVs, in out-of-core mode"""
+        return self._get_derived('chunked', lambda: ChunkedAggregates(self, self.memory_budget_mb, RECENT_ORDERS_SINCE,
+                                                                      self.spill_dir))
+    
+    def get_date_index(self, name):
+        """int64 timestamps of the date column the merged table ('merged') or a
+        DATE_SORTED_TABLES table is sorted by, built once per data version"""
+        def build():
+            if name == 'merged':
+                frame, column = self._get_derived('merged', self._build_merged_data), 'Order_Date'
+            else:
+                frame, column = getattr(self, name), DATE_SORTED_TABLES[name]
+            return frame[column].to_numpy().view('int64')
+        return self._get_derived(f"dates:{name}", build)
+    
+    def date_range_slice(self, name, start=None, end=None):
+        """Rows of a date-sorted table with start <= date < end, found by binary search
+        
+        Either bound may be None for an open range; rows without a date are
+        never included.
+        """
+        dates = self.get_date_index(name)
+        low = NAT_INT64 + 1 if start is None else pd.Timestamp(start).value
+        lo = dates.searchsorted(low, side='left')
+        hi = len(dates) if end is None else dates.searchsorted(pd.Timestamp(end).value, side='left')
+        return slice(lo, max(lo, hi))
+    
+    def get_merged_range(self, start=None, end=None):
+        """Merged rows with an order date in [start, end), as a slice of the cached merge"""
+        merged = self.get_merged_data()
+        return merged.iloc[self.date_range_slice('merged', start, end)]
+    
+    def _build_merged_data(self):
+        """Join detail lines with their order, customer and price list rows, in order date order"""
+        with span('merge'):
+            merged = sort_by_date(self._merge_tables(self.detail_df, self.inventory_df), 'Order_Date')
+        count_rows('merge', len(self.detail_df))
+        return merged
+    
+    def _merge_tables(self, detail_df, inventory_df):
+        """Merge detail rows with the given orders and the customer and price list tables"""
         # Merge all tables
-        merged = self.detail_df.merge(
-            self.inventory_df, on='IID'
+        merged = detail_df.merge(
+            inventory_df, on='IID'
         ).merge(
             self.customer_df, on='CID'
         ).merge(
@@ -46,6 +417,65 @@ class CSVDataManager:
         )
         return merged
     
+    def get_row_positions(self, attr, column, value):
+        """Positions of a table's rows where column equals value, cached per data version"""
+        def build():
+            return np.flatnonzero((getattr(self, attr)[column] == value).to_numpy())
+        return self._get_derived(f"positions:{attr}:{column}={value}", build)
+    
+    def get_group_index(self, attr, column):
+        """Postings from each value of a table's column to the positions of its rows, cached per data version
+        
+        The positions of all rows sharing a value are one range of a single
+        array, so looking a value up is a hash lookup and a slice, however
+        large the table. A value's rows keep their table order.
+        """
+        def build():
+            with span('group_index'):
+                values = getattr(self, attr)[column]
+                return Postings(values.to_numpy(), np.arange(len(values)))
+        return self._get_derived(f"groups:{attr}:{column}", build)
+    
+    def get_search_index(self, kind):
+        """SearchIndex over customer names, emails and phones ('customer') or product names ('product')
+        
+        Built once per data version; ingesting appended orders carries the
+        customer index forward, since it only changes with Customer.csv.
+        """
+        def build():
+            with span('search_index'):
+                if kind == 'customer':
+                    return SearchIndex(self.customer_df['Customer_Name'], customer_identifiers(self.customer_df))
+                # Products that have sold, best selling first so they win ties between
+                # spellings of one name, then any others on the price list
+                names = self.get_aggregates().ranking('product').index
+                if 'name' in self.pricelist_df:
+                    names = names.append(pd.Index(self.pricelist_df['name'].dropna().astype(str).unique()).difference(names))
+                return SearchIndex(names)
+        return self._get_derived(f"search:{kind}", build)
+    
+    def get_sketches(self):
+        """DailySketches of the merged rows, for answers with approx=true
+        
+        Built on first use, once per data version; rows appended to the
+        in-memory tables are sketched on their own and merged in.
+        """
+        def build():
+            with span('sketches'):
+                if self.out_of_core:
+                    return self.get_chunked().sketches()
+                if self.sql_store is not None:
+                    return sql_sketches(self)
+                merged = self._get_derived('merged', self._build_merged_data)
+                count_rows('sketches', len(merged))
+                return DailySketches.from_rows(merged['Order_Date'].to_numpy().view('int64'), merged['Customer_Name'],
+                                               merged['Total_Price'])
+        return self._get_derived('sketches', build)
+    
+    def report_memory_usage(self):
+        """Print the in-memory size of each table"""
+        print_table_sizes({attr: getattr(self, attr) for attr in SOURCE_FILES})
+    
     def validate_query_result(self, result, query_context):
         """Validate that AI response is grounded in actual data"""
         if isinstance(result, dict):
@@ -58,273 +488,1750 @@ class CSVDataManager:
     
     def get_data_summary(self):
         """Get summary statistics of the dataset"""
-        merged = self.get_merged_data()
+        metrics = self.get_metrics()
+        cube = metrics['cube']
         summary = {
-            'total_customers': len(self.customer_df),
-            'total_orders': len(self.inventory_df),
-            'total_order_items': len(self.detail_df),
-            'total_products': len(self.pricelist_df),
-            'total_revenue': merged['Total_Price'].sum(),
-            'avg_order_value': merged.groupby('IID')['Total_Price'].sum().mean(),
-            'top_customer_by_orders': merged['Customer_Name'].value_counts().head(1).to_dict(),
-            'top_product_by_sales': merged['Product_Name'].value_counts().head(1).to_dict()
+            'total_customers': metrics['total_customers'],
+            'total_orders': metrics['total_orders'],
+            'total_order_items': metrics['total_order_items'],
+            'total_products': metrics['total_products'],
+            'total_revenue': round(cube.total_revenue, 2),
+            'avg_order_value': round(cube.average_order_value, 2),
+            'top_customer_by_orders': cube.top('customer', 'count', 1).to_dict(),
+            'top_product_by_sales': cube.top('product', 'count', 1).to_dict()
         }
         return summary
 
+class CSVDataManager:
+    """Loads the CSV files and publishes each version of them as a DataSnapshot
+    
+    A reload or an ingest builds a complete new snapshot off to the side
+    and, once it validates, makes it the current one with a single
+    assignment; readers never wait on either. A request pins the current
+    snapshot when it starts (pin()) and reads only that one. Whatever the
+    manager doesn't define itself (the tables, get_metrics(), data_version
+    and so on) is read from the caller's snapshot.
+    """
+    def __init__(self, data_dir='../data', snapshot_dir=None, column_mapping=None, memory_budget_mb=0, spill_dir=None,
+                 storage='pandas', sqlite_path=None):
+        self.data_dir = data_dir
+        self.column_mapping = COLUMN_MAPPING if column_mapping is None else column_mapping
+        if snapshot_dir is None:
+            snapshot_dir = os.path.join(data_dir, '.snapshot')
+        # An empty snapshot_dir disables the binary snapshot cache
+        self.snapshot_store = SnapshotStore(snapshot_dir, SCHEMA_VERSION) if snapshot_dir else None
+        # 0 means no budget: the tables are always held in memory
+        self.memory_budget_mb = memory_budget_mb
+        self.spill_dir = spill_dir
+        if storage not in STORAGE_BACKENDS:
+            raise ValueError(f"Unknown storage backend {storage!r}, expected one of {', '.join(STORAGE_BACKENDS)}")
+        if storage == 'sqlite':
+            # The database holds derived columns and indexes, so a new column mapping or index needs a new one
+            layout = json.dumps([self.column_mapping, SQL_INDEXES], sort_keys=True)
+            mapping_key = hashlib.sha1(layout.encode()).hexdigest()[:8]
+            self.sql_store = SQLiteStore(sqlite_path or os.path.join(data_dir, '.sqlite', 'smrt.db'),
+                                         f"{SCHEMA_VERSION}:{mapping_key}")
+        else:
+            self.sql_store = None
+        # Empty until the first load succeeds
+        self._current = DataSnapshot(self, {}, None)
+        self._file_state = {}
+        # Serializes loads and ingests; readers never take it
+        self._lock = threading.RLock()
+        # Held while a background reload runs, so there is at most one
+        self._reloading = threading.Lock()
+        # The files' version when a load last failed; not retried until they change again
+        self._failed_version = None
+        self.load_all_data()
+    
+    def __getattr__(self, name):
+        # Only reached for names the manager doesn't define itself
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._view(), name)
+    
+    def _view(self):
+        """The snapshot this context reads: the one it pinned, or else the current one"""
+        pinned = PINNED_SNAPSHOT.get()
+        if pinned is not None and pinned[0] is self:
+            return pinned[1]
+        return self._current
+    
+    def pin(self):
+        """Read the current snapshot for the rest of this context (a request); returns a token for unpin()"""
+        self.refresh()
+        return PINNED_SNAPSHOT.set((self, self._current))
+    
+    @staticmethod
+    def unpin(token):
+        PINNED_SNAPSHOT.reset(token)
+    
+    def snapshot(self):
+        """The snapshot this context reads, which later reloads or appends don't affect"""
+        self.refresh()
+        return self._view()
+    
+    def compute_data_version(self):
+        """Fingerprint the source files from their modification times and sizes"""
+        stats = {}
+        for attr, filename in SOURCE_FILES.items():
+            try:
+                stat = os.stat(os.path.join(self.data_dir, filename))
+                stats[attr] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+            except OSError:
+                stats[attr] = None
+        return self._version_of(stats)
+    
+    @staticmethod
+    def _version_of(stats):
+        """Data version for per-table file stats (dicts with mtime_ns and size, None if missing)"""
+        parts = []
+        for attr, filename in SOURCE_FILES.items():
+            stat = stats.get(attr)
+            if stat is None:
+                parts.append(f"{filename}:missing")
+            else:
+                parts.append(f"{filename}:{stat['mtime_ns']}:{stat['size']}")
+        return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:16]
+    
+    def load_all_data(self):
+        """Load all CSV files into a new snapshot and publish it once it validates
+        
+        A load that fails keeps the current snapshot, even if that is the
+        empty one from before the first load. Returns whether it published.
+        """
+        with self._lock, span('load'):
+            DATA_LOADS.inc(kind='full')
+            # Taken before reading, so a write racing a failed load still
+            # shows up as a version worth retrying
+            version = self.compute_data_version()
+            try:
+                tables, states, out_of_core, parsed = self._read_tables()
+                sql_bounds = None
+                if self.sql_store is not None:
+                    with span('sql_sync'):
+                        sql_bounds = self._sync_sql(tables, states)
+                snapshot = DataSnapshot(self, tables, self._version_of(states), out_of_core, sql_bounds)
+                self._validate(snapshot)
+                # Only tables that validated replace the binary snapshot of the last good load
+                if parsed is not None and self._save_snapshot(parsed, states):
+                    # Reopen what was just written so the column data is
+                    # file-backed and shared by every process that maps it
+                    loaded = self._load_snapshot()
+                    if loaded is not None:
+                        tables, states = loaded
+                        snapshot = DataSnapshot(self, self._prepare_tables(tables), self._version_of(states))
+                        self._validate(snapshot)
+            except Exception as e:
+                print(f"Error loading CSV files: {e}")
+                self._failed_version = version
+                return False
+            self._publish(snapshot, states)
+            return True
+    
+    def _read_tables(self):
+        """Read every table and the state of its file; returns (tables, states, out_of_core, parsed)
+        
+        parsed holds the tables as read from the CSVs, for the binary
+        snapshot once they validate, or None when nothing was parsed.
+        """
+        tables = {}
+        states = {}
+        parsed = None
+        out_of_core = self.sql_store is None and self._exceeds_memory_budget()
+        if out_of_core or self.sql_store is not None:
+            # The large tables are streamed by get_chunked() or kept in SQLite instead of loaded
+            for attr in SOURCE_FILES:
+                if attr in CHUNKED_TABLES:
+                    stat = os.stat(os.path.join(self.data_dir, SOURCE_FILES[attr]))
+                    tables[attr], states[attr] = None, {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+                else:
+                    tables[attr], states[attr] = self._read_source(attr)
+            if out_of_core:
+                print(f"Data exceeds the {self.memory_budget_mb:g} MB memory budget, using chunked execution")
+        else:
+            loaded = self._load_snapshot()
+            if loaded is None:
+                for attr in SOURCE_FILES:
+                    frame, states[attr] = self._read_source(attr)
+                    if attr in DATE_SORTED_TABLES:
+                        # Sorted before the snapshot is written so loading it needs no reordering copy
+                        frame = sort_by_date(frame, DATE_SORTED_TABLES[attr])
+                    tables[attr] = frame
+                print("All CSV files loaded successfully")
+                print_table_sizes(tables)
+                if self.snapshot_store is not None:
+                    parsed = dict(tables)
+            else:
+                tables, states = loaded
+        return self._prepare_tables(tables), states, out_of_core, parsed
+    
+    def _prepare_tables(self, tables):
+        """Tables as read, with their derived columns added and the dated ones in date order"""
+        tables = dict(tables)
+        for attr in SOURCE_FILES:
+            if tables[attr] is not None:
+                tables[attr] = self._derive(attr, tables[attr])
+        for attr, column in DATE_SORTED_TABLES.items():
+            if tables[attr] is not None:
+                tables[attr] = sort_by_date(tables[attr], column)
+        return tables
+    
+    def _validate(self, snapshot):
+        """Raise unless a new snapshot can serve requests; builds the rollups and indexes it will need"""
+        for attr, filename in SOURCE_FILES.items():
+            frame = getattr(snapshot, attr)
+            if frame is None:
+                if snapshot.in_memory or attr not in CHUNKED_TABLES:
+                    raise ValueError(f"{filename} was not loaded")
+                continue
+            missing = [column for column in JOIN_COLUMNS[attr] + list(self.column_mapping.get(attr, {}))
+                       if column not in frame.columns]
+            if missing:
+                raise ValueError(f"{filename} has no {', '.join(dict.fromkeys(missing))} column")
+        # Also spares the first request after a (re)load the cost of building them
+        snapshot.get_aggregates()
+        for kind in ENTITY_INTENTS:
+            snapshot.get_search_index(kind)
+        for attr, columns in GROUP_INDEXES.items():
+            frame = getattr(snapshot, attr)
+            for column in columns:
+                if frame is not None and column in frame.columns:
+                    snapshot.get_group_index(attr, column)
+    
+    def _publish(self, snapshot, states):
+        """Make a validated snapshot the current one"""
+        self._file_state = states
+        # The one reference readers follow; requests that pinned the previous snapshot keep it
+        self._current = snapshot
+        self._failed_version = None
+    
+    def _exceeds_memory_budget(self):
+        """Whether the tables and their merge would likely take more memory than the budget allows"""
+        if not self.memory_budget_mb:
+            return False
+        csv_bytes = 0
+        for filename in SOURCE_FILES.values():
+            try:
+                csv_bytes += os.path.getsize(os.path.join(self.data_dir, filename))
+            except OSError:
+                pass
+        return csv_bytes * IN_MEMORY_EXPANSION > self.memory_budget_mb * 2**20
+    
+    def _load_snapshot(self):
+        """The tables and file states from the binary snapshot, or None when it doesn't match the CSVs"""
+        if self.snapshot_store is None:
+            return None
+        loaded = self.snapshot_store.load(self.data_dir, SOURCE_FILES, APPEND_ONLY_TABLES)
+        if loaded is None:
+            return None
+        frames, sources = loaded
+        tables = {}
+        states = {}
+        for attr, filename in SOURCE_FILES.items():
+            path = os.path.join(self.data_dir, filename)
+            recorded = sources[filename]
+            stat = os.stat(path)
+            if stat.st_size == recorded['size']:
+                state = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+            else:
+                # Keep the snapshot's stats so refresh() ingests the rows
+                # appended since it was written
+                state = {'mtime_ns': recorded['mtime_ns'], 'size': recorded['size']}
+            state.update(offset=recorded['size'], tail=self._read_tail(path, recorded['size']),
+                         columns=list(frames[attr].columns))
+            tables[attr] = frames[attr]
+            states[attr] = state
+        print("All tables loaded from snapshot")
+        return tables, states
+    
+    def _save_snapshot(self, tables, states):
+        """Write freshly parsed tables to the binary snapshot; returns whether it was written"""
+        if self.snapshot_store is None:
+            return False
+        try:
+            sizes = {attr: state['offset'] for attr, state in states.items()}
+            self.snapshot_store.save(self.data_dir, SOURCE_FILES, tables, sizes)
+            return True
+        except Exception as e:
+            # A read-only data directory just means every start parses the CSVs
+            print(f"Could not write data snapshot: {e}")
+            return False
+    
+    def _sync_sql(self, tables, states):
+        """Bring the SQLite database up to date with the CSVs, rebuilding it only when it must
+        
+        Rows appended to Inventory or Detail since the database was written
+        are left for refresh() to insert and an edited Customer or Pricelist
+        is rewritten on its own; any other change rebuilds the whole file.
+        Updates states to what the database holds and returns its row bounds.
+        """
+        recorded = self.sql_store.sources()
+        if not all(self._holds_prefix(attr, recorded.get(attr)) for attr in CHUNKED_TABLES):
+            print(f"Loading the CSV files into {self.sql_store.path}")
+            self.sql_store.build(self._sql_tables(tables, states), SQL_INDEXES)
+            recorded = self.sql_store.sources()
+        for attr in SOURCE_FILES:
+            state = recorded.get(attr)
+            if attr in CHUNKED_TABLES:
+                # The database's record, so refresh() inserts whatever was appended after it
+                states[attr] = state
+            elif state is None or (state['mtime_ns'], state['size']) != (states[attr]['mtime_ns'],
+                                                                          states[attr]['size']):
+                self.sql_store.replace(attr, tables[attr], states[attr], SQL_INDEXES.get(attr, ()))
+        print(f"Tables held in SQLite at {self.sql_store.path}")
+        return self._sql_bounds(states)
+    
+    def _holds_prefix(self, attr, state):
+        """Whether a CSV still starts with the bytes a recorded state describes"""
+        if state is None:
+            return False
+        path = os.path.join(self.data_dir, SOURCE_FILES[attr])
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        return size >= state['offset'] and self._read_tail(path, state['offset']) == state['tail']
+    
+    def _sql_tables(self, tables, states):
+        """(table, frames, state) for SQLiteStore.build: the small tables as loaded, the large ones in chunks"""
+        for attr in SOURCE_FILES:
+            if attr not in CHUNKED_TABLES:
+                yield attr, [tables[attr]], states[attr]
+                continue
+            path = os.path.join(self.data_dir, SOURCE_FILES[attr])
+            stat = os.stat(path)
+            state = {
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'offset': stat.st_size,
+                'tail': self._read_tail(path, stat.st_size),
+                'columns': list(read_typed_csv(attr, path, nrows=0).columns)
+            }
+            # Stop at the size just taken; rows appended meanwhile are inserted by refresh()
+            source = io.BufferedReader(FilePrefix(path, stat.st_size))
+            chunks = (self._derive(attr, chunk) for chunk in read_typed_csv_chunks(attr, source, SQL_LOAD_CHUNK_ROWS))
+            yield attr, chunks, state
+    
+    @staticmethod
+    def _sql_bounds(states):
+        return {'inventory_rows': states['inventory_df']['rows'], 'detail_rows': states['detail_df']['rows']}
+    
+    def _read_source(self, attr):
+        """Read one CSV and record how far into the file it was parsed"""
+        path = os.path.join(self.data_dir, SOURCE_FILES[attr])
+        while True:
+            size = os.stat(path).st_size
+            frame = read_typed_csv(attr, path)
+            stat = os.stat(path)
+            # Retry if rows were appended mid-read, otherwise they would be
+            # ingested a second time as a delta
+            if stat.st_size == size:
+                break
+        state = {
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'offset': stat.st_size,
+            'tail': self._read_tail(path, stat.st_size),
+            'columns': list(frame.columns)
+        }
+        return frame, state
+    
+    @staticmethod
+    def _read_tail(path, offset):
+        """Bytes just before offset, used to check a file was appended to rather than rewritten"""
+        with open(path, 'rb') as f:
+            f.seek(max(0, offset - TAIL_CHECK_BYTES))
+            return f.read(min(offset, TAIL_CHECK_BYTES))
+    
+    def refresh(self, wait=False):
+        """Pick up changes to the CSV files; returns the data version this context reads
+        
+        Rows appended to the append-only files are ingested as deltas, any
+        other change reloads everything. Either way the work runs on a
+        background thread, or in this one with wait=True, and readers keep
+        using the snapshot they have until the new one is published.
+        """
+        version = self.compute_data_version()
+        if version != self._current.data_version and version != self._failed_version:
+            if wait:
+                self._update()
+            elif self._reloading.acquire(blocking=False):
+                threading.Thread(target=self._update_in_background, name='csv-reload', daemon=True).start()
+        return self._view().data_version
+    
+    def _update(self):
+        """Ingest or reload whatever changed since the current snapshot"""
+        with self._lock:
+            version = self.compute_data_version()
+            if version != self._current.data_version and version != self._failed_version:
+                if not self._ingest_appends():
+                    self.load_all_data()
+    
+    def _update_in_background(self):
+        try:
+            self._update()
+        except Exception as e:
+            print(f"Error ingesting CSV updates: {e}")
+        finally:
+            self._reloading.release()
+    
+    def _ingest_appends(self):
+        """Parse rows appended to Inventory/Detail since the last read and publish them as deltas
+        
+        Returns False when the change isn't a pure append and needs a full reload.
+        Out of core, or once the tables outgrow the memory budget, every
+        change is picked up by a full reload, which runs a new chunked pass.
+        With the SQLite backend the rows are inserted into the database.
+        """
+        current = self._current
+        if current.out_of_core or (self.sql_store is None and self._exceeds_memory_budget()):
+            return False
+        deltas = {}
+        states = dict(self._file_state)
+        for attr, filename in SOURCE_FILES.items():
+            path = os.path.join(self.data_dir, filename)
+            state = states.get(attr)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return False
+            if state is None:
+                return False
+            if (stat.st_mtime_ns, stat.st_size) == (state['mtime_ns'], state['size']):
+                continue
+            if attr not in APPEND_ONLY_TABLES or stat.st_size < state['offset']:
+                return False
+            if self._read_tail(path, state['offset']) != state['tail']:
+                return False
+            with open(path, 'rb') as f:
+                f.seek(state['offset'])
+                appended = f.read(stat.st_size - state['offset'])
+            # Leave a partially written last line for the next poll
+            complete = appended.rfind(b'\n') + 1
+            offset = state['offset'] + complete
+            states[attr] = dict(state, mtime_ns=stat.st_mtime_ns, size=stat.st_size, offset=offset,
+                                tail=self._read_tail(path, offset))
+            if appended[:complete].strip():
+                deltas[attr] = read_typed_csv(attr, BytesIO(appended[:complete]), header=None,
+                                              names=state['columns'])
+        deltas = {attr: self._derive(attr, frame) for attr, frame in deltas.items()}
+        with span('ingest'):
+            if self.sql_store is None:
+                snapshot = self._apply_deltas(current, deltas, self._version_of(states))
+            else:
+                snapshot = self._insert_sql(current, deltas, states)
+                if snapshot is None:
+                    return False
+            if 'search:customer' in current._derived:
+                snapshot._derived['search:customer'] = current._derived['search:customer']
+            try:
+                self._validate(snapshot)
+            except Exception as e:
+                print(f"Ingested rows left the data unusable, reloading: {e}")
+                return False
+        self._publish(snapshot, states)
+        DATA_LOADS.inc(kind='incremental')
+        for attr, frame in deltas.items():
+            count_rows('ingest', len(frame))
+        if deltas:
+            print(f"Ingested {', '.join(f'{len(frame)} {SOURCE_FILES[attr]}' for attr, frame in deltas.items())} rows")
+        return True
+    
+    def _derive(self, attr, frame):
+        """Add the canonical analysis columns from the column mapping to one table"""
+        return derive_columns(frame, self.column_mapping.get(attr, {}))
+    
+    def _apply_deltas(self, current, deltas, version):
+        """A snapshot with new rows appended to the tables and folded into the current merge and rollups"""
+        new_inventory = deltas.get('inventory_df')
+        new_detail = deltas.get('detail_df')
+        tables = {attr: getattr(current, attr) for attr in SOURCE_FILES}
+        if new_inventory is not None:
+            tables['inventory_df'] = sort_by_date(append_rows(current.inventory_df, new_inventory), 'INDATE')
+        if new_detail is not None:
+            tables['detail_df'] = append_rows(current.detail_df, new_detail)
+        snapshot = DataSnapshot(self, tables, version)
+        
+        previous = current._derived.get('merged')
+        if previous is not None:
+            parts = []
+            if new_detail is not None:
+                parts.append(snapshot._merge_tables(new_detail, snapshot.inventory_df))
+            if new_inventory is not None:
+                # Lines written before their order row only join now
+                waiting = current.detail_df[current.detail_df['IID'].isin(new_inventory['IID'])]
+                parts.append(snapshot._merge_tables(waiting, new_inventory))
+            # Empty parts would leave the concatenated dtypes up to pandas' version
+            parts = [part for part in parts if len(part)]
+            delta = pd.concat(parts, ignore_index=True) if parts else previous.iloc[:0]
+            # New rows are usually the latest orders, so this is an append, not a re-sort
+            merged = sort_by_date(append_rows(previous, delta), 'Order_Date')
+            snapshot._derived['merged'] = merged
+            cube = current._derived.get('aggregates')
+            if cube is not None:
+                snapshot._derived['aggregates'] = cube.updated(previous, delta, merged)
+            sketches = current._derived.get('sketches')
+            if sketches is not None:
+                delta_sketches = DailySketches.from_rows(delta['Order_Date'].to_numpy().view('int64'),
+                                                         delta['Customer_Name'], delta['Total_Price'])
+                snapshot._derived['sketches'] = DailySketches.combine([sketches, delta_sketches])
+        # Anything not carried forward is built on first use of the new snapshot
+        return snapshot
+    
+    def _insert_sql(self, current, deltas, states):
+        """Insert appended rows into SQLite and return a snapshot of their version; None when the database needs a rebuild"""
+        for attr in CHUNKED_TABLES:
+            if states[attr] is self._file_state[attr]:
+                continue
+            # Another worker process may have inserted these rows already; append() then just reports them
+            recorded = self.sql_store.append(attr, deltas.get(attr), self._file_state[attr]['offset'], states[attr])
+            if recorded is None:
+                return None
+            states[attr] = recorded
+        tables = {attr: getattr(current, attr) for attr in SOURCE_FILES}
+        return DataSnapshot(self, tables, self._version_of(states), sql_bounds=self._sql_bounds(states))
+    
+    def start_ingestion(self, interval):
+        """Poll the CSV files every interval seconds so appended rows are picked up between requests"""
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh(wait=True)
+                except Exception as e:
+                    print(f"Error ingesting CSV updates: {e}")
+        
+        thread = threading.Thread(target=poll, name='csv-ingestion', daemon=True)
+        thread.start()
+        return thread
+
+# Named metrics shared by the reports, insights and analysis types. Each one
+# declares the metrics it is computed from and is evaluated at most once per
+# data version through the data manager's MetricMemo.
+METRICS = {}
+
+# Metrics computed in SQL in place of their METRICS entries, for the SQLite backend
+SQL_METRICS = {}
+
+def metric(name, *dependencies, registry=METRICS):
+    """Register a metric function; it receives the data manager and its dependencies' values"""
+    def register(func):
+        registry[name] = (func, dependencies)
+        return func
+    return register
+
+class MetricMemo:
+    """Lazily evaluated metric values for one data version
+    
+    A metric and everything it depends on is computed on first access and
+    kept for the life of the memo. Two requests racing on the same metric
+    may both compute it; the results are identical so either one is kept.
+    Values computed elsewhere (out of core, by ChunkedAggregates) can be
+    passed in and take the place of their metric functions, and so can
+    other metric functions (SQL_METRICS).
+    """
+    def __init__(self, data_manager, values=None, functions=None):
+        self.data_manager = data_manager
+        self._values = dict(values or {})
+        self._functions = functions or {}
+    
+    def __getitem__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        func, dependencies = self._functions.get(name) or METRICS[name]
+        inputs = [self[dependency] for dependency in dependencies]
+        with span(f"metric:{name}"):
+            value = func(self.data_manager, *inputs)
+        self._values[name] = value
+        return value
+
+@metric('cube')
+def _metric_cube(data_manager):
+    return data_manager.get_aggregates()
+
+@metric('merged')
+def _metric_merged(data_manager):
+    return data_manager.get_merged_data()
+
+@metric('total_customers')
+def _metric_total_customers(data_manager):
+    return len(data_manager.customer_df)
+
+@metric('total_orders')
+def _metric_total_orders(data_manager):
+    return len(data_manager.inventory_df)
+
+@metric('total_order_items')
+def _metric_total_order_items(data_manager):
+    return len(data_manager.detail_df)
+
+@metric('total_products')
+def _metric_total_products(data_manager):
+    return len(data_manager.pricelist_df)
+
+@metric('customer_type_counts')
+def _metric_customer_type_counts(data_manager):
+    return data_manager.customer_df['Customer_Type'].value_counts()
+
+@metric('premium_customers', 'customer_type_counts')
+def _metric_premium_customers(data_manager, type_counts):
+    return int(type_counts.get('Premium', 0))
+
+@metric('standard_customers', 'customer_type_counts')
+def _metric_standard_customers(data_manager, type_counts):
+    return int(type_counts.get('Standard', 0))
+
+@metric('order_status_counts')
+def _metric_order_status_counts(data_manager):
+    return data_manager.inventory_df['Status'].value_counts()
+
+@metric('paid_orders_mask')
+def _metric_paid_orders_mask(data_manager):
+    return (data_manager.inventory_df['PIF'] == 'Y').to_numpy()
+
+@metric('unpaid_orders_mask')
+def _metric_unpaid_orders_mask(data_manager):
+    return (data_manager.inventory_df['PIF'] == 'N').to_numpy()
+
+@metric('completed_orders', 'paid_orders_mask')
+def _metric_completed_orders(data_manager, paid):
+    return int(paid.sum())
+
+@metric('completed_revenue', 'paid_orders_mask')
+def _metric_completed_revenue(data_manager, paid):
+    return data_manager.inventory_df['SUBTOTAL'][paid].sum()
+
+@metric('pending_orders', 'unpaid_orders_mask')
+def _metric_pending_orders(data_manager, unpaid):
+    return int(unpaid.sum())
+
+@metric('pending_revenue', 'unpaid_orders_mask')
+def _metric_pending_revenue(data_manager, unpaid):
+    return data_manager.inventory_df['SUBTOTAL'][unpaid].sum()
+
+@metric('order_completion_rate', 'paid_orders_mask')
+def _metric_order_completion_rate(data_manager, paid):
+    return paid.mean() * 100
+
+@metric('order_date_range')
+def _metric_order_date_range(data_manager):
+    # inventory_df is sorted by INDATE with undated orders first
+    dated = data_manager.date_range_slice('inventory_df')
+    if dated.start == dated.stop:
+        return pd.NaT, pd.NaT
+    order_dates = data_manager.get_date_index('inventory_df')
+    return pd.Timestamp(order_dates[dated.start]), pd.Timestamp(order_dates[dated.stop - 1])
+
+@metric('recent_orders')
+def _metric_recent_orders(data_manager):
+    recent = data_manager.date_range_slice('inventory_df', start=RECENT_ORDERS_SINCE)
+    return recent.stop - recent.start
+
+@metric('monthly_revenue', 'merged')
+def _metric_monthly_revenue(data_manager, merged):
+    return merged.groupby(merged['Order_Date'].dt.to_period('M'))['Total_Price'].sum()
+
+@metric('daily_revenue', 'merged')
+def _metric_daily_revenue(data_manager, merged):
+    return merged.groupby(merged['Order_Date'].dt.normalize())['Total_Price'].sum()
+
+@metric('revenue_growth_rate', 'monthly_revenue')
+def _metric_revenue_growth_rate(data_manager, monthly_revenue):
+    if len(monthly_revenue) > 1:
+        return ((monthly_revenue.iloc[-1] - monthly_revenue.iloc[0]) / monthly_revenue.iloc[0]) * 100
+    return None
+
+@metric('customer_spending', 'merged')
+def _metric_customer_spending(data_manager, merged):
+    customer_analysis = merged.groupby('Customer_Name').agg({
+        'Total_Price': 'sum',
+        'IID': 'count',
+        'Customer_Type': 'first'
+    }).round(2)
+    customer_analysis.columns = ['Total_Spent', 'Total_Orders', 'Customer_Type']
+    return customer_analysis.sort_values('Total_Spent', ascending=False)
+
+@metric('customer_value_table', 'cube')
+def _metric_customer_value_table(data_manager, cube):
+    customer_metrics = cube.table('customer').loc[cube.ranking('customer').index].round(2)
+    customer_metrics.columns = ['Total_Spent', 'Total_Items', 'Avg_Item_Price', 'Unique_Orders']
+    return customer_metrics
+
+@metric('customer_spending_cuts', 'customer_value_table')
+def _metric_customer_spending_cuts(data_manager, customer_metrics):
+    # 40th and 80th percentile of spending: the low/medium and medium/high value boundaries
+    cuts = customer_metrics['Total_Spent'].quantile([0.4, 0.8])
+    return cuts.iloc[0], cuts.iloc[1]
+
+@metric('total_orders', registry=SQL_METRICS)
+def _sql_total_orders(data_manager):
+    return data_manager.sql_bounds['inventory_rows']
+
+@metric('total_order_items', registry=SQL_METRICS)
+def _sql_total_order_items(data_manager):
+    return data_manager.sql_bounds['detail_rows']
+
+@metric('order_status_counts', registry=SQL_METRICS)
+def _sql_order_status_counts(data_manager):
+    counts = sql_query(data_manager, """
+        SELECT Status, COUNT(*) AS count FROM inventory_df
+        WHERE rowid <= :inventory_rows AND Status IS NOT NULL
+        GROUP BY Status""")
+    return counts.set_index('Status')['count'].sort_values(ascending=False, kind='stable')
+
+@metric('order_payments', registry=SQL_METRICS)
+def _sql_order_payments(data_manager):
+    """Order count and SUBTOTAL sum per PIF value"""
+    payments = sql_query(data_manager, """
+        SELECT PIF, COUNT(*) AS orders, TOTAL(SUBTOTAL) AS revenue FROM inventory_df
+        WHERE rowid <= :inventory_rows
+        GROUP BY PIF""")
+    return payments.set_index('PIF')
+
+@metric('completed_orders', 'order_payments', registry=SQL_METRICS)
+def _sql_completed_orders(data_manager, payments):
+    return int(payments['orders'].get('Y', 0))
+
+@metric('completed_revenue', 'order_payments', registry=SQL_METRICS)
+def _sql_completed_revenue(data_manager, payments):
+    return float(payments['revenue'].get('Y', 0.0))
+
+@metric('pending_orders', 'order_payments', registry=SQL_METRICS)
+def _sql_pending_orders(data_manager, payments):
+    return int(payments['orders'].get('N', 0))
+
+@metric('pending_revenue', 'order_payments', registry=SQL_METRICS)
+def _sql_pending_revenue(data_manager, payments):
+    return float(payments['revenue'].get('N', 0.0))
+
+@metric('order_completion_rate', 'completed_orders', 'total_orders', registry=SQL_METRICS)
+def _sql_order_completion_rate(data_manager, completed, total):
+    return completed / total * 100 if total else np.nan
+
+@metric('order_date_range', registry=SQL_METRICS)
+def _sql_order_date_range(data_manager):
+    first, last = sql_row(data_manager, "SELECT MIN(INDATE), MAX(INDATE) FROM inventory_df WHERE rowid <= :inventory_rows")
+    return pd.Timestamp(first) if first is not None else pd.NaT, pd.Timestamp(last) if last is not None else pd.NaT
+
+@metric('recent_orders', registry=SQL_METRICS)
+def _sql_recent_orders(data_manager):
+    (recent,) = sql_row(data_manager, "SELECT COUNT(*) FROM inventory_df WHERE INDATE >= :since AND rowid <= :inventory_rows",
+                        since=pd.Timestamp(RECENT_ORDERS_SINCE).value)
+    return recent
+
+# Order_Date rounded down to its day, in nanoseconds
+SQL_ORDER_DAY = f"(i.Order_Date - ((i.Order_Date % {NS_PER_DAY}) + {NS_PER_DAY}) % {NS_PER_DAY})"
+
+@metric('daily_revenue', registry=SQL_METRICS)
+def _sql_daily_revenue(data_manager):
+    daily = sql_query(data_manager, f"""
+        SELECT {SQL_ORDER_DAY} AS day, TOTAL(d.Total_Price) AS revenue
+        FROM {MERGED_SQL} AND i.Order_Date IS NOT NULL
+        GROUP BY day ORDER BY day""")
+    days = pd.DatetimeIndex(pd.to_datetime(daily['day'].to_numpy(dtype='int64')), name='Order_Date')
+    return pd.Series(daily['revenue'].to_numpy(dtype='float64'), index=days, name='Total_Price')
+
+@metric('monthly_revenue', 'daily_revenue', registry=SQL_METRICS)
+def _sql_monthly_revenue(data_manager, daily):
+    return daily.groupby(daily.index.to_period('M')).sum()
+
+@metric('customer_totals', registry=SQL_METRICS)
+def _sql_customer_totals(data_manager):
+    """Per customer in order of their first merged line: name, type, spending, line and order counts, last order"""
+    # Merge order is by order date (undated first), then by Detail row; the
+    # first line is looked up per customer rather than numbering every line
+    return sql_query(data_manager, f"""
+        WITH customers AS (
+            SELECT i.CID AS CID, MIN(COALESCE(i.Order_Date, :nat)) AS first_day, TOTAL(d.Total_Price) AS monetary,
+                   COUNT(*) AS lines, COUNT(DISTINCT d.IID) AS frequency, MAX(i.Order_Date) AS last_order
+            FROM {MERGED_SQL}
+            GROUP BY +i.CID
+        )
+        SELECT customers.CID AS CID, c.Customer_Name AS name, c.Customer_Type AS type,
+               monetary, lines, frequency, last_order,
+               (SELECT MIN(d.rowid) FROM {MERGED_SQL}
+                AND i.CID = customers.CID AND COALESCE(i.Order_Date, :nat) = customers.first_day) AS first_line
+        FROM customers
+        JOIN (SELECT CID, Customer_Name, Customer_Type, MIN(rowid) FROM customer_df GROUP BY CID) AS c
+            ON c.CID = customers.CID
+        ORDER BY first_day, first_line""", nat=NAT_INT64)
+
+@metric('customer_spending', 'customer_totals', registry=SQL_METRICS)
+def _sql_customer_spending(data_manager, customers):
+    # A name's type is that of its customer with the earliest line, like groupby().first() on the merge
+    named = customers[customers['name'].notna()]
+    types = named[named['type'].notna()].drop_duplicates('name').set_index('name')['type']
+    spending = named.groupby('name').agg(Total_Spent=('monetary', 'sum'), Total_Orders=('lines', 'sum'))
+    spending['Customer_Type'] = types.reindex(spending.index)
+    spending.index.name = 'Customer_Name'
+    return spending.round(2).sort_values('Total_Spent', ascending=False)
+
+@metric('rfm_base', 'customer_totals', registry=SQL_METRICS)
+def _sql_rfm_base(data_manager, customers):
+    count_rows('rfm', int(customers['lines'].sum()))
+    return {
+        'cid': customers['CID'].to_numpy(),
+        'name': customers['name'].to_numpy(dtype=object),
+        'last_order': customers['last_order'].fillna(NAT_INT64).to_numpy(dtype='int64'),
+        'frequency': customers['frequency'].to_numpy(dtype='int64'),
+        'monetary': customers['monetary'].to_numpy(dtype='float64')
+    }
+
 # Initialize data manager
-data_manager = CSVDataManager()
+data_manager = CSVDataManager(data_dir=os.environ.get('DATA_DIR', '../data'),
+                              snapshot_dir=os.environ.get('SNAPSHOT_DIR'),
+                              column_mapping=load_column_mapping(os.environ.get('COLUMN_MAPPING_FILE')),
+                              memory_budget_mb=float(os.environ.get('MEMORY_BUDGET_MB', '0')),
+                              spill_dir=os.environ.get('SPILL_DIR'),
+                              storage=os.environ.get('STORAGE_BACKEND', 'pandas'),
+                              sqlite_path=os.environ.get('SQLITE_PATH'))
+
+# Optionally poll for rows the POS appends so they show up without waiting for a request
+INGEST_POLL_SECONDS = float(os.environ.get('INGEST_POLL_SECONDS', '0'))
+
+def start_background_tasks():
+    """Start this process's background threads; a pre-fork server calls it in each worker"""
+    if INGEST_POLL_SECONDS > 0:
+        data_manager.start_ingestion(INGEST_POLL_SECONDS)
+
+if os.environ.get('START_BACKGROUND_TASKS', '1') == '1':
+    start_background_tasks()
+
+class ResultCache:
+    """Thread-safe LRU cache for computed results
+    
+    Keys include the data version, so entries for old data simply age out.
+    """
+    def __init__(self, max_entries=512, name='result'):
+        self.max_entries = max_entries
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                CACHE_LOOKUPS.inc(cache=self.name, result='hit')
+                return True, self._entries[key]
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache=self.name, result='miss')
+            return False, None
+    
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# Serialized bodies of the read-only endpoints, per request params and data version
+response_cache = ResultCache(int(os.environ.get('RESPONSE_CACHE_SIZE', '256')), 'response')
+
+def request_params():
+    """Request parameters from the JSON body and/or the query string"""
+    params = request.args.to_dict()
+    if request.method == 'POST':
+        params.update(request.get_json(silent=True) or {})
+    return params
+
+def versioned_response(view):
+    """Serve a read-only endpoint with data-versioned ETags and a server-side body cache
+    
+    The ETag is derived from the data version, the path and the request
+    params, so a matching If-None-Match is answered with 304 before any
+    computation. These endpoints are safe reads even when called with POST,
+    so POST is revalidated the same way.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        version = data_manager.refresh()
+        params = json.dumps(request_params(), sort_keys=True, default=str)
+        etag = hashlib.sha1(f"{version}|{request.path}|{params}".encode()).hexdigest()
+        if request.if_none_match and (request.if_none_match.star_tag or request.if_none_match.contains_weak(etag)):
+            response = app.response_class(status=304)
+        else:
+            key = (request.path, params, version)
+            found, cached = response_cache.get(key)
+            if found:
+                body, mimetype = cached
+                response = app.response_class(body, mimetype=mimetype)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                # A streamed body is sent as it is generated, never held whole
+                if not response.is_streamed:
+                    response_cache.put(key, (response.get_data(), response.mimetype))
+        response.set_etag(etag)
+        # Clients may keep the body but must revalidate it since data can change at any time
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
+
+# Most recent slow requests, newest last
+slow_queries = deque(maxlen=int(os.environ.get('SLOW_QUERY_LOG_SIZE', '100')))
+
+@app.before_request
+def begin_request_trace():
+    request.environ['smrt.trace'] = (start_trace(), time.perf_counter())
+
+@app.before_request
+def pin_data_snapshot():
+    """Read one data snapshot for the whole request, whatever is reloaded meanwhile"""
+    request.environ['smrt.snapshot'] = data_manager.pin()
+
+@app.teardown_request
+def unpin_data_snapshot(error):
+    token = request.environ.pop('smrt.snapshot', None)
+    if token is not None:
+        data_manager.unpin(token)
+
+@app.after_request
+def finish_request_trace(response):
+    """Record the request's latency and log it with its stage breakdown when slow"""
+    token, start = request.environ.pop('smrt.trace', (None, None))
+    if token is None:
+        return response
+    elapsed = time.perf_counter() - start
+    trace = end_trace(token)
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        fields = trace['fields']
+        if 'query' not in fields and endpoint != '/api/query':
+            params = request_params()
+            described = ' '.join(f"{key}={params[key]}" for key in sorted(params))
+            fields = dict(fields, query=normalize_query(described)[:500])
+        entry = {
+            'timestamp': datetime.now().isoformat(),
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 2),
+            **fields,
+            'stages': [{'stage': stage, 'ms': round(seconds * 1000, 2)} for stage, seconds in trace['stages']]
+        }
+        slow_queries.append(entry)
+        print(f"Slow request: {json.dumps(entry)}")
+    return response
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
 
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Counters and latency histograms of this process in the Prometheus text format"""
+    return app.response_class(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/metrics/slow', methods=['GET'])
+def slow_query_log():
+    """The most recent requests slower than SLOW_QUERY_MS, with their stage breakdown"""
+    return jsonify({'threshold_ms': SLOW_QUERY_MS, 'requests': list(slow_queries)})
+
 @app.route('/api/query', methods=['POST'])
 def process_query():
     """Process natural language queries about the data"""
     try:
         data = request.get_json()
         query = data.get('query', '').lower()
+        annotate(query=normalize_query(query))
         
         if not query:
             return jsonify({'error': 'No query provided'}), 400
         
-        # Get merged data for comprehensive analysis
-        merged_data = data_manager.get_merged_data()
+        # Paging options for list-style answers and an explicit date range
+        options = {key: data[key] for key in ('limit', 'cursor', 'start', 'end', 'approx') if key in data}
+        if data.get('format') == 'ndjson':
+            intent, params = resolve_intent(query, data_manager, options)
+            if intent in LIST_INTENTS:
+                return stream_list_rows(data_manager, intent, options)
         
-        # Process different types of queries
-        result = process_data_query(query, merged_data, data_manager)
+        return jsonify(answer_query(data_manager, query, options))
         
-        # Validate the result
-        is_valid, validation_msg = data_manager.validate_query_result(result, query)
-        if not is_valid:
-            result['validation_warning'] = validation_msg
+    except QueryParameterError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def answer_query(data_manager, query, options):
+    """The /api/query response for one lowercased query"""
+    # Get merged data for comprehensive analysis; out of core or in SQLite there is none to hand over
+    merged_data = data_manager.get_merged_data() if data_manager.in_memory else None
+    
+    # Process different types of queries
+    result = process_data_query(query, merged_data, data_manager, options)
+    
+    # Validate the result
+    is_valid, validation_msg = data_manager.validate_query_result(result, query)
+    if not is_valid:
+        # Results may be shared through the query cache, so don't modify them in place
+        result = dict(result, validation_warning=validation_msg)
+    
+    return {
+        'query': query,
+        'result': result,
+        'timestamp': datetime.now().isoformat(),
+        'data_grounded': True
+    }
+
+# Largest number of items one /api/query/batch request may hold
+MAX_BATCH_ITEMS = 50
+
+# Threads evaluating batch items; pandas releases the GIL in most of the heavy kernels
+batch_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('BATCH_WORKERS', min(8, os.cpu_count() or 1))),
+                                    thread_name_prefix='query-batch')
+
+def run_batch_item(snapshot, item):
+    """Evaluate one batch item against a data snapshot; errors are reported in the item"""
+    if isinstance(item, str):
+        item = {'query': item}
+    try:
+        if not isinstance(item, dict) or ('query' in item) == ('analysis' in item):
+            raise QueryParameterError('Each item needs either a query or an analysis type')
+        if 'query' in item:
+            query = str(item['query']).lower()
+            if not query:
+                raise QueryParameterError('No query provided')
+            options = {key: item[key] for key in ('limit', 'cursor', 'start', 'end', 'approx') if key in item}
+            return {'status': 200, **answer_query(snapshot, query, options)}
+        analysis_type = item['analysis']
+        return {
+            'status': 200,
+            'analysis_type': analysis_type,
+            'analysis': run_analysis(snapshot, analysis_type, item)
+        }
+    except QueryParameterError as e:
+        return {'status': 400, 'error': str(e)}
+    except Exception as e:
+        return {'status': 500, 'error': str(e)}
+
+@app.route('/api/query/batch', methods=['POST'])
+def process_query_batch():
+    """Answer several queries and/or analysis types in one request
+    
+    Items are either a query string, {"query": ..., <query options>} or
+    {"analysis": <type>, <analysis params>}. All of them are evaluated in
+    parallel against the same data snapshot, so they agree with each other
+    even if the CSVs change meanwhile. Results come back in item order,
+    each with its own status and either the usual payload or an error.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        items = data.get('items')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'items must be a non-empty list'}), 400
+        if len(items) > MAX_BATCH_ITEMS:
+            return jsonify({'error': f'At most {MAX_BATCH_ITEMS} items per batch'}), 400
         
+        snapshot = data_manager.snapshot()
+        # Run each item in a copy of this request's context so its spans join the request's trace
+        contexts = [contextvars.copy_context() for _ in items]
+        results = list(batch_executor.map(lambda context, item: context.run(run_batch_item, snapshot, item),
+                                          contexts, items))
         return jsonify({
-            'query': query,
-            'result': result,
-            'timestamp': datetime.now().isoformat(),
-            'data_grounded': True
+            'results': results,
+            'data_version': snapshot.data_version,
+            'timestamp': datetime.now().isoformat()
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def process_data_query(query, merged_data, data_manager):
-    """Process different types of queries and return structured results with enhanced AI capabilities"""
-    
-    query_lower = query.lower()
-    
-    # Handle "big customers" type queries even without explicit "customer" word
-    if any(word in query_lower for word in ['big customers', 'large customers', 'major customers', 'key customers', 'important customers']):
-        customer_revenue = merged_data.groupby('Customer_Name')['Total_Price'].sum().sort_values(ascending=False).head(10)
-        return {'top_customers_by_revenue': customer_revenue.to_dict()}
-    
-    # Enhanced customer queries
-    if any(word in query_lower for word in ['customer', 'client', 'buyer']):
-        if any(word in query_lower for word in ['list', 'show', 'all', 'every']):
-            if 'premium' in query_lower:
-                premium_customers = data_manager.customer_df[data_manager.customer_df['Customer_Type'] == 'Premium']
-                return {'premium_customers': premium_customers.to_dict('records')}
-            elif 'standard' in query_lower:
-                standard_customers = data_manager.customer_df[data_manager.customer_df['Customer_Type'] == 'Standard']
-                return {'standard_customers': standard_customers.to_dict('records')}
-            else:
-                return {'customers': data_manager.customer_df.to_dict('records')}
-        elif any(word in query_lower for word in ['total', 'count', 'how many', 'number']):
-            return {'total_customers': len(data_manager.customer_df)}
-        elif any(word in query_lower for word in ['top', 'best', 'highest', 'big', 'large', 'major', 'key', 'important']):
-            if 'spending' in query_lower or 'revenue' in query_lower or 'big' in query_lower or 'large' in query_lower:
-                customer_revenue = merged_data.groupby('Customer_Name')['Total_Price'].sum().sort_values(ascending=False).head(10)
-                return {'top_customers_by_revenue': customer_revenue.to_dict()}
-            elif 'orders' in query_lower:
-                customer_orders = merged_data.groupby('Customer_Name')['IID'].nunique().sort_values(ascending=False).head(10)
-                return {'top_customers_by_orders': customer_orders.to_dict()}
-            else:
-                # Default to revenue-based ranking for "big customers" type queries
-                customer_revenue = merged_data.groupby('Customer_Name')['Total_Price'].sum().sort_values(ascending=False).head(10)
-                return {'top_customers_by_revenue': customer_revenue.to_dict()}
-        elif 'average' in query_lower and 'spending' in query_lower:
-            avg_spending = merged_data.groupby('Customer_Name')['Total_Price'].sum().mean()
-            return {'average_customer_spending': round(avg_spending, 2)}
-        elif 'new' in query_lower or 'recent' in query_lower:
-            recent_customers = data_manager.customer_df.sort_values('FIRSTDATE', ascending=False).head(10)
-            return {'recent_customers': recent_customers.to_dict('records')}
-    
-    # Enhanced order queries
-    elif any(word in query_lower for word in ['order', 'transaction', 'purchase']):
-        if any(word in query_lower for word in ['total', 'count', 'how many', 'number']):
-            return {'total_orders': len(data_manager.inventory_df)}
-        elif any(word in query_lower for word in ['revenue', 'sales', 'income', 'money']):
-            if 'total' in query_lower:
-                total_revenue = merged_data['Total_Price'].sum()
-                return {'total_revenue': round(total_revenue, 2)}
-            elif 'average' in query_lower:
-                avg_order_value = merged_data.groupby('IID')['Total_Price'].sum().mean()
-                return {'average_order_value': round(avg_order_value, 2)}
-        elif 'status' in query_lower or 'state' in query_lower:
-            order_status = data_manager.inventory_df['Status'].value_counts().to_dict()
-            return {'order_status_distribution': order_status}
-        elif 'pending' in query_lower or 'unpaid' in query_lower:
-            pending_orders = data_manager.inventory_df[data_manager.inventory_df['PIF'] == 'N']
-            return {'pending_orders': len(pending_orders), 'pending_revenue': pending_orders['SUBTOTAL'].sum()}
-        elif 'completed' in query_lower or 'paid' in query_lower:
-            completed_orders = data_manager.inventory_df[data_manager.inventory_df['PIF'] == 'Y']
-            return {'completed_orders': len(completed_orders), 'completed_revenue': completed_orders['SUBTOTAL'].sum()}
-    
-    # Enhanced product queries
-    elif any(word in query_lower for word in ['product', 'item', 'service', 'inventory']):
-        if any(word in query_lower for word in ['list', 'show', 'all', 'every']):
-            return {'products': data_manager.pricelist_df.to_dict('records')}
-        elif any(word in query_lower for word in ['top', 'best', 'popular', 'selling', 'highest']):
-            if 'revenue' in query_lower or 'sales' in query_lower:
-                product_revenue = merged_data.groupby('Product_Name')['Total_Price'].sum().sort_values(ascending=False).head(10)
-                return {'top_products_by_revenue': product_revenue.to_dict()}
-            else:
-                top_products = merged_data['Product_Name'].value_counts().head(10).to_dict()
-                return {'top_products_by_quantity': top_products}
-        elif 'category' in query_lower:
-            if 'revenue' in query_lower or 'sales' in query_lower:
-                category_revenue = merged_data.groupby('Category')['Total_Price'].sum().sort_values(ascending=False).to_dict()
-                return {'category_revenue': category_revenue}
-            else:
-                category_count = merged_data['Category'].value_counts().to_dict()
-                return {'category_distribution': category_count}
-        elif 'price' in query_lower:
-            if 'average' in query_lower:
-                avg_price = merged_data['Total_Price'].mean()
-                return {'average_product_price': round(avg_price, 2)}
-            elif 'highest' in query_lower:
-                highest_price = merged_data['Total_Price'].max()
-                return {'highest_product_price': highest_price}
-            elif 'lowest' in query_lower:
-                lowest_price = merged_data['Total_Price'].min()
-                return {'lowest_product_price': lowest_price}
-    
-    # Enhanced financial queries
-    elif any(word in query_lower for word in ['revenue', 'sales', 'profit', 'income', 'money', 'financial']):
-        if 'total' in query_lower:
-            total_revenue = merged_data['Total_Price'].sum()
-            return {'total_revenue': round(total_revenue, 2)}
-        elif 'by customer' in query_lower:
-            customer_revenue = merged_data.groupby('Customer_Name')['Total_Price'].sum().sort_values(ascending=False).to_dict()
-            return {'customer_revenue': customer_revenue}
-        elif any(word in query_lower for word in ['monthly', 'by month', 'month']):
-            merged_data['Order_Date'] = pd.to_datetime(merged_data['Order_Date'])
-            monthly_revenue = merged_data.groupby(merged_data['Order_Date'].dt.to_period('M'))['Total_Price'].sum().to_dict()
-            return {'monthly_revenue': {str(k): v for k, v in monthly_revenue.items()}}
-        elif any(word in query_lower for word in ['daily', 'by day', 'day']):
-            merged_data['Order_Date'] = pd.to_datetime(merged_data['Order_Date'])
-            daily_revenue = merged_data.groupby(merged_data['Order_Date'].dt.date)['Total_Price'].sum().to_dict()
-            return {'daily_revenue': {str(k): v for k, v in daily_revenue.items()}}
-        elif 'growth' in query_lower or 'trend' in query_lower:
-            merged_data['Order_Date'] = pd.to_datetime(merged_data['Order_Date'])
-            monthly_revenue = merged_data.groupby(merged_data['Order_Date'].dt.to_period('M'))['Total_Price'].sum()
-            if len(monthly_revenue) > 1:
-                growth_rate = ((monthly_revenue.iloc[-1] - monthly_revenue.iloc[0]) / monthly_revenue.iloc[0]) * 100
-                return {'revenue_growth_rate': round(growth_rate, 2)}
-    
-    # Enhanced analytical queries
-    elif 'analysis' in query_lower or 'insights' in query_lower or 'analytics' in query_lower:
-        insights = {
-            'total_customers': len(data_manager.customer_df),
-            'total_orders': len(data_manager.inventory_df),
-            'total_revenue': round(merged_data['Total_Price'].sum(), 2),
-            'average_order_value': round(merged_data.groupby('IID')['Total_Price'].sum().mean(), 2),
-            'top_customer': merged_data.groupby('Customer_Name')['Total_Price'].sum().idxmax(),
-            'top_product': merged_data['Product_Name'].value_counts().idxmax(),
-            'order_completion_rate': round((data_manager.inventory_df['PIF'] == 'Y').mean() * 100, 2)
-        }
-        return {'business_insights': insights}
-    
-    # Time-based queries
-    elif any(word in query_lower for word in ['today', 'yesterday', 'this week', 'this month', 'this year']):
-        merged_data['Order_Date'] = pd.to_datetime(merged_data['Order_Date'])
-        now = pd.Timestamp.now()
-        
-        if 'today' in query_lower:
-            today_data = merged_data[merged_data['Order_Date'].dt.date == now.date()]
-        elif 'yesterday' in query_lower:
-            yesterday = now - pd.Timedelta(days=1)
-            today_data = merged_data[merged_data['Order_Date'].dt.date == yesterday.date()]
-        elif 'this week' in query_lower:
-            week_start = now - pd.Timedelta(days=now.weekday())
-            today_data = merged_data[merged_data['Order_Date'] >= week_start]
-        elif 'this month' in query_lower:
-            month_start = now.replace(day=1)
-            today_data = merged_data[merged_data['Order_Date'] >= month_start]
-        elif 'this year' in query_lower:
-            year_start = now.replace(month=1, day=1)
-            today_data = merged_data[merged_data['Order_Date'] >= year_start]
-        
-        return {
-            'period_orders': len(today_data),
-            'period_revenue': round(today_data['Total_Price'].sum(), 2),
-            'period_customers': today_data['Customer_Name'].nunique()
-        }
+# Keyword rules for /api/query in priority order. Each node is
+# (condition, intent or list of child nodes). A condition is a tuple of
+# alternatives, where an alternative is a keyword or a tuple of keywords
+# that must all appear; None always matches. Keywords match as substrings
+# of the lowercased query. The first node whose condition holds is taken
+# and, if none of its children then match, the query has no answer.
+INTENT_RULES = [
+    (('big customers', 'large customers', 'major customers', 'key customers', 'important customers'), 'top_customers_by_revenue'),
+    (('customer', 'client', 'buyer'), [
+        (('list', 'show', 'all', 'every'), [
+            (('premium',), 'premium_customers'),
+            (('standard',), 'standard_customers'),
+            (None, 'all_customers')
+        ]),
+        (('total', 'count', 'how many', 'number'), 'customer_count'),
+        (('top', 'best', 'highest', 'big', 'large', 'major', 'key', 'important'), [
+            (('spending', 'revenue', 'big', 'large'), 'top_customers_by_revenue'),
+            (('orders',), 'top_customers_by_orders'),
+            # Default to revenue-based ranking for "big customers" type queries
+            (None, 'top_customers_by_revenue')
+        ]),
+        ((('average', 'spending'),), 'average_customer_spending'),
+        (('new', 'recent'), 'recent_customers')
+    ]),
+    (('order', 'transaction', 'purchase'), [
+        (('total', 'count', 'how many', 'number'), 'order_count'),
+        (('revenue', 'sales', 'income', 'money'), [
+            (('total',), 'total_revenue'),
+            (('average',), 'average_order_value')
+        ]),
+        (('status', 'state'), 'order_status'),
+        (('pending', 'unpaid'), 'pending_orders'),
+        (('completed', 'paid'), 'completed_orders')
+    ]),
+    (('product', 'item', 'service', 'inventory'), [
+        (('list', 'show', 'all', 'every'), 'all_products'),
+        (('top', 'best', 'popular', 'selling', 'highest'), [
+            (('revenue', 'sales'), 'top_products_by_revenue'),
+            (None, 'top_products_by_quantity')
+        ]),
+        (('category',), [
+            (('revenue', 'sales'), 'category_revenue'),
+            (None, 'category_distribution')
+        ]),
+        (('price',), [
+            (('average',), 'average_product_price'),
+            (('highest',), 'highest_product_price'),
+            (('lowest',), 'lowest_product_price')
+        ])
+    ]),
+    (('revenue', 'sales', 'profit', 'income', 'money', 'financial'), [
+        (('total',), 'total_revenue'),
+        (('by customer',), 'customer_revenue'),
+        (('monthly', 'by month', 'month'), 'monthly_revenue'),
+        (('daily', 'by day', 'day'), 'daily_revenue'),
+        (('growth', 'trend'), 'revenue_growth')
+    ]),
+    (('analysis', 'insights', 'analytics'), 'business_insights'),
+    (TIME_PERIODS, 'period_summary'),
+    (('summary', 'overview', 'dashboard', 'stats', 'statistics'), 'data_summary'),
+    (('advanced analytics', 'analytics', 'comprehensive analysis', 'detailed analysis'), 'comprehensive_analysis'),
+    (('customer segmentation', 'segment customers'), 'customer_segmentation'),
+    (('product performance', 'product analysis'), 'product_performance'),
+    (('help', 'what can', 'how to', 'suggestions'), 'help'),
+    (None, 'unknown')
+]
+
+def _rule_keywords(rules):
+    for condition, target in rules:
+        for alternative in condition or ():
+            yield from (alternative,) if isinstance(alternative, str) else alternative
+        if isinstance(target, list):
+            yield from _rule_keywords(target)
+
+QUERY_KEYWORDS = sorted(set(_rule_keywords(INTENT_RULES)), key=len, reverse=True)
+
+# One regex pass finds the longest keyword starting at every position of the
+# query; the shorter keywords starting there are exactly its keyword prefixes.
+KEYWORD_PATTERN = re.compile('(?=(' + '|'.join(map(re.escape, QUERY_KEYWORDS)) + '))')
+KEYWORD_PREFIXES = {
+    keyword: frozenset(other for other in QUERY_KEYWORDS if keyword.startswith(other))
+    for keyword in QUERY_KEYWORDS
+}
+
+def find_keywords(query_lower):
+    """Every rule keyword that occurs as a substring of the query"""
+    found = set()
+    for keyword in KEYWORD_PATTERN.findall(query_lower):
+        found |= KEYWORD_PREFIXES[keyword]
+    return found
+
+def _condition_holds(condition, keywords):
+    if condition is None:
+        return True
+    return any(
+        alternative in keywords if isinstance(alternative, str) else keywords.issuperset(alternative)
+        for alternative in condition
+    )
+
+def route_query(query):
+    """Map a query to (intent, params); intent is None when the matched rule has no answer"""
+    keywords = find_keywords(query.lower())
+    rules = INTENT_RULES
+    while True:
+        for condition, target in rules:
+            if _condition_holds(condition, keywords):
+                break
+        else:
+            return None, {}
+        if isinstance(target, list):
+            rules = target
+            continue
+        params = {}
+        if target == 'period_summary':
+            params['period'] = next(period for period in TIME_PERIODS if period in keywords)
+            # Period windows are relative to today, so results are only reusable within a day
+            params['as_of'] = pd.Timestamp.now().normalize().date().isoformat()
+        return target, params
+
+# Words any question may contain: they can complete a customer or product
+# name but never identify one on their own
+ENTITY_STOPWORDS = frozenset("""
+    a about all an and any are bought buy by did do does for from has have how i in is it me much my of on or our
+    sell sold spend spent show tell the their them this to was we were what when which who whose with you
+""".split())
+COMMON_QUERY_WORDS = ENTITY_STOPWORDS | frozenset(token for keyword in QUERY_KEYWORDS for token in tokenize(keyword))
+
+def find_entity(data_manager, query):
+    """(intent, params) for the customer or product a query names, or None
     
-    # General summary
-    elif any(word in query_lower for word in ['summary', 'overview', 'dashboard', 'stats', 'statistics']):
-        return data_manager.get_data_summary()
+    Whichever kind of entity has more of its name in the query wins, and
+    one named by email or phone number beats any name.
+    """
+    best = None
+    with span('entity_lookup'):
+        for kind in ENTITY_INTENTS:
+            index = data_manager.get_search_index(kind)
+            positions, score = index.match(query, COMMON_QUERY_WORDS)
+            if len(positions) and (best is None or score > best[0]):
+                best = (score, kind, index, positions)
+    if best is None:
+        return None
+    _, kind, index, positions = best
+    if kind == 'customer':
+        cids = data_manager.customer_df['CID'].to_numpy()[positions]
+        return ENTITY_INTENTS[kind], {'cids': tuple(sorted(int(cid) for cid in cids))}
+    return ENTITY_INTENTS[kind], {'products': tuple(str(name) for name in index.names[positions])}
+
+# Intents answered with the summary of an explicit start/end range when
+# one is given; None covers queries like "sales" that name no measure
+DATE_RANGE_INTENTS = (None, 'period_summary', 'total_revenue', 'order_count')
+
+query_cache = ResultCache(int(os.environ.get('QUERY_CACHE_SIZE', '512')), 'query')
+
+def resolve_intent(query, data_manager, options=None):
+    """(intent, params) answering a lowercased query, whatever format the answer is sent in"""
+    intent, params = route_query(query)
+    date_range = date_range_params(options or {})
+    if date_range and intent in DATE_RANGE_INTENTS:
+        # An explicit range replaces the period named in the query
+        intent, params = 'period_summary', date_range
+    elif not date_range:
+        # A customer or product named in the query is answered for, whatever else it asks
+        entity = find_entity(data_manager, query)
+        if entity is not None:
+            intent, params = entity
+    return intent, params
+
+def process_data_query(query, merged_data, data_manager, options=None):
+    """Process different types of queries and return structured results with enhanced AI capabilities
     
-    # Advanced analytics queries
-    elif any(word in query_lower for word in ['advanced analytics', 'analytics', 'comprehensive analysis', 'detailed analysis']):
-        # This will trigger the advanced analytics endpoint
-        return {'advanced_analytics': True, 'analysis_type': 'comprehensive'}
+    The query is routed to an intent and answered from the result cache
+    when the same intent and parameters were already computed for the
+    current data version. options holds paging for list-style answers,
+    an explicit date range and approx, for period summaries from sketches.
+    """
+    intent, params = resolve_intent(query, data_manager, options)
+    if intent is None:
+        return None
+    if intent in LIST_INTENTS:
+        params = dict(params, **page_params(options or {}))
+    if intent == 'period_summary' and approx_param(options or {}):
+        params = dict(params, approx=True)
+    annotate(intent=intent)
+    start = time.perf_counter()
+    key = (intent, tuple(sorted(params.items())), data_manager.data_version)
+    found, result = query_cache.get(key)
+    if not found:
+        with span('handler'):
+            result = INTENT_HANDLERS[intent](data_manager, merged_data, params)
+        query_cache.put(key, result)
+    QUERY_SECONDS.observe(time.perf_counter() - start, intent=intent, cached=str(found).lower())
+    return result
+
+# List-style intents: result key, table and an optional (column, value) row filter
+LIST_INTENTS = {
+    'all_customers': ('customers', 'customer_df', None),
+    'premium_customers': ('premium_customers', 'customer_df', ('Customer_Type', 'Premium')),
+    'standard_customers': ('standard_customers', 'customer_df', ('Customer_Type', 'Standard')),
+    'all_products': ('products', 'pricelist_df', None)
+}
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows serialized per chunk when streaming NDJSON
+STREAM_CHUNK_ROWS = 1000
+
+class QueryParameterError(ValueError):
+    """A request parameter that can't be used; reported to the client as a 400"""
+
+def encode_cursor(offset):
+    """Opaque cursor for the row offset where the next page starts"""
+    return base64.urlsafe_b64encode(f"o:{offset}".encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        prefix, offset = decoded.split(':', 1)
+        if prefix != 'o' or int(offset) < 0:
+            raise ValueError(decoded)
+        return int(offset)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise QueryParameterError('Invalid cursor')
+
+def page_params(options, default_limit=DEFAULT_PAGE_SIZE):
+    """Validated offset and limit from the limit/cursor request options"""
+    try:
+        limit = int(options.get('limit', default_limit))
+    except (TypeError, ValueError):
+        raise QueryParameterError('limit must be an integer')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise QueryParameterError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    cursor = options.get('cursor')
+    return {'offset': decode_cursor(cursor) if cursor else 0, 'limit': limit}
+
+def date_range_params(options):
+    """Validated start/end request options as ISO timestamps; end is exclusive
+
+    Order dates are naive, so a bound with a UTC offset is converted to
+    naive UTC before it is compared or used to slice.
+    """
+    stamps = {}
+    for name in ('start', 'end'):
+        value = options.get(name)
+        if value in (None, ''):
+            continue
+        try:
+            stamp = pd.Timestamp(value)
+        except (TypeError, ValueError):
+            raise QueryParameterError(f'{name} must be an ISO date')
+        if pd.isna(stamp):
+            raise QueryParameterError(f'{name} must be an ISO date')
+        if stamp.tz is not None:
+            stamp = stamp.tz_convert(None)
+        stamps[name] = stamp
+    if len(stamps) == 2 and stamps['start'] > stamps['end']:
+        raise QueryParameterError('start must not be after end')
+    return {name: stamp.isoformat() for name, stamp in stamps.items()}
+
+def approx_param(options):
+    """Whether the request asked for answers from sketches (approx=true) rather than exact ones"""
+    value = options.get('approx', False)
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ('true', '1'):
+        return True
+    if str(value).lower() in ('false', '0', ''):
+        return False
+    raise QueryParameterError('approx must be true or false')
+
+def list_rows(data_manager, intent):
+    """The table behind a list intent and the positions of its matching rows (None for all rows)"""
+    _, attr, row_filter = LIST_INTENTS[intent]
+    frame = getattr(data_manager, attr)
+    if row_filter is None:
+        return frame, None
+    return frame, data_manager.get_row_positions(attr, *row_filter)
+
+def take_rows(frame, positions, start, stop):
+    """Rows start:stop of a table, or of the given row positions in it"""
+    if positions is None:
+        return frame.iloc[start:stop]
+    return frame.take(positions[start:stop])
+
+def stream_list_rows(data_manager, intent, options):
+    """Stream a list intent's rows as NDJSON, serialized chunk by chunk from the table"""
+    frame, positions = list_rows(data_manager, intent)
+    total = len(frame) if positions is None else len(positions)
+    start = decode_cursor(options['cursor']) if options.get('cursor') else 0
+    stop = total
+    if 'limit' in options:
+        stop = min(total, start + page_params(options)['limit'])
     
-    elif 'customer segmentation' in query_lower or 'segment customers' in query_lower:
-        return {'advanced_analytics': True, 'analysis_type': 'customer_segmentation'}
+    def generate():
+        for chunk_start in range(start, stop, STREAM_CHUNK_ROWS):
+            chunk = take_rows(frame, positions, chunk_start, min(chunk_start + STREAM_CHUNK_ROWS, stop))
+            yield chunk.to_json(orient='records', lines=True, date_format='iso')
     
-    elif 'product performance' in query_lower or 'product analysis' in query_lower:
-        return {'advanced_analytics': True, 'analysis_type': 'product_performance'}
+    return app.response_class(generate(), mimetype='application/x-ndjson',
+                              headers={'X-Total-Count': str(total)})
+
+# Intent handlers: each gets the data manager, the merged table and the
+# routed params and returns the result payload
+
+def _top_customers_by_revenue(data_manager, merged_data, params):
+    customer_revenue = data_manager.get_aggregates().top('customer', 'sum', 10)
+    return {'top_customers_by_revenue': customer_revenue.to_dict()}
+
+def _list_handler(intent):
+    """Handler returning one page of a list-style intent plus the cursor for the next page"""
+    result_key = LIST_INTENTS[intent][0]
     
-    # Help and suggestions
-    elif any(word in query_lower for word in ['help', 'what can', 'how to', 'suggestions']):
+    def handler(data_manager, merged_data, params):
+        frame, positions = list_rows(data_manager, intent)
+        total = len(frame) if positions is None else len(positions)
+        start = min(params['offset'], total)
+        stop = min(start + params['limit'], total)
+        page = take_rows(frame, positions, start, stop)
+        count_rows('list', len(page))
+        with span('to_dict'):
+            records = page.to_dict('records')
         return {
-            'message': 'I can help you analyze your business data! Here are some things you can ask me:',
-            'suggestions': [
-                'Show me all customers',
-                'What is the total revenue?',
-                'Who are the top customers by spending?',
-                'What are the most popular products?',
-                'Show me order status distribution',
-                'What is the average order value?',
-                'Show me monthly revenue trends',
-                'How many orders are pending?',
-                'Give me business insights',
-                'Show me today\'s sales',
-                'Give me advanced analytics',
-                'Show me customer segmentation',
-                'Analyze product performance'
-            ]
+            result_key: records,
+            'total': total,
+            'next_cursor': encode_cursor(stop) if stop < total else None
         }
+    return handler
+
+def _customer_count(data_manager, merged_data, params):
+    return {'total_customers': data_manager.get_metrics()['total_customers']}
+
+def _top_customers_by_orders(data_manager, merged_data, params):
+    customer_orders = data_manager.get_aggregates().top('customer', 'orders', 10)
+    return {'top_customers_by_orders': customer_orders.to_dict()}
+
+def _average_customer_spending(data_manager, merged_data, params):
+    avg_spending = data_manager.get_aggregates().average_customer_spending
+    return {'average_customer_spending': round(avg_spending, 2)}
+
+def _recent_customers(data_manager, merged_data, params):
+    recent_customers = data_manager.customer_df.sort_values('FIRSTDATE', ascending=False).head(10)
+    return {'recent_customers': recent_customers.to_dict('records')}
+
+def _order_count(data_manager, merged_data, params):
+    return {'total_orders': data_manager.get_metrics()['total_orders']}
+
+def _total_revenue(data_manager, merged_data, params):
+    total_revenue = data_manager.get_aggregates().total_revenue
+    return {'total_revenue': round(total_revenue, 2)}
+
+def _average_order_value(data_manager, merged_data, params):
+    avg_order_value = data_manager.get_aggregates().average_order_value
+    return {'average_order_value': round(avg_order_value, 2)}
+
+def _order_status(data_manager, merged_data, params):
+    order_status = data_manager.get_metrics()['order_status_counts'].to_dict()
+    return {'order_status_distribution': order_status}
+
+def _pending_orders(data_manager, merged_data, params):
+    metrics = data_manager.get_metrics()
+    return {'pending_orders': metrics['pending_orders'], 'pending_revenue': round(metrics['pending_revenue'], 2)}
+
+def _completed_orders(data_manager, merged_data, params):
+    metrics = data_manager.get_metrics()
+    return {'completed_orders': metrics['completed_orders'],
+            'completed_revenue': round(metrics['completed_revenue'], 2)}
+
+def _top_products_by_revenue(data_manager, merged_data, params):
+    product_revenue = data_manager.get_aggregates().top('product', 'sum', 10)
+    return {'top_products_by_revenue': product_revenue.to_dict()}
+
+def _top_products_by_quantity(data_manager, merged_data, params):
+    top_products = data_manager.get_aggregates().top('product', 'count', 10).to_dict()
+    return {'top_products_by_quantity': top_products}
+
+def _category_revenue(data_manager, merged_data, params):
+    category_revenue = data_manager.get_aggregates().top('category', 'sum', None).to_dict()
+    return {'category_revenue': category_revenue}
+
+def _category_distribution(data_manager, merged_data, params):
+    category_count = data_manager.get_aggregates().top('category', 'count', None).to_dict()
+    return {'category_distribution': category_count}
+
+def _average_product_price(data_manager, merged_data, params):
+    avg_price = data_manager.get_aggregates().average_price
+    return {'average_product_price': round(avg_price, 2)}
+
+def _highest_product_price(data_manager, merged_data, params):
+    return {'highest_product_price': data_manager.get_aggregates().max_price}
+
+def _lowest_product_price(data_manager, merged_data, params):
+    return {'lowest_product_price': data_manager.get_aggregates().min_price}
+
+def _customer_revenue(data_manager, merged_data, params):
+    customer_revenue = data_manager.get_aggregates().top('customer', 'sum', None).to_dict()
+    return {'customer_revenue': customer_revenue}
+
+def _customer_details(data_manager, merged_data, params):
+    customers = data_manager.customer_df
+    matches = customers[customers['CID'].isin(params['cids'])]
+    # Spending is totalled by name, as in every other customer answer
+    name = matches['Customer_Name'].iloc[0]
+    spending = data_manager.get_aggregates().table('customer')
+    totals = spending.loc[name] if name in spending.index else None
+    return {
+        'customer': name,
+        'customer_type': str(matches['Customer_Type'].iloc[0]),
+        'total_spent': round(float(totals['sum']), 2) if totals is not None else 0.0,
+        'total_orders': int(totals['orders']) if totals is not None else 0,
+        'total_order_items': int(totals['count']) if totals is not None else 0,
+        'matches': matches[[column for column in ('CID', 'Customer_Name', 'EMAIL') if column in matches]].to_dict('records')
+    }
+
+def _product_details(data_manager, merged_data, params):
+    name = params['products'][0]
+    sales = data_manager.get_aggregates().table('product')
+    totals = sales.loc[name] if name in sales.index else None
+    result = {
+        'product': name,
+        'total_revenue': round(float(totals['sum']), 2) if totals is not None else 0.0,
+        'items_sold': int(totals['count']) if totals is not None else 0,
+        'orders': int(totals['orders']) if totals is not None else 0,
+        'average_price': round(float(totals['mean']), 2) if totals is not None else None
+    }
+    pricelist = data_manager.pricelist_df
+    if 'name' in pricelist and 'baseprice' in pricelist:
+        listed = pricelist.loc[pricelist['name'] == name, 'baseprice']
+        if len(listed):
+            result['base_price'] = float(listed.iloc[0])
+    if len(params['products']) > 1:
+        result['other_matches'] = list(params['products'][1:])
+    return result
+
+def _monthly_revenue(data_manager, merged_data, params):
+    monthly_revenue = data_manager.get_metrics()['monthly_revenue'].round(2).to_dict()
+    return {'monthly_revenue': {str(k): v for k, v in monthly_revenue.items()}}
+
+def _daily_revenue(data_manager, merged_data, params):
+    daily_revenue = data_manager.get_metrics()['daily_revenue'].round(2).to_dict()
+    return {'daily_revenue': {str(k.date()): v for k, v in daily_revenue.items()}}
+
+def _revenue_growth(data_manager, merged_data, params):
+    growth_rate = data_manager.get_metrics()['revenue_growth_rate']
+    if growth_rate is not None:
+        return {'revenue_growth_rate': round(growth_rate, 2)}
+
+def _business_insights(data_manager, merged_data, params):
+    metrics = data_manager.get_metrics()
+    cube = metrics['cube']
+    insights = {
+        'total_customers': metrics['total_customers'],
+        'total_orders': metrics['total_orders'],
+        'total_revenue': round(cube.total_revenue, 2),
+        'average_order_value': round(cube.average_order_value, 2),
+        'top_customer': cube.leader('customer', 'sum'),
+        'top_product': cube.leader('product', 'count'),
+        'order_completion_rate': round(metrics['order_completion_rate'], 2)
+    }
+    return {'business_insights': insights}
+
+def _period_summary(data_manager, merged_data, params):
+    approx = params.get('approx', False)
+    if 'period' not in params:
+        # An explicit start/end range from the request
+        return date_range_summary(data_manager, params.get('start'), params.get('end'), approx)
+    today = pd.Timestamp(params['as_of'])
+    period = params['period']
+    end = None
+    if period == 'today':
+        start, end = today, today + pd.Timedelta(days=1)
+    elif period == 'yesterday':
+        start, end = today - pd.Timedelta(days=1), today
+    elif period == 'this week':
+        start = today - pd.Timedelta(days=today.weekday())
+    elif period == 'this month':
+        start = today.replace(day=1)
+    else:
+        start = today.replace(month=1, day=1)
     
+    return date_range_summary(data_manager, start, end, approx)
+
+def date_range_summary(data_manager, start, end, approx=False):
+    """Order lines, revenue and distinct customers with an order date in [start, end)"""
+    if approx:
+        return approx_range_summary(data_manager, start, end)
+    if data_manager.sql_store is not None:
+        return sql_range_summary(data_manager, start, end)
+    if data_manager.out_of_core:
+        return data_manager.get_chunked().range_summary(start, end)
+    period_data = data_manager.get_merged_range(start, end)
+    count_rows('date_range', len(period_data))
+    return {
+        'period_orders': len(period_data),
+        'period_revenue': round(period_data['Total_Price'].sum(), 2),
+        'period_customers': period_data['Customer_Name'].nunique()
+    }
+
+def range_rows(data_manager, start, end):
+    """Customer_Name and Total_Price of the merged rows with an order date in [start, end)"""
+    if data_manager.sql_store is not None:
+        return sql_range_rows(data_manager, start, end)
+    if data_manager.out_of_core:
+        return data_manager.get_chunked().range_rows(start, end)
+    return data_manager.get_merged_range(start, end)[['Customer_Name', 'Total_Price']]
+
+def approx_range_summary(data_manager, start, end):
+    """date_range_summary from the daily sketches, with distinct customers estimated
+    
+    Whole days in the range are merged from their sketches; only the rows
+    of a partial day at either end are read. Line counts and revenue stay
+    exact; relative_error gives the standard error of the customer count.
+    """
+    low = None if start is None else pd.Timestamp(start).value
+    high = None if end is None else pd.Timestamp(end).value
+    sketch, edges = data_manager.get_sketches().between(low, high)
+    for edge_start, edge_end in edges:
+        rows = range_rows(data_manager, pd.Timestamp(edge_start), pd.Timestamp(edge_end))
+        count_rows('date_range', len(rows))
+        sketch = sketch.merge(LineSketch.from_rows(rows['Customer_Name'], rows['Total_Price']))
+    return {
+        'period_orders': sketch.lines,
+        'period_revenue': round(sketch.revenue, 2),
+        'period_customers': int(round(sketch.customers.count())),
+        'relative_error': {'period_customers': round(sketch.customers.relative_error, 4)}
+    }
+
+def _data_summary(data_manager, merged_data, params):
+    return data_manager.get_data_summary()
+
+def _comprehensive_analysis(data_manager, merged_data, params):
+    # This will trigger the advanced analytics endpoint
+    return {'advanced_analytics': True, 'analysis_type': 'comprehensive'}
+
+def _customer_segmentation(data_manager, merged_data, params):
+    return {'advanced_analytics': True, 'analysis_type': 'customer_segmentation'}
+
+def _product_performance(data_manager, merged_data, params):
+    return {'advanced_analytics': True, 'analysis_type': 'product_performance'}
+
+def _help(data_manager, merged_data, params):
+    return {
+        'message': 'I can help you analyze your business data! Here are some things you can ask me:',
+        'suggestions': [
+            'Show me all customers',
+            'What is the total revenue?',
+            'Who are the top customers by spending?',
+            'What are the most popular products?',
+            'Show me order status distribution',
+            'What is the average order value?',
+            'Show me monthly revenue trends',
+            'How many orders are pending?',
+            'Give me business insights',
+            'Show me today\'s sales',
+            'Give me advanced analytics',
+            'Show me customer segmentation',
+            'Analyze product performance',
+            'Ask about one customer or product by name, email or phone number'
+        ]
+    }
+
+def _unknown(data_manager, merged_data, params):
     # Default response for unrecognized queries
-    else:
-        return {
-            'message': 'I can help you with questions about customers, orders, products, and sales data. Try asking me about revenue, top customers, popular products, or business insights!',
-            'available_queries': [
-                'Show all customers',
-                'What is the total revenue?',
-                'Who are the top customers?',
-                'What are the most popular products?',
-                'Show me business insights',
-                'How many orders are there?'
-            ]
-        }
+    return {
+        'message': 'I can help you with questions about customers, orders, products, and sales data. Try asking me about revenue, top customers, popular products, or business insights!',
+        'available_queries': [
+            'Show all customers',
+            'What is the total revenue?',
+            'Who are the top customers?',
+            'What are the most popular products?',
+            'Show me business insights',
+            'How many orders are there?'
+        ]
+    }
 
-@app.route('/api/reports/text', methods=['POST'])
-def generate_text_report():
-    """Generate textual reports"""
-    try:
-        data = request.get_json()
-        report_type = data.get('type', 'summary')
-        
-        merged_data = data_manager.get_merged_data()
-        
-        if report_type == 'summary':
-            summary = data_manager.get_data_summary()
-            report = f"""
+INTENT_HANDLERS = {
+    'top_customers_by_revenue': _top_customers_by_revenue,
+    'premium_customers': _list_handler('premium_customers'),
+    'standard_customers': _list_handler('standard_customers'),
+    'all_customers': _list_handler('all_customers'),
+    'customer_count': _customer_count,
+    'top_customers_by_orders': _top_customers_by_orders,
+    'average_customer_spending': _average_customer_spending,
+    'recent_customers': _recent_customers,
+    'order_count': _order_count,
+    'total_revenue': _total_revenue,
+    'average_order_value': _average_order_value,
+    'order_status': _order_status,
+    'pending_orders': _pending_orders,
+    'completed_orders': _completed_orders,
+    'all_products': _list_handler('all_products'),
+    'top_products_by_revenue': _top_products_by_revenue,
+    'top_products_by_quantity': _top_products_by_quantity,
+    'category_revenue': _category_revenue,
+    'category_distribution': _category_distribution,
+    'average_product_price': _average_product_price,
+    'highest_product_price': _highest_product_price,
+    'lowest_product_price': _lowest_product_price,
+    'customer_revenue': _customer_revenue,
+    'customer_details': _customer_details,
+    'product_details': _product_details,
+    'monthly_revenue': _monthly_revenue,
+    'daily_revenue': _daily_revenue,
+    'revenue_growth': _revenue_growth,
+    'business_insights': _business_insights,
+    'period_summary': _period_summary,
+    'data_summary': _data_summary,
+    'comprehensive_analysis': _comprehensive_analysis,
+    'customer_segmentation': _customer_segmentation,
+    'product_performance': _product_performance,
+    'help': _help,
+    'unknown': _unknown
+}
+
+# Text report formats and their streamed mimetypes: json wraps the whole
+# Markdown report in a JSON object, markdown and csv are streamed as the
+# rows are formatted, STREAM_CHUNK_ROWS at a time
+REPORT_FORMATS = {'json': None, 'markdown': 'text/markdown', 'csv': 'text/csv'}
+
+# Columns the customer report can be sorted by; a leading - sorts descending
+REPORT_SORT_KEYS = {'name': 'Customer_Name', 'spent': 'Total_Spent', 'orders': 'Total_Orders', 'type': 'Customer_Type'}
+DEFAULT_REPORT_SORT = '-spent'
+
+def report_params(params):
+    """Validated format, limit and sort options of a text report"""
+    report_format = params.get('format', 'json')
+    if report_format not in REPORT_FORMATS:
+        raise QueryParameterError(f"format must be one of {', '.join(REPORT_FORMATS)}")
+    sort = str(params.get('sort', DEFAULT_REPORT_SORT))
+    if sort.lstrip('-') not in REPORT_SORT_KEYS:
+        raise QueryParameterError(f"sort must be one of {', '.join(REPORT_SORT_KEYS)}, optionally prefixed with -")
+    limit = None
+    if params.get('limit') not in (None, ''):
+        limit = int_param(params, 'limit', None, 1, 2**31 - 1)
+    return {'format': report_format, 'sort': sort, 'limit': limit}
+
+def report_row_order(frame, sort):
+    """Row positions of a report table in the order of a sort key, None when it is already in that order"""
+    if sort == DEFAULT_REPORT_SORT:
+        return None
+    column = REPORT_SORT_KEYS[sort.lstrip('-')]
+    keys = pd.Series(np.asarray(frame.index if column == frame.index.name else frame[column]))
+    return keys.sort_values(ascending=not sort.startswith('-'), kind='stable', na_position='last').index.to_numpy()
+
+def markdown_header(frame):
+    """Markdown table header row and alignment row for a frame and its index"""
+    names = [frame.index.name or ''] + list(frame.columns)
+    aligns = ['---'] + ['---:' if frame[column].dtype.kind in 'iuf' else '---' for column in frame.columns]
+    return f"| {' | '.join(map(str, names))} |\n| {' | '.join(aligns)} |\n"
+
+def markdown_rows(frame):
+    """A frame's rows, index first, as Markdown table rows"""
+    cells = []
+    for column in [frame.index.to_series(index=frame.index)] + [frame[column] for column in frame.columns]:
+        if column.dtype.kind == 'f':
+            text = column.map(lambda value: '' if pd.isna(value) else f"{value:,.2f}")
+        else:
+            text = column.astype(object).where(column.notna(), '').astype(str).str.replace('|', '\\|', regex=False)
+        cells.append(text.to_numpy())
+    return ''.join(f"| {' | '.join(row)} |\n" for row in zip(*cells))
+
+# Text reports: each builder gets a data snapshot and the report params and
+# returns the report's text chunks. The data is read before returning, so
+# errors surface before a streamed response has started; the chunks are
+# formatted as they are sent.
+
+def _summary_report(data_manager, params):
+    metrics = data_manager.get_metrics()
+    summary = data_manager.get_data_summary()
+    if params['format'] == 'csv':
+        rows = [(name, summary[name]) for name in ('total_customers', 'total_orders', 'total_order_items',
+                                                   'total_products', 'total_revenue', 'avg_order_value')]
+        rows += [
+            ('top_customer_by_orders', list(summary['top_customer_by_orders'].keys())[0]),
+            ('top_product_by_sales', list(summary['top_product_by_sales'].keys())[0]),
+            ('premium_customers', metrics['premium_customers']),
+            ('standard_customers', metrics['standard_customers'])
+        ]
+        rows += [(f"orders_{status}", count) for status, count in metrics['order_status_counts'].items()]
+        # Amounts to the cent, as the JSON and Markdown reports give them
+        rows = [(name, round(value, 2) if isinstance(value, float) else value) for name, value in rows]
+        return [pd.DataFrame(rows, columns=['metric', 'value']).to_csv(index=False)]
+    return [f"""
 # Business Summary Report
 Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
@@ -341,92 +2248,238 @@ Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 - Top Product by Sales: {list(summary['top_product_by_sales'].keys())[0]}
 
 ## Customer Analysis
-Premium Customers: {len(data_manager.customer_df[data_manager.customer_df['Customer_Type'] == 'Premium'])}
-Standard Customers: {len(data_manager.customer_df[data_manager.customer_df['Customer_Type'] == 'Standard'])}
+Premium Customers: {metrics['premium_customers']}
+Standard Customers: {metrics['standard_customers']}
 
 ## Order Status Distribution
-{data_manager.inventory_df['Status'].value_counts().to_string()}
-            """
-        elif report_type == 'customer':
-            customer_analysis = merged_data.groupby('Customer_Name').agg({
-                'Total_Price': 'sum',
-                'IID': 'count',
-                'Customer_Type': 'first'
-            }).round(2)
-            customer_analysis.columns = ['Total_Spent', 'Total_Orders', 'Customer_Type']
-            customer_analysis = customer_analysis.sort_values('Total_Spent', ascending=False)
-            
-            report = f"""
+{metrics['order_status_counts'].to_string()}
+            """]
+
+def _customer_report(data_manager, params):
+    customers = data_manager.get_metrics()['customer_spending']
+    positions = report_row_order(customers, params['sort'])
+    stop = len(customers) if params['limit'] is None else min(len(customers), params['limit'])
+    as_csv = params['format'] == 'csv'
+    
+    def generate():
+        if as_csv:
+            yield customers.iloc[:0].to_csv(index_label='Customer_Name')
+        else:
+            yield f"""
 # Customer Analysis Report
 Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
 ## Customer Spending Summary
-{customer_analysis.to_string()}
-            """
+{markdown_header(customers)}"""
+        for start in range(0, stop, STREAM_CHUNK_ROWS):
+            chunk = take_rows(customers, positions, start, min(start + STREAM_CHUNK_ROWS, stop))
+            yield chunk.to_csv(header=False, float_format='%.2f') if as_csv else markdown_rows(chunk)
+    
+    return generate()
+
+TEXT_REPORTS = {
+    'summary': _summary_report,
+    'customer': _customer_report
+}
+
+@app.route('/api/reports/text', methods=['GET', 'POST'])
+@versioned_response
+def generate_text_report():
+    """Generate textual reports
+    
+    format=json (the default) returns the Markdown report in a JSON object;
+    format=markdown or csv streams it with chunked transfer encoding. The
+    customer report takes limit and sort (see REPORT_SORT_KEYS) options.
+    """
+    try:
+        data = request_params()
+        report_type = data.get('type', 'summary')
+        if report_type not in TEXT_REPORTS:
+            raise QueryParameterError(f'Unknown report type: {report_type}')
+        params = report_params(data)
         
-        return jsonify({'report': report, 'type': report_type})
+        # Chunks are formatted while the response is sent, after the request's
+        # own snapshot pin is released, so they read a snapshot held here
+        chunks = TEXT_REPORTS[report_type](data_manager.snapshot(), params)
+        if params['format'] == 'json':
+            return jsonify({'report': ''.join(chunks), 'type': report_type})
+        response = app.response_class(iter(chunks), mimetype=REPORT_FORMATS[params['format']])
+        if params['format'] == 'csv':
+            response.headers['Content-Disposition'] = f'attachment; filename="{report_type}-report.csv"'
+        return response
         
+    except QueryParameterError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/reports/visual', methods=['POST'])
+# Charts for /api/reports/visual: each builder gets the data manager and the
+# validated chart params and returns a Plotly figure
+
+# Largest top_n a chart accepts; everything past top_n goes into one "Other" bar/slice
+MAX_CHART_ITEMS = 1000
+
+# Revenue trend frequencies, finest first; the first one that fits max_points is used
+TREND_FREQUENCIES = [('D', 'Daily'), ('W', 'Weekly'), ('MS', 'Monthly'), ('QS', 'Quarterly'), ('YS', 'Yearly')]
+
+# Built figures and rendered PNGs, per chart type, params and data version
+figure_cache = ResultCache(int(os.environ.get('FIGURE_CACHE_SIZE', '64')), 'figure')
+
+def int_param(params, name, default, low, high):
+    """Validated integer request parameter"""
+    try:
+        value = int(params.get(name, default))
+    except (TypeError, ValueError):
+        raise QueryParameterError(f'{name} must be an integer')
+    if not low <= value <= high:
+        raise QueryParameterError(f'{name} must be between {low} and {high}')
+    return value
+
+def top_with_other(series, top_n, noun):
+    """The first top_n entries of a ranked series plus one bucket summing the rest"""
+    if len(series) <= top_n:
+        return series
+    rest = series.iloc[top_n:]
+    other = pd.Series([round(rest.sum(), 2)], index=[f"Other ({len(rest)} {noun})"])
+    return pd.concat([series.iloc[:top_n], other])
+
+def _chart_revenue_trend(data_manager, params):
+    daily = data_manager.get_metrics()['daily_revenue']
+    
+    # Downsample by summing into coarser periods so the totals stay exact
+    for freq, label in TREND_FREQUENCIES:
+        revenue = daily if freq == 'D' else daily.resample(freq).sum()
+        if len(revenue) <= params['max_points']:
+            break
+    revenue = revenue.round(2)
+    
+    fig = go.Figure(data=[
+        go.Scatter(x=revenue.index, y=revenue.values, mode='lines+markers')
+    ])
+    fig.update_layout(
+        title=f'{label} Revenue Trend',
+        xaxis_title='Date',
+        yaxis_title='Revenue ($)'
+    )
+    return fig
+
+def _chart_revenue_by_customer(data_manager, params):
+    customer_revenue = data_manager.get_aggregates().top('customer', 'sum', None)
+    customer_revenue = top_with_other(customer_revenue, params['top_n'], 'customers')
+    
+    fig = go.Figure(data=[
+        go.Bar(x=customer_revenue.index, y=customer_revenue.values)
+    ])
+    fig.update_layout(
+        title='Revenue by Customer',
+        xaxis_title='Customer',
+        yaxis_title='Total Revenue ($)'
+    )
+    return fig
+
+def _chart_order_status(data_manager, params):
+    status_counts = data_manager.get_metrics()['order_status_counts']
+    
+    fig = go.Figure(data=[
+        go.Pie(labels=status_counts.index, values=status_counts.values)
+    ])
+    fig.update_layout(title='Order Status Distribution')
+    return fig
+
+def _chart_product_sales(data_manager, params):
+    product_sales = data_manager.get_aggregates().top('product', 'count', params['top_n'])
+    
+    fig = go.Figure(data=[
+        go.Bar(x=product_sales.values, y=product_sales.index, orientation='h')
+    ])
+    fig.update_layout(
+        title=f"Top {params['top_n']} Products by Sales Volume",
+        xaxis_title='Number of Sales',
+        yaxis_title='Product'
+    )
+    return fig
+
+def _chart_category_revenue(data_manager, params):
+    category_revenue = data_manager.get_aggregates().top('category', 'sum', None)
+    category_revenue = top_with_other(category_revenue, params['top_n'], 'categories')
+    
+    fig = go.Figure(data=[
+        go.Pie(labels=category_revenue.index, values=category_revenue.values)
+    ])
+    fig.update_layout(title='Revenue by Product Category')
+    return fig
+
+# chart type -> (builder, {param: default})
+CHART_TYPES = {
+    'revenue_trend': (_chart_revenue_trend, {'max_points': 120}),
+    'revenue_by_customer': (_chart_revenue_by_customer, {'top_n': 20}),
+    'order_status': (_chart_order_status, {}),
+    'product_sales': (_chart_product_sales, {'top_n': 10}),
+    'category_revenue': (_chart_category_revenue, {'top_n': 10})
+}
+
+def chart_params(chart_type, data):
+    """The validated params a chart type uses, with defaults filled in"""
+    bounds = {'top_n': (1, MAX_CHART_ITEMS), 'max_points': (2, 5000)}
+    defaults = CHART_TYPES[chart_type][1]
+    return {name: int_param(data, name, default, *bounds[name]) for name, default in defaults.items()}
+
+def get_chart(chart_type, params):
+    """The figure for a chart, built once per chart type, params and data version"""
+    key = ('figure', chart_type, tuple(sorted(params.items())), data_manager.refresh())
+    found, fig = figure_cache.get(key)
+    if not found:
+        with span('chart'):
+            fig = CHART_TYPES[chart_type][0](data_manager, params)
+        figure_cache.put(key, fig)
+    return fig
+
+def get_chart_png(chart_type, params, width, height):
+    """The chart rendered to PNG with kaleido, cached like the figure itself"""
+    key = ('png', chart_type, tuple(sorted(params.items())), width, height, data_manager.refresh())
+    found, png = figure_cache.get(key)
+    if not found:
+        fig = get_chart(chart_type, params)
+        with span('render_png'):
+            png = fig.to_image(format='png', width=width, height=height)
+        figure_cache.put(key, png)
+    return png
+
+@app.route('/api/reports/visual', methods=['GET', 'POST'])
+@versioned_response
 def generate_visual_report():
-    """Generate visual reports using Plotly"""
+    """Generate visual reports using Plotly
+    
+    Returns the figure as JSON, or with format=png a static image rendered
+    server-side for clients that can't draw the figure themselves.
+    """
     try:
-        data = request.get_json()
+        data = request_params()
         chart_type = data.get('type', 'revenue_trend')
+        if chart_type not in CHART_TYPES:
+            return jsonify({'error': f'Unknown chart type: {chart_type}'}), 400
+        params = chart_params(chart_type, data)
         
-        merged_data = data_manager.get_merged_data()
-        
-        if chart_type == 'revenue_by_customer':
-            customer_revenue = merged_data.groupby('Customer_Name')['Total_Price'].sum().sort_values(ascending=False)
-            
-            fig = go.Figure(data=[
-                go.Bar(x=customer_revenue.index, y=customer_revenue.values)
-            ])
-            fig.update_layout(
-                title='Revenue by Customer',
-                xaxis_title='Customer',
-                yaxis_title='Total Revenue ($)'
-            )
-            
-        elif chart_type == 'order_status':
-            status_counts = data_manager.inventory_df['Status'].value_counts()
-            
-            fig = go.Figure(data=[
-                go.Pie(labels=status_counts.index, values=status_counts.values)
-            ])
-            fig.update_layout(title='Order Status Distribution')
-            
-        elif chart_type == 'product_sales':
-            product_sales = merged_data['Product_Name'].value_counts().head(10)
-            
-            fig = go.Figure(data=[
-                go.Bar(x=product_sales.values, y=product_sales.index, orientation='h')
-            ])
-            fig.update_layout(
-                title='Top 10 Products by Sales Volume',
-                xaxis_title='Number of Sales',
-                yaxis_title='Product'
-            )
-            
-        elif chart_type == 'category_revenue':
-            category_revenue = merged_data.groupby('Category')['Total_Price'].sum()
-            
-            fig = go.Figure(data=[
-                go.Pie(labels=category_revenue.index, values=category_revenue.values)
-            ])
-            fig.update_layout(title='Revenue by Product Category')
-        
-        # Convert plot to JSON
-        chart_json = json.dumps(fig, cls=PlotlyJSONEncoder)
-        
-        return jsonify({'chart': chart_json, 'type': chart_type})
+        if data.get('format') == 'png':
+            width = int_param(data, 'width', 700, 100, 2000)
+            height = int_param(data, 'height', 500, 100, 2000)
+            try:
+                png = get_chart_png(chart_type, params, width, height)
+            except ValueError as e:
+                # Raised by plotly when kaleido isn't installed
+                return jsonify({'error': f'Static image export is unavailable: {e}'}), 501
+            return app.response_class(png, mimetype='image/png')
+        
+        # The figure is embedded as a JSON object, serialized in the same pass as the response
+        return jsonify({'chart': get_chart(chart_type, params), 'type': chart_type})
         
+    except QueryParameterError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/data/summary', methods=['GET'])
+@versioned_response
 def get_data_summary():
     """Get basic data summary"""
     try:
@@ -435,117 +2488,437 @@ def get_data_summary():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/analytics/advanced', methods=['POST'])
-def advanced_analytics():
-    """Advanced analytics and insights"""
+# Drill-down endpoints: one customer with their orders, one order with its
+# lines. In memory the rows come from the group indexes (GROUP_INDEXES);
+# with SQLite storage from the indexed tables; out of core, where the large
+# tables are not held, from a chunked scan of their CSV.
+
+# Columns /api/orders/<key> looks an order up by, in order
+ORDER_KEYS = ('IID', 'TICKETNO')
+
+def parse_key(attr, column, text):
+    """A URL path segment as a value of a table's column, or None when it can't be one"""
+    if np.dtype(TABLE_SCHEMAS[attr]['dtypes'].get(column, 'object')).kind in 'iu':
+        try:
+            return int(text)
+        except ValueError:
+            return None
+    return text
+
+def scan_rows(data_manager, attr, column, value):
+    """A large table's rows where column equals value, by a chunked scan of its CSV"""
+    path = os.path.join(data_manager.data_dir, SOURCE_FILES[attr])
+    parts = []
+    for chunk in read_typed_csv_chunks(attr, path, rows_per_chunk(path, data_manager.memory_budget_mb * 2**20)):
+        count_rows('scan', len(chunk))
+        matched = chunk[(chunk[column] == value).to_numpy()] if column in chunk.columns else chunk.iloc[:0]
+        if len(matched):
+            parts.append(matched)
+    if not parts:
+        return pd.DataFrame()
+    return data_manager._derive(attr, pd.concat(parts, ignore_index=True))
+
+def rows_where(data_manager, attr, column, value):
+    """A table and the positions of its rows where column equals value
+    
+    The positions are in table order, which is date order for the
+    DATE_SORTED_TABLES. Only the rows a caller takes are ever copied.
+    """
+    if attr in CHUNKED_TABLES and data_manager.sql_store is not None:
+        frame = sql_rows(data_manager, attr, column, value)
+    elif getattr(data_manager, attr) is None:
+        frame = scan_rows(data_manager, attr, column, value)
+    else:
+        frame = getattr(data_manager, attr)
+        positions = None
+        if column in frame.columns:
+            positions = data_manager.get_group_index(attr, column).get(value)
+        return frame, np.array([], dtype='int32') if positions is None else positions
+    if attr in DATE_SORTED_TABLES:
+        frame = sort_by_date(frame, DATE_SORTED_TABLES[attr])
+    return frame, np.arange(len(frame))
+
+@app.route('/api/customers/<cid>', methods=['GET'])
+@versioned_response
+def get_customer(cid):
+    """One customer and their orders, newest first, paged by limit/cursor"""
     try:
-        data = request.get_json()
-        analysis_type = data.get('type', 'comprehensive')
+        page = page_params(request_params())
+        key = parse_key('customer_df', 'CID', cid)
+        customers, positions = rows_where(data_manager, 'customer_df', 'CID', key) if key is not None else (None, [])
+        if not len(positions):
+            return jsonify({'error': f"No customer with CID {cid}"}), 404
+        customer = customers.take(positions[:1]).to_dict('records')[0]
         
-        merged_data = data_manager.get_merged_data()
-        
-        if analysis_type == 'comprehensive':
-            # Comprehensive business analysis
-            analysis = {
-                'business_overview': {
-                    'total_customers': len(data_manager.customer_df),
-                    'total_orders': len(data_manager.inventory_df),
-                    'total_revenue': round(merged_data['Total_Price'].sum(), 2),
-                    'average_order_value': round(merged_data.groupby('IID')['Total_Price'].sum().mean(), 2),
-                    'order_completion_rate': round((data_manager.inventory_df['PIF'] == 'Y').mean() * 100, 2)
-                },
-                'customer_analysis': {
-                    'premium_customers': len(data_manager.customer_df[data_manager.customer_df['Customer_Type'] == 'Premium']),
-                    'standard_customers': len(data_manager.customer_df[data_manager.customer_df['Customer_Type'] == 'Standard']),
-                    'top_customer_by_revenue': merged_data.groupby('Customer_Name')['Total_Price'].sum().idxmax(),
-                    'top_customer_revenue': round(merged_data.groupby('Customer_Name')['Total_Price'].sum().max(), 2),
-                    'average_customer_spending': round(merged_data.groupby('Customer_Name')['Total_Price'].sum().mean(), 2)
-                },
-                'product_analysis': {
-                    'total_products': len(data_manager.pricelist_df),
-                    'top_product_by_quantity': merged_data['Product_Name'].value_counts().idxmax(),
-                    'top_product_by_revenue': merged_data.groupby('Product_Name')['Total_Price'].sum().idxmax(),
-                    'category_distribution': merged_data['Category'].value_counts().to_dict(),
-                    'average_product_price': round(merged_data['Total_Price'].mean(), 2)
+        orders, positions = rows_where(data_manager, 'inventory_df', 'CID', key)
+        positions = positions[::-1]
+        total = len(positions)
+        start = min(page['offset'], total)
+        stop = min(start + page['limit'], total)
+        count_rows('drill_down', stop - start)
+        with span('to_dict'):
+            records = take_rows(orders, positions, start, stop).to_dict('records')
+        return jsonify({
+            'customer': customer,
+            'orders': records,
+            'total_orders': total,
+            'next_cursor': encode_cursor(stop) if stop < total else None
+        })
+        
+    except QueryParameterError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/orders/<key>', methods=['GET'])
+@versioned_response
+def get_order(key):
+    """One order, by IID or ticket number, with its customer's name and its detail lines"""
+    try:
+        positions = []
+        for column in ORDER_KEYS:
+            value = parse_key('inventory_df', column, key)
+            if value is not None:
+                orders, positions = rows_where(data_manager, 'inventory_df', column, value)
+                if len(positions):
+                    break
+        if not len(positions):
+            return jsonify({'error': f"No order with IID or ticket number {key}"}), 404
+        # Ticket numbers get reused, so the latest order with one is the one meant
+        order = orders.take(positions[-1:]).to_dict('records')[0]
+        
+        lines, line_positions = rows_where(data_manager, 'detail_df', 'IID', order['IID'])
+        items = lines.take(line_positions)
+        customers, customer_positions = rows_where(data_manager, 'customer_df', 'CID', order['CID'])
+        count_rows('drill_down', len(items))
+        result = {
+            'order': order,
+            'customer_name': customers['Customer_Name'].iloc[customer_positions[0]] if len(customer_positions) else None,
+            'items': items.to_dict('records'),
+            'total_items': len(items)
+        }
+        others = orders['IID'].take(positions[::-1]).drop_duplicates()
+        if len(others) > 1:
+            result['other_orders'] = others.iloc[1:].tolist()
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# RFM segmentation for the 'rfm' analysis type. Customers are scored 1..bins
+# on recency (latest order date), frequency (distinct orders) and monetary
+# value (total spent), higher being better, then labelled by the first
+# segment rule their scores satisfy.
+
+# Segment rules on a 1-5 score scale: (label, {score: (lowest, highest)}).
+# Customers matching no rule fall into RFM_FALLBACK_SEGMENT.
+DEFAULT_RFM_SEGMENTS = [
+    ('Champions', {'r': (4, 5), 'f': (4, 5), 'm': (4, 5)}),
+    ('Loyal Customers', {'r': (3, 5), 'f': (3, 5)}),
+    ('Potential Loyalists', {'r': (4, 5), 'f': (1, 3)}),
+    ('At Risk', {'r': (1, 2), 'f': (3, 5)}),
+    ('Hibernating', {'r': (1, 2), 'f': (1, 2)})
+]
+RFM_FALLBACK_SEGMENT = 'Need Attention'
+DEFAULT_RFM_BINS = 5
+MAX_RFM_BINS = 10
+
+@metric('rfm_base', 'merged')
+def _metric_rfm_base(data_manager, merged):
+    """Per-customer last order date, distinct orders and total spent, as aligned arrays"""
+    count_rows('rfm', len(merged))
+    customer_codes, customer_ids = pd.factorize(merged['CID'], sort=False)
+    customer_count = len(customer_ids)
+    # factorize numbers keys in order of appearance, so a row is the first of
+    # its key exactly when its code exceeds every code before it
+    first_rows = np.flatnonzero(customer_codes > np.maximum.accumulate(np.r_[-1, customer_codes[:-1]]))
+    monetary = np.bincount(customer_codes, weights=merged['Total_Price'].to_numpy(dtype='float64'),
+                           minlength=customer_count)
+    
+    # Reduce to one row per order: an order has one customer and one date
+    order_codes, _ = pd.factorize(merged['IID'], sort=False)
+    order_rows = np.flatnonzero(order_codes > np.maximum.accumulate(np.r_[-1, order_codes[:-1]]))
+    order_customers = customer_codes[order_rows]
+    frequency = np.bincount(order_customers, minlength=customer_count)
+    
+    # NaT is the smallest int64, so it only wins when a customer has no dated order
+    order_dates = merged['Order_Date'].to_numpy().view('int64')[order_rows]
+    by_customer = np.argsort(order_customers, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(order_customers[by_customer]) != 0])
+    last_order = np.maximum.reduceat(order_dates[by_customer], starts)
+    
+    return {
+        'cid': customer_ids.to_numpy(),
+        'name': merged['Customer_Name'].to_numpy()[first_rows],
+        'last_order': last_order,
+        'frequency': frequency,
+        'monetary': monetary
+    }
+
+def rfm_segment_rules(params, bins):
+    """Validated segment rules from the request, or the defaults rescaled to bins"""
+    segments = params.get('segments')
+    if segments is None:
+        def rescale(low, high):
+            return (low - 1) * bins // 5 + 1, -(-high * bins // 5)
+        return [(label, {score: rescale(*bounds) for score, bounds in rule.items()})
+                for label, rule in DEFAULT_RFM_SEGMENTS]
+    
+    if isinstance(segments, str):
+        try:
+            segments = json.loads(segments)
+        except ValueError:
+            raise QueryParameterError('segments must be a JSON list')
+    if not isinstance(segments, list):
+        raise QueryParameterError('segments must be a list of {"label", "r", "f", "m"} rules')
+    rules = []
+    for segment in segments:
+        if not isinstance(segment, dict) or not isinstance(segment.get('label'), str):
+            raise QueryParameterError('each segment needs a label')
+        rule = {}
+        for score in ('r', 'f', 'm'):
+            if score not in segment:
+                continue
+            bounds = segment[score]
+            if (not isinstance(bounds, list) or len(bounds) != 2
+                    or not all(isinstance(bound, int) and 1 <= bound <= bins for bound in bounds)):
+                raise QueryParameterError(f'segment {score} must be [lowest, highest] scores between 1 and {bins}')
+            rule[score] = tuple(bounds)
+        rules.append((segment['label'], rule))
+    return rules
+
+def quantile_scores(values, bins):
+    """Score each value 1..bins by its quantile bin, bins closed on the right like pd.qcut"""
+    edges = np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])
+    return (np.searchsorted(edges, values, side='left') + 1).astype('int8')
+
+def rfm_scores(data_manager, base, bins):
+    """Every customer's r/f/m scores, days since their latest order and the member order of the segments"""
+    scores = {
+        'r': quantile_scores(base['last_order'], bins),
+        'f': quantile_scores(base['frequency'], bins),
+        'm': quantile_scores(base['monetary'], bins)
+    }
+    # Days since the latest order in the data, NaN for customers without a dated order
+    as_of = base['last_order'].max()
+    recency_days = (float(as_of) - base['last_order'].astype('float64')) / NS_PER_DAY
+    recency_days[base['last_order'] == NAT_INT64] = np.nan
+    # Best customers first: highest combined score, then highest spend
+    total_score = scores['r'].astype('int16') + scores['f'] + scores['m']
+    return {
+        'scores': scores,
+        'as_of': as_of,
+        'recency_days': recency_days,
+        'ranking': np.lexsort((-base['monetary'], -total_score))
+    }
+
+# Scores for each bin count, kept per data version like the other metrics
+for _bins in range(2, MAX_RFM_BINS + 1):
+    metric(f'rfm_scores:{_bins}', 'rfm_base')(functools.partial(rfm_scores, bins=_bins))
+
+def rfm_analysis(data_manager, params):
+    """RFM scores summarized per segment, with one page of members for a requested segment"""
+    bins = int_param(params, 'bins', DEFAULT_RFM_BINS, 2, MAX_RFM_BINS)
+    rules = rfm_segment_rules(params, bins)
+    metrics = data_manager.get_metrics()
+    base = metrics['rfm_base']
+    customer_count = len(base['cid'])
+    if customer_count == 0:
+        return {'rfm': {'bins': bins, 'customers': 0, 'segments': {}}}
+    scored = metrics[f'rfm_scores:{bins}']
+    scores = scored['scores']
+    recency_days = scored['recency_days']
+    
+    # Apply rules last to first so the first matching rule wins
+    labels = [label for label, _ in rules] + [RFM_FALLBACK_SEGMENT]
+    segment_codes = np.full(customer_count, len(rules), dtype='int16')
+    for code in range(len(rules) - 1, -1, -1):
+        matches = np.ones(customer_count, dtype=bool)
+        for score, (low, high) in rules[code][1].items():
+            matches &= (scores[score] >= low) & (scores[score] <= high)
+        segment_codes[matches] = code
+    
+    segment_sizes = np.bincount(segment_codes, minlength=len(labels))
+    segments = {}
+    for code, label in enumerate(labels):
+        size = int(segment_sizes[code])
+        if size == 0:
+            continue
+        in_segment = segment_codes == code
+        segment_recency = recency_days[in_segment]
+        dated = segment_recency[~np.isnan(segment_recency)]
+        segments[label] = {
+            'count': size,
+            'percentage': round(size / customer_count * 100, 2),
+            'avg_recency_days': round(float(dated.mean()), 2) if len(dated) else None,
+            'avg_frequency': round(float(base['frequency'][in_segment].mean()), 2),
+            'avg_monetary': round(float(base['monetary'][in_segment].mean()), 2)
+        }
+    result = {
+        'bins': bins,
+        'as_of': pd.Timestamp(scored['as_of']).isoformat(),
+        'customers': customer_count,
+        'segments': segments
+    }
+    
+    segment = params.get('segment')
+    if segment is not None:
+        if segment not in labels:
+            raise QueryParameterError(f'Unknown segment: {segment}')
+        page = page_params(params)
+        ranking = scored['ranking']
+        members = ranking[segment_codes[ranking] == labels.index(segment)]
+        start = min(page['offset'], len(members))
+        stop = min(start + page['limit'], len(members))
+        rows = members[start:stop]
+        result['members'] = [
+            {'CID': cid, 'Customer_Name': name, 'recency_days': None if math.isnan(days) else round(days, 2),
+             'frequency': frequency,
+             'monetary': round(monetary, 2), 'r': r, 'f': f, 'm': m}
+            for cid, name, days, frequency, monetary, r, f, m in zip(
+                base['cid'][rows].tolist(), base['name'][rows].tolist(), recency_days[rows].tolist(),
+                base['frequency'][rows].tolist(), base['monetary'][rows].tolist(),
+                scores['r'][rows].tolist(), scores['f'][rows].tolist(), scores['m'][rows].tolist())
+        ]
+        result['total'] = len(members)
+        result['next_cursor'] = encode_cursor(stop) if stop < len(members) else None
+    return {'rfm': result}
+
+def run_analysis(data_manager, analysis_type, params):
+    """The analysis payload for one advanced analytics type"""
+    annotate(analysis_type=analysis_type)
+    date_range = date_range_params(params)
+    approx = approx_param(params)
+    metrics = data_manager.get_metrics()
+    cube = metrics['cube']
+    
+    if analysis_type == 'comprehensive':
+        # Comprehensive business analysis
+        analysis = {
+            'business_overview': {
+                'total_customers': metrics['total_customers'],
+                'total_orders': metrics['total_orders'],
+                'total_revenue': round(cube.total_revenue, 2),
+                'average_order_value': round(cube.average_order_value, 2),
+                'order_completion_rate': round(metrics['order_completion_rate'], 2)
+            },
+            'customer_analysis': {
+                'premium_customers': metrics['premium_customers'],
+                'standard_customers': metrics['standard_customers'],
+                'top_customer_by_revenue': cube.leader('customer', 'sum'),
+                'top_customer_revenue': round(cube.table('customer')['sum'].max(), 2),
+                'average_customer_spending': round(cube.average_customer_spending, 2)
+            },
+            'product_analysis': {
+                'total_products': metrics['total_products'],
+                'top_product_by_quantity': cube.leader('product', 'count'),
+                'top_product_by_revenue': cube.leader('product', 'sum'),
+                'category_distribution': cube.top('category', 'count', None).to_dict(),
+                'average_product_price': round(cube.average_price, 2)
+            },
+            'financial_analysis': {
+                'total_revenue': round(cube.total_revenue, 2),
+                'pending_revenue': round(metrics['pending_revenue'], 2),
+                'completed_revenue': round(metrics['completed_revenue'], 2),
+                'revenue_by_category': cube.table('category')['sum'].round(2).to_dict()
+            },
+            'time_analysis': {
+                'recent_orders': metrics['recent_orders'],
+                'oldest_order': metrics['order_date_range'][0].isoformat(),
+                'newest_order': metrics['order_date_range'][1].isoformat()
+            }
+        }
+        if date_range:
+            analysis['time_analysis']['date_range'] = dict(
+                date_range, **date_range_summary(data_manager, date_range.get('start'), date_range.get('end'), approx))
+        
+    elif analysis_type == 'customer_segmentation':
+        # Customer segmentation analysis
+        customer_metrics = metrics['customer_value_table']
+        low_cut, high_cut = metrics['customer_spending_cuts']
+        
+        # Segment customers
+        high_value = customer_metrics[customer_metrics['Total_Spent'] > high_cut]
+        medium_value = customer_metrics[(customer_metrics['Total_Spent'] > low_cut) & 
+                                      (customer_metrics['Total_Spent'] <= high_cut)]
+        low_value = customer_metrics[customer_metrics['Total_Spent'] <= low_cut]
+        
+        analysis = {
+            'customer_segments': {
+                'high_value_customers': {
+                    'count': len(high_value),
+                    'percentage': round(len(high_value) / len(customer_metrics) * 100, 2),
+                    'avg_spending': round(high_value['Total_Spent'].mean(), 2),
+                    'top_customers': high_value.head(5).to_dict('index')
                 },
-                'financial_analysis': {
-                    'total_revenue': round(merged_data['Total_Price'].sum(), 2),
-                    'pending_revenue': round(data_manager.inventory_df[data_manager.inventory_df['PIF'] == 'N']['SUBTOTAL'].sum(), 2),
-                    'completed_revenue': round(data_manager.inventory_df[data_manager.inventory_df['PIF'] == 'Y']['SUBTOTAL'].sum(), 2),
-                    'revenue_by_category': merged_data.groupby('Category')['Total_Price'].sum().to_dict()
+                'medium_value_customers': {
+                    'count': len(medium_value),
+                    'percentage': round(len(medium_value) / len(customer_metrics) * 100, 2),
+                    'avg_spending': round(medium_value['Total_Spent'].mean(), 2)
                 },
-                'time_analysis': {
-                    'recent_orders': len(data_manager.inventory_df[data_manager.inventory_df['INDATE'] >= '2025-01-01']),
-                    'oldest_order': data_manager.inventory_df['INDATE'].min(),
-                    'newest_order': data_manager.inventory_df['INDATE'].max()
+                'low_value_customers': {
+                    'count': len(low_value),
+                    'percentage': round(len(low_value) / len(customer_metrics) * 100, 2),
+                    'avg_spending': round(low_value['Total_Spent'].mean(), 2)
                 }
             }
-            
-        elif analysis_type == 'customer_segmentation':
-            # Customer segmentation analysis
-            customer_metrics = merged_data.groupby('Customer_Name').agg({
-                'Total_Price': ['sum', 'count', 'mean'],
-                'IID': 'nunique'
-            }).round(2)
-            customer_metrics.columns = ['Total_Spent', 'Total_Items', 'Avg_Item_Price', 'Unique_Orders']
-            customer_metrics = customer_metrics.sort_values('Total_Spent', ascending=False)
-            
-            # Segment customers
-            high_value = customer_metrics[customer_metrics['Total_Spent'] > customer_metrics['Total_Spent'].quantile(0.8)]
-            medium_value = customer_metrics[(customer_metrics['Total_Spent'] > customer_metrics['Total_Spent'].quantile(0.4)) & 
-                                          (customer_metrics['Total_Spent'] <= customer_metrics['Total_Spent'].quantile(0.8))]
-            low_value = customer_metrics[customer_metrics['Total_Spent'] <= customer_metrics['Total_Spent'].quantile(0.4)]
-            
-            analysis = {
-                'customer_segments': {
-                    'high_value_customers': {
-                        'count': len(high_value),
-                        'percentage': round(len(high_value) / len(customer_metrics) * 100, 2),
-                        'avg_spending': round(high_value['Total_Spent'].mean(), 2),
-                        'top_customers': high_value.head(5).to_dict('index')
-                    },
-                    'medium_value_customers': {
-                        'count': len(medium_value),
-                        'percentage': round(len(medium_value) / len(customer_metrics) * 100, 2),
-                        'avg_spending': round(medium_value['Total_Spent'].mean(), 2)
-                    },
-                    'low_value_customers': {
-                        'count': len(low_value),
-                        'percentage': round(len(low_value) / len(customer_metrics) * 100, 2),
-                        'avg_spending': round(low_value['Total_Spent'].mean(), 2)
-                    }
+        }
+        
+    elif analysis_type == 'rfm':
+        # Recency/frequency/monetary scoring and segmentation
+        analysis = rfm_analysis(data_manager, params)
+        
+    elif analysis_type == 'product_performance':
+        # Product performance analysis
+        product_metrics = cube.table('product').loc[cube.top('product', 'sum', 10).index].round(2)
+        product_metrics.columns = ['Total_Revenue', 'Total_Quantity', 'Avg_Price', 'Unique_Orders']
+        if approx:
+            # From the price sketch, without sorting or counting every price
+            price_sketch = data_manager.get_sketches().total().prices
+            median_price = price_sketch.quantile(0.5)
+        else:
+            median_price = cube.median_price
+        
+        analysis = {
+            'product_performance': {
+                'top_products_by_revenue': product_metrics.head(10).to_dict('index'),
+                'top_products_by_quantity': cube.top('product', 'count', 10).to_dict(),
+                'category_performance': cube.top('category', 'sum', None).to_dict(),
+                'price_analysis': {
+                    'highest_price': cube.max_price,
+                    'lowest_price': cube.min_price,
+                    'average_price': round(cube.average_price, 2),
+                    'median_price': round(median_price, 2)
                 }
             }
-            
-        elif analysis_type == 'product_performance':
-            # Product performance analysis
-            product_metrics = merged_data.groupby('Product_Name').agg({
-                'Total_Price': ['sum', 'count', 'mean'],
-                'IID': 'nunique'
-            }).round(2)
-            product_metrics.columns = ['Total_Revenue', 'Total_Quantity', 'Avg_Price', 'Unique_Orders']
-            product_metrics = product_metrics.sort_values('Total_Revenue', ascending=False)
-            
-            analysis = {
-                'product_performance': {
-                    'top_products_by_revenue': product_metrics.head(10).to_dict('index'),
-                    'top_products_by_quantity': merged_data['Product_Name'].value_counts().head(10).to_dict(),
-                    'category_performance': merged_data.groupby('Category')['Total_Price'].sum().sort_values(ascending=False).to_dict(),
-                    'price_analysis': {
-                        'highest_price': merged_data['Total_Price'].max(),
-                        'lowest_price': merged_data['Total_Price'].min(),
-                        'average_price': round(merged_data['Total_Price'].mean(), 2),
-                        'median_price': round(merged_data['Total_Price'].median(), 2)
-                    }
-                }
+        }
+        if approx:
+            analysis['product_performance']['price_analysis']['relative_error'] = {
+                'median_price': price_sketch.relative_error
             }
-            
+        
+    else:
+        raise QueryParameterError(f'Unknown analysis type: {analysis_type}')
+    return analysis
+
+@app.route('/api/analytics/advanced', methods=['GET', 'POST'])
+@versioned_response
+def advanced_analytics():
+    """Advanced analytics and insights"""
+    try:
+        data = request_params()
+        analysis_type = data.get('type', 'comprehensive')
+        
+        analysis = run_analysis(data_manager, analysis_type, data)
+        
         return jsonify({
             'analysis_type': analysis_type,
             'analysis': analysis,
             'timestamp': datetime.now().isoformat()
         })
         
+    except QueryParameterError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -569,14 +2942,16 @@ if __name__ == '__main__':
         print("No free ports available in range 5000-5099")
         exit(1)
     
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    debug = os.environ.get('FLASK_DEBUG', '0') == '1'
     print(f"Starting Flask server on port {port}")
     try:
-        app.run(debug=True, host='127.0.0.1', port=port, use_reloader=False)
+        app.run(debug=debug, host='127.0.0.1', port=port, use_reloader=False)
     except Exception as e:
         print(f"Error starting server: {e}")
         print("Trying alternative port...")
         port = find_free_port()
         if port:
-            app.run(debug=True, host='127.0.0.1', port=port, use_reloader=False)
+            app.run(debug=debug, host='127.0.0.1', port=port, use_reloader=False)
         else:
             print("Failed to start server on any available port")
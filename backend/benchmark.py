@@ -0,0 +1,276 @@
+"""Benchmark every query intent, report, chart and analysis in-process
+
+    python datagen.py 1m --out ../bench-data/1m
+    python benchmark.py --data ../bench-data/1m --save-baseline
+    python benchmark.py --data ../bench-data/1m
+
+Loads the app against the given data directory and drives each case through
+Flask's test client: one query per intent that /api/query can route to,
+every text report, chart and analysis type, and the data summary. Each case
+is timed once cold and then --repeat times with the result caches emptied,
+so the repeats measure the handlers over warm derived structures rather
+than cache hits.
+
+Records the load time, latency percentiles per case and the peak RSS, and
+compares them with a stored baseline; exits with status 1 on a regression.
+A baseline recorded with one --storage backend can be compared against
+another to see how they differ on the same data.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Baselines are per machine and per dataset, so they live with the generated data, which git ignores
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench-data',
+                                'benchmark_baseline.json')
+
+# One query per /api/query intent; checked against route_query before running
+BENCH_QUERIES = {
+    'top_customers_by_revenue': 'who are our big customers',
+    'premium_customers': 'list premium customers',
+    'standard_customers': 'list standard customers',
+    'all_customers': 'list all customers',
+    'customer_count': 'how many customers do we have',
+    'top_customers_by_orders': 'top customers by orders',
+    'average_customer_spending': 'average customer spending',
+    'recent_customers': 'recent customers',
+    'order_count': 'how many orders',
+    'total_revenue': 'total revenue',
+    'average_order_value': 'average order revenue',
+    'order_status': 'order status breakdown',
+    'pending_orders': 'pending orders',
+    'completed_orders': 'completed orders',
+    'all_products': 'list all products',
+    'top_products_by_revenue': 'top products by revenue',
+    'top_products_by_quantity': 'best selling products',
+    'category_revenue': 'product category revenue',
+    'category_distribution': 'product category breakdown',
+    'average_product_price': 'average product price',
+    'lowest_product_price': 'lowest product price',
+    'monthly_revenue': 'monthly revenue',
+    'daily_revenue': 'daily revenue',
+    'revenue_growth': 'revenue growth',
+    'business_insights': 'business insights',
+    'period_summary': 'what happened this week',
+    'data_summary': 'give me an overview',
+    'help': 'help',
+    'unknown': 'xyzzy',
+    None: 'sales'
+}
+
+TEXT_REPORT_TYPES = ('summary', 'customer')
+ANALYSIS_TYPES = ('comprehensive', 'customer_segmentation', 'rfm', 'product_performance')
+
+# Latency changes smaller than this are noise whatever the tolerance
+NOISE_FLOOR_MS = 2.0
+
+
+def build_cases(app_module):
+    """(name, method, path, payload) for every benchmarked request"""
+    cases = []
+    for intent, query in BENCH_QUERIES.items():
+        routed, _ = app_module.route_query(query)
+        if routed != intent:
+            raise SystemExit(f"Benchmark query {query!r} routes to {routed}, not {intent}")
+        cases.append((f"query:{intent or 'no_intent'}", 'POST', '/api/query', {'query': query}))
+
+    # The same measure over an explicit range, answered from the date-sorted tables
+    first, last = app_module.data_manager.get_metrics()['order_date_range']
+    if pd.notna(first):
+        start = first + (last - first) / 4
+        end = last - (last - first) / 4
+        cases.append(('query:total_revenue_range', 'POST', '/api/query',
+                      {'query': 'total revenue', 'start': start.isoformat(), 'end': end.isoformat()}))
+        # ...and estimated from the daily sketches
+        cases.append(('query:total_revenue_range_approx', 'POST', '/api/query',
+                      {'query': 'total revenue', 'start': start.isoformat(), 'end': end.isoformat(), 'approx': True}))
+
+    # Questions about one customer and one product, named as the data has them
+    customer = app_module.data_manager.get_aggregates().top('customer', 'sum', 1)
+    if len(customer):
+        cases.append(('query:customer_details', 'POST', '/api/query',
+                      {'query': f"how much has {customer.index[0]} spent"}))
+    product = app_module.data_manager.get_aggregates().top('product', 'sum', 1)
+    if len(product):
+        cases.append(('query:product_details', 'POST', '/api/query', {'query': f"sales of {product.index[0]}"}))
+
+    # The top customer's orders and the lines of their latest order, by id
+    if len(customer):
+        customers = app_module.data_manager.customer_df
+        cid = int(customers.loc[customers['Customer_Name'] == customer.index[0], 'CID'].iloc[0])
+        cases.append(('drilldown:customer', 'GET', f"/api/customers/{cid}", None))
+        orders, positions = app_module.rows_where(app_module.data_manager, 'inventory_df', 'CID', cid)
+        if len(positions):
+            cases.append(('drilldown:order', 'GET', f"/api/orders/{orders['IID'].iloc[positions[-1]]}", None))
+
+    for report_type in TEXT_REPORT_TYPES:
+        cases.append((f"report:{report_type}", 'GET', '/api/reports/text', {'type': report_type}))
+    for chart_type in app_module.CHART_TYPES:
+        cases.append((f"chart:{chart_type}", 'GET', '/api/reports/visual', {'type': chart_type}))
+    for analysis_type in ANALYSIS_TYPES:
+        cases.append((f"analysis:{analysis_type}", 'GET', '/api/analytics/advanced', {'type': analysis_type}))
+    cases.append(('analysis:product_performance_approx', 'GET', '/api/analytics/advanced',
+                  {'type': 'product_performance', 'approx': 'true'}))
+    cases.append(('data_summary', 'GET', '/api/data/summary', None))
+    return cases
+
+
+def unreachable_intents(app_module):
+    """Intents with a handler that no benchmark query reaches"""
+    return sorted(set(app_module.INTENT_HANDLERS) - set(BENCH_QUERIES) - set(app_module.ENTITY_INTENTS.values()))
+
+
+def send(client, method, path, payload):
+    if method == 'POST':
+        return client.post(path, json=payload)
+    return client.get(path, query_string=payload)
+
+
+def clear_result_caches(app_module):
+    for cache in (app_module.query_cache, app_module.response_cache, app_module.figure_cache):
+        cache.clear()
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_case(app_module, client, case, repeat):
+    name, method, path, payload = case
+    start = time.perf_counter()
+    response = send(client, method, path, payload)
+    first_ms = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        return {'error': f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}"}
+
+    timings = []
+    for _ in range(repeat):
+        clear_result_caches(app_module)
+        start = time.perf_counter()
+        send(client, method, path, payload)
+        timings.append((time.perf_counter() - start) * 1000)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99]) if timings else (first_ms,) * 3
+    return {
+        'first_ms': round(first_ms, 3),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'response_bytes': len(response.get_data())
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of results against baseline, as printable lines"""
+    if baseline.get('rows') != results['rows']:
+        raise SystemExit(f"The baseline was recorded on different data ({baseline.get('rows')}); "
+                         f"record a new one with --save-baseline")
+    regressions = []
+
+    def check(label, current, previous, floor):
+        if previous is not None and current > previous * (1 + tolerance) and current - previous > floor:
+            regressions.append(f"{label}: {previous:.3f} -> {current:.3f} (+{(current / previous - 1) * 100:.0f}%)")
+
+    check('load_seconds', results['load_seconds'], baseline.get('load_seconds'), NOISE_FLOOR_MS / 1000)
+    check('peak_rss_mb', results['peak_rss_mb'], baseline.get('peak_rss_mb'), 16)
+    for name, case in results['cases'].items():
+        previous = baseline.get('cases', {}).get(name, {})
+        if 'error' in case:
+            if 'error' not in previous:
+                regressions.append(f"{name}: {case['error']}")
+            continue
+        check(f"{name} p50_ms", case['p50_ms'], previous.get('p50_ms'), NOISE_FLOOR_MS)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--data', default=os.environ.get('DATA_DIR', '../data'), help='directory holding the CSVs')
+    parser.add_argument('--csv', action='store_true', help='parse the CSVs instead of loading the binary snapshot')
+    parser.add_argument('--storage', choices=('pandas', 'sqlite'), default=os.environ.get('STORAGE_BACKEND', 'pandas'),
+                        help='storage backend to benchmark (STORAGE_BACKEND)')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per case after the cold one')
+    parser.add_argument('--only', help='run only the cases whose name contains this text')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file (default: bench-data/)')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before failing, as a fraction')
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    args = parser.parse_args()
+
+    os.environ['DATA_DIR'] = args.data
+    os.environ['START_BACKGROUND_TASKS'] = '0'
+    os.environ['STORAGE_BACKEND'] = args.storage
+    if args.csv:
+        os.environ['SNAPSHOT_DIR'] = ''
+
+    start = time.perf_counter()
+    import app as app_module
+    load_seconds = time.perf_counter() - start
+    data_manager = app_module.data_manager
+    if data_manager.customer_df is None:
+        raise SystemExit(f"No data could be loaded from {args.data}")
+
+    # Counted the same way by every storage backend, so their results stay comparable
+    metrics = data_manager.get_metrics()
+    results = {
+        'data_dir': os.path.abspath(args.data),
+        'storage': args.storage,
+        'rows': {name: int(metrics[f"total_{name}"]) for name in ('customers', 'orders', 'order_items', 'products')},
+        'load_seconds': round(load_seconds, 3),
+        'repeat': args.repeat,
+        'cases': {}
+    }
+    print(f"Loaded {results['rows']} in {load_seconds:.2f}s")
+    unreachable = unreachable_intents(app_module)
+    if unreachable:
+        print(f"Intents no query routes to: {', '.join(unreachable)}")
+
+    client = app_module.app.test_client()
+    print(f"{'case':<40} {'first':>10} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for case in build_cases(app_module):
+        if args.only and args.only not in case[0]:
+            continue
+        result = results['cases'][case[0]] = run_case(app_module, client, case, args.repeat)
+        if 'error' in result:
+            print(f"{case[0]:<40} {result['error']}")
+        else:
+            print(f"{case[0]:<40} {result['first_ms']:>10.2f} {result['p50_ms']:>9.2f} "
+                  f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f}")
+    results['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    print(f"Peak RSS {results['peak_rss_mb']} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    failed = [name for name, case in results['cases'].items() if 'error' in case]
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 1 if failed else 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except OSError:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return 1 if failed else 0
+    if baseline.get('storage', 'pandas') != args.storage:
+        print(f"Comparing {args.storage} against a baseline recorded with {baseline.get('storage', 'pandas')}")
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,292 @@
+"""Out-of-core aggregation for tables larger than the memory budget
+
+When the tables and their merge would likely not fit in MEMORY_BUDGET_MB,
+only Customer and Pricelist are held in memory. Inventory and Detail are
+streamed from their CSVs in chunks and spilled to disk (see spill.py), and
+ChunkedAggregates folds them into the cube and the table-wide metrics.
+"""
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from cube import CUBE_DIMENSIONS, AggregateCube, PrecomputedCube
+from sketches import DailySketches
+from spill import PartitionSpill
+from tables import NAT_INT64, SOURCE_FILES, read_typed_csv_chunks, sort_by_date
+from telemetry import count_rows, span
+
+# Tables streamed in chunks rather than held in memory in out-of-core mode
+CHUNKED_TABLES = ('inventory_df', 'detail_df')
+
+# Rough in-memory size of the typed tables plus their merge, per byte of CSV
+IN_MEMORY_EXPANSION = 5
+
+# Share of the memory budget one parsed chunk or one spill partition may use
+CHUNK_BUDGET_SHARE = 0.25
+
+
+def rows_per_chunk(path, budget_bytes):
+    """Rows per CSV chunk so that one parsed chunk takes about CHUNK_BUDGET_SHARE of the budget"""
+    with open(path, 'rb') as f:
+        sample = f.read(1 << 16)
+    line_bytes = len(sample) / max(1, sample.count(b'\n'))
+    return max(1000, int(budget_bytes * CHUNK_BUDGET_SHARE / (line_bytes * IN_MEMORY_EXPANSION)))
+
+
+def add_partial(total, part):
+    """A running total (Series or DataFrame) with a partial rollup added; None starts the total"""
+    return part if total is None else total.add(part, fill_value=0)
+
+
+def first_rows(kept, rows, key):
+    """The earliest row per key by (stamp, line) among kept (or None) and rows"""
+    if kept is not None:
+        rows = pd.concat([kept, rows], ignore_index=True)
+    return rows.sort_values(['stamp', 'line'], kind='stable').drop_duplicates(key)
+
+
+class ChunkedAggregates:
+    """The cube and the table-wide metric values, computed in one chunked pass
+
+    Inventory and Detail are parsed in chunks and spilled to disk partitioned
+    by order id, so an order's lines and its inventory row share a partition.
+    Each partition is then joined with the in-memory Customer and Pricelist
+    tables and folded into running rollups; distinct order counts add up
+    exactly because no order spans two partitions. The joined rows stay on
+    disk, narrowed to what date range summaries read and sorted by order
+    date within each partition. Orders placed on or after recent_since
+    count as recent.
+    """
+    def __init__(self, data_manager, budget_mb, recent_since, spill_dir=None):
+        budget = budget_mb * 2**20
+        paths = {attr: os.path.join(data_manager.data_dir, SOURCE_FILES[attr]) for attr in CHUNKED_TABLES}
+        csv_bytes = sum(os.path.getsize(path) for path in paths.values())
+        partitions = max(1, math.ceil(csv_bytes * IN_MEMORY_EXPANSION / (budget * CHUNK_BUDGET_SHARE)))
+        self.spill = PartitionSpill(partitions, spill_dir)
+        self.customer_df = data_manager.customer_df
+        with span('chunked_scan'):
+            order_metrics = self._scan_orders(data_manager, paths['inventory_df'], budget, recent_since)
+            line_count = self._scan_lines(data_manager, paths['detail_df'], budget)
+        with span('chunked_fold'):
+            line_metrics = self._fold_partitions(data_manager)
+        # Values for the metrics that would otherwise read the full tables or the merge
+        self.metrics = dict(order_metrics, total_order_items=line_count, **line_metrics)
+        self.cube = self.metrics['cube']
+        print(f"Folded {line_count:,} detail rows in {partitions} partitions, "
+              f"{self.spill.size() / 2**20:,.1f} MB kept on disk for date ranges")
+
+    def _scan_orders(self, data_manager, path, budget, recent_since):
+        """Order, status and payment totals and the order date range; spills each order's key, customer and date"""
+        orders = paid = unpaid = recent = 0
+        paid_revenue = unpaid_revenue = 0.0
+        status_counts = first = last = None
+        recent_since = pd.Timestamp(recent_since).value
+        for chunk in read_typed_csv_chunks('inventory_df', path, rows_per_chunk(path, budget)):
+            chunk = data_manager._derive('inventory_df', chunk)
+            count_rows('chunked_scan', len(chunk))
+            orders += len(chunk)
+            status_counts = add_partial(status_counts, chunk['Status'].value_counts())
+            paid_mask = (chunk['PIF'] == 'Y').to_numpy()
+            unpaid_mask = (chunk['PIF'] == 'N').to_numpy()
+            paid += int(paid_mask.sum())
+            unpaid += int(unpaid_mask.sum())
+            paid_revenue += chunk['SUBTOTAL'][paid_mask].sum()
+            unpaid_revenue += chunk['SUBTOTAL'][unpaid_mask].sum()
+            stamps = chunk['INDATE'].to_numpy().view('int64')
+            dated = stamps[stamps != NAT_INT64]
+            if len(dated):
+                first = dated.min() if first is None else min(first, dated.min())
+                last = dated.max() if last is None else max(last, dated.max())
+            recent += int((stamps >= recent_since).sum())
+            self.spill.add('orders', chunk[['IID', 'CID', 'Order_Date']], 'IID')
+        if status_counts is None:
+            status_counts = pd.Series(dtype='int64')
+        return {
+            'total_orders': orders,
+            'order_status_counts': status_counts.astype('int64').sort_values(ascending=False),
+            'completed_orders': paid,
+            'completed_revenue': paid_revenue,
+            'pending_orders': unpaid,
+            'pending_revenue': unpaid_revenue,
+            'order_completion_rate': paid / orders * 100 if orders else np.nan,
+            'order_date_range': (pd.Timestamp(first), pd.Timestamp(last)) if first is not None else (pd.NaT, pd.NaT),
+            'recent_orders': recent
+        }
+
+    def _scan_lines(self, data_manager, path, budget):
+        """Spill the detail lines with the columns the rollups read; returns how many there are
+
+        Each line keeps its position in the file, which with the order date
+        gives the order the lines have in the in-memory merge.
+        """
+        lines = 0
+        for chunk in read_typed_csv_chunks('detail_df', path, rows_per_chunk(path, budget)):
+            chunk = data_manager._derive('detail_df', chunk)
+            count_rows('chunked_scan', len(chunk))
+            chunk = chunk[['IID', 'price_table_item_id', 'Product_Name', 'Category', 'Total_Price']].assign(
+                line=np.arange(lines, lines + len(chunk)))
+            lines += len(chunk)
+            self.spill.add('lines', chunk, 'IID')
+        return lines
+
+    def _fold_partitions(self, data_manager):
+        """Join each partition and fold it into the cube rollups, revenue by day and per-customer RFM inputs"""
+        customers = data_manager.customer_df[['CID', 'Customer_Name', 'Customer_Type']]
+        prices = data_manager.pricelist_df[['price_table_item_id']]
+        dimensions = {name: column for name, column in CUBE_DIMENSIONS.items() if name != 'order'}
+        tables = dict.fromkeys(dimensions)
+        price_counts = daily = by_customer = first_by_customer = first_by_name = None
+        revenue = 0.0
+        items = orders = 0
+        max_price, min_price = -np.inf, np.inf
+        for partition in range(self.spill.partitions):
+            lines = self.spill.read('lines', partition)
+            order_rows = self.spill.read('orders', partition)
+            self.spill.discard('lines', partition)
+            self.spill.discard('orders', partition)
+            if lines is None or order_rows is None:
+                continue
+            # The joins of CSVDataManager._merge_tables, for this partition's orders
+            joined = lines.merge(order_rows, on='IID').merge(customers, on='CID').merge(prices, on='price_table_item_id')
+            if not len(joined):
+                continue
+            count_rows('chunked_fold', len(joined))
+            line_prices = joined['Total_Price']
+            revenue += line_prices.sum()
+            items += len(joined)
+            orders += joined['IID'].nunique()
+            max_price = max(max_price, line_prices.max())
+            min_price = min(min_price, line_prices.min())
+            price_counts = add_partial(price_counts, line_prices.value_counts())
+            for name, column in dimensions.items():
+                tables[name] = add_partial(tables[name], AggregateCube._rollup(joined, column)[['sum', 'count', 'orders']])
+            daily = add_partial(daily, joined.groupby(joined['Order_Date'].dt.normalize())['Total_Price'].sum())
+
+            # In merge order: by order date (undated first), then by position in Detail.csv
+            joined = joined.assign(stamp=joined['Order_Date'].to_numpy().view('int64')).sort_values(
+                ['stamp', 'line'], kind='stable')
+            grouped = joined.groupby('CID')
+            customer_part = pd.DataFrame({
+                'monetary': grouped['Total_Price'].sum(),
+                'frequency': grouped['IID'].nunique(),
+                'last_order': grouped['stamp'].max()
+            })
+            if by_customer is not None:
+                customer_part = pd.concat([by_customer, customer_part]).groupby(level=0).agg(
+                    {'monetary': 'sum', 'frequency': 'sum', 'last_order': 'max'})
+            by_customer = customer_part
+            first_by_customer = first_rows(first_by_customer, joined[['CID', 'stamp', 'line']], 'CID')
+            first_by_name = first_rows(first_by_name, joined[['Customer_Name', 'Customer_Type', 'stamp', 'line']],
+                                       'Customer_Name')
+
+            self.spill.put('joined', partition, sort_by_date(joined[['Order_Date', 'Total_Price', 'CID']], 'Order_Date'))
+
+        for name, table in tables.items():
+            if table is None:
+                table = pd.DataFrame({'sum': [], 'count': [], 'orders': []})
+            table = table.sort_index()
+            tables[name] = pd.DataFrame({
+                'sum': table['sum'],
+                'count': table['count'].astype('int64'),
+                'mean': table['sum'] / table['count'],
+                'orders': table['orders'].astype('int64')
+            })
+        if items == 0:
+            max_price = min_price = np.nan
+        cube = PrecomputedCube(tables, revenue, items, max_price, min_price, orders,
+                               pd.Series(dtype='int64') if price_counts is None else price_counts)
+
+        if daily is None:
+            daily = pd.Series(dtype='float64', index=pd.DatetimeIndex([], name='Order_Date'), name='Total_Price')
+        daily = daily.sort_index()
+
+        # The type on each name's first merged row, like groupby().first() on the merge
+        customer_table = tables['customer']
+        if first_by_name is None:
+            customer_types = pd.Series(dtype=object)
+        else:
+            customer_types = first_by_name.set_index('Customer_Name')['Customer_Type']
+        customer_spending = pd.DataFrame({
+            'Total_Spent': customer_table['sum'],
+            'Total_Orders': customer_table['count'],
+            'Customer_Type': customer_types.reindex(customer_table.index)
+        }).round(2).sort_values('Total_Spent', ascending=False)
+
+        # Customers in order of their first merged row, as rfm_base numbers them in memory
+        if by_customer is None:
+            by_customer = pd.DataFrame({'monetary': [], 'frequency': [], 'last_order': []},
+                                       index=pd.Index([], dtype='int32'))
+        else:
+            by_customer = by_customer.loc[first_by_customer['CID']]
+        names = customers.drop_duplicates('CID').set_index('CID')['Customer_Name']
+        rfm_base = {
+            'cid': by_customer.index.to_numpy(),
+            'name': names.reindex(by_customer.index).to_numpy(),
+            'last_order': by_customer['last_order'].to_numpy(dtype='int64'),
+            'frequency': by_customer['frequency'].to_numpy(dtype='int64'),
+            'monetary': by_customer['monetary'].to_numpy(dtype='float64')
+        }
+        return {
+            'cube': cube,
+            'daily_revenue': daily,
+            'monthly_revenue': daily.groupby(daily.index.to_period('M')).sum(),
+            'customer_spending': customer_spending,
+            'rfm_base': rfm_base
+        }
+
+    def _joined_range(self, partition, low, high):
+        """A partition's spilled joined rows with low <= order date < high (high may be None)"""
+        joined = self.spill.read('joined', partition)
+        if joined is None:
+            return None
+        stamps = joined['Order_Date'].to_numpy().view('int64')
+        lo = stamps.searchsorted(low, side='left')
+        hi = len(stamps) if high is None else stamps.searchsorted(high, side='left')
+        return joined.iloc[lo:max(lo, hi)]
+
+    def range_rows(self, start, end):
+        """Customer_Name and Total_Price of the spilled joined rows with an order date in [start, end)"""
+        low = NAT_INT64 + 1 if start is None else pd.Timestamp(start).value
+        high = None if end is None else pd.Timestamp(end).value
+        parts = [self._joined_range(partition, low, high) for partition in range(self.spill.partitions)]
+        parts = [part for part in parts if part is not None and len(part)]
+        if not parts:
+            return pd.DataFrame({'Customer_Name': [], 'Total_Price': []})
+        rows = pd.concat(parts, ignore_index=True)
+        names = self.customer_df.drop_duplicates('CID').set_index('CID')['Customer_Name']
+        return pd.DataFrame({'Customer_Name': names.reindex(rows['CID']).to_numpy(), 'Total_Price': rows['Total_Price']})
+
+    def sketches(self):
+        """DailySketches of the spilled joined rows, folded one partition at a time"""
+        names = self.customer_df.drop_duplicates('CID').set_index('CID')['Customer_Name']
+        parts = []
+        for partition in range(self.spill.partitions):
+            joined = self.spill.read('joined', partition)
+            if joined is not None and len(joined):
+                parts.append(DailySketches.from_rows(joined['Order_Date'].to_numpy().view('int64'),
+                                                     names.reindex(joined['CID']).to_numpy(), joined['Total_Price']))
+        return DailySketches.combine(parts)
+
+    def range_summary(self, start, end):
+        """date_range_summary over the spilled joined rows, one partition at a time"""
+        low = NAT_INT64 + 1 if start is None else pd.Timestamp(start).value
+        high = None if end is None else pd.Timestamp(end).value
+        rows = 0
+        revenue = 0.0
+        customer_ids = []
+        for partition in range(self.spill.partitions):
+            period = self._joined_range(partition, low, high)
+            if period is None:
+                continue
+            rows += len(period)
+            revenue += period['Total_Price'].sum()
+            customer_ids.append(period['CID'].unique())
+        count_rows('date_range', rows)
+        period_customers = self.customer_df['CID'].isin(np.concatenate(customer_ids) if customer_ids else [])
+        return {
+            'period_orders': rows,
+            'period_revenue': round(revenue, 2),
+            'period_customers': self.customer_df.loc[period_customers, 'Customer_Name'].nunique()
+        }
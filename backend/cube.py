@@ -0,0 +1,171 @@
+"""Rollups of the order lines per customer, product, category and order
+
+AggregateCube groups the merged table once per data version; the chunked
+out-of-core mode and the SQLite backend compute the same rollups their own
+way and hand them to PrecomputedCube, so every query reads one interface.
+"""
+import copy
+import math
+
+import numpy as np
+import pandas as pd
+
+# Rollup dimensions kept by AggregateCube, keyed by the merged column they group on
+CUBE_DIMENSIONS = {
+    'customer': 'Customer_Name',
+    'product': 'Product_Name',
+    'category': 'Category',
+    'order': 'IID'
+}
+
+# Rollup measures that are amounts of money
+MONEY_MEASURES = ('sum', 'mean')
+
+
+class AggregateCube:
+    """Sum, count, mean and distinct-order rollups of Total_Price per dimension
+
+    Built once per data version so query branches become a lookup or a
+    top-N slice instead of a groupby over every detail row.
+    """
+    def __init__(self, merged):
+        prices = merged['Total_Price']
+        self.total_revenue = prices.sum()
+        self.total_items = len(merged)
+        self.max_price = prices.max()
+        self.min_price = prices.min()
+        self.tables = {name: self._rollup(merged, column) for name, column in CUBE_DIMENSIONS.items()}
+        self._prices = prices
+        self._median_price = None
+        self._rankings = {}
+
+    @staticmethod
+    def _rollup(merged, column):
+        grouped = merged.groupby(column, observed=True)
+        table = grouped['Total_Price'].agg(['sum', 'count', 'mean'])
+        table['orders'] = grouped['IID'].nunique()
+        if isinstance(table.index, pd.CategoricalIndex):
+            # Plain labels so rollups built from deltas with other categories still align
+            table.index = table.index.astype(table.index.categories.dtype)
+        return table
+
+    def updated(self, previous, delta, merged):
+        """Return a new cube with the delta rows folded in
+
+        previous is the merged table this cube was built from and merged is
+        previous plus delta. The cube itself is left untouched so requests
+        still holding it see consistent numbers.
+        """
+        cube = copy.copy(self)
+        if len(delta):
+            prices = delta['Total_Price']
+            cube.total_revenue = self.total_revenue + prices.sum()
+            cube.total_items = self.total_items + len(delta)
+            cube.max_price = max(self.max_price, prices.max())
+            cube.min_price = min(self.min_price, prices.min())
+            cube.tables = {
+                name: self._fold(self.tables[name], previous, delta, column, self.tables['order'].index)
+                for name, column in CUBE_DIMENSIONS.items()
+            }
+        cube._prices = merged['Total_Price']
+        cube._median_price = None
+        cube._rankings = {}
+        return cube
+
+    @staticmethod
+    def _fold(table, previous, delta, column, known_orders):
+        """Add a delta's rollup to an existing rollup table"""
+        rollup = AggregateCube._rollup(delta, column)
+        sums = table['sum'].add(rollup['sum'], fill_value=0)
+        counts = table['count'].add(rollup['count'], fill_value=0).astype('int64')
+        # An order only counts again for a key if that (key, order) pair is new
+        pair_columns = list(dict.fromkeys([column, 'IID']))
+        pairs = delta[pair_columns].drop_duplicates()
+        seen = pairs['IID'].isin(known_orders)
+        if seen.any():
+            previous_pairs = previous.loc[previous['IID'].isin(pairs.loc[seen, 'IID']), pair_columns].drop_duplicates()
+            pairs = pairs.merge(previous_pairs, how='left', indicator=True)
+            pairs = pairs[pairs['_merge'] == 'left_only']
+        new_orders = pairs.groupby(column, observed=True).size()
+        orders = table['orders'].add(new_orders, fill_value=0).astype('int64')
+        return pd.DataFrame({'sum': sums, 'count': counts, 'mean': sums / counts, 'orders': orders})
+
+    def table(self, dimension):
+        """Full rollup table for a dimension: columns sum, count, mean, orders"""
+        return self.tables[dimension]
+
+    def ranking(self, dimension, measure='sum'):
+        """One measure of a dimension sorted from highest to lowest, amounts to the cent
+
+        Every storage backend adds up the prices in its own order, so sums
+        only agree to the cent; rounded, they rank the same everywhere,
+        ties in key order.
+        """
+        key = (dimension, measure)
+        ranking = self._rankings.get(key)
+        if ranking is None:
+            values = self.tables[dimension][measure]
+            if measure in MONEY_MEASURES:
+                values = values.round(2)
+            ranking = values.sort_values(ascending=False, kind='stable')
+            self._rankings[key] = ranking
+        return ranking
+
+    def top(self, dimension, measure='sum', n=10):
+        """Top-N slice of a ranking; n=None returns the whole ranking"""
+        ranking = self.ranking(dimension, measure)
+        return ranking if n is None else ranking.head(n)
+
+    def leader(self, dimension, measure='sum'):
+        """Key with the highest value for a measure"""
+        return self.ranking(dimension, measure).index[0]
+
+    @property
+    def median_price(self):
+        if self._median_price is None:
+            self._median_price = self._prices.median()
+        return self._median_price
+
+    @property
+    def average_price(self):
+        return self.total_revenue / self.total_items
+
+    @property
+    def average_order_value(self):
+        return self.tables['order']['sum'].mean()
+
+    @property
+    def average_customer_spending(self):
+        return self.tables['customer']['sum'].mean()
+
+
+class PrecomputedCube(AggregateCube):
+    """AggregateCube assembled from rollups computed outside pandas, by ChunkedAggregates or in SQL
+
+    There is no per-order table; order values are averaged from the order
+    count and the median price is read off the counts of each price.
+    """
+    def __init__(self, tables, total_revenue, total_items, max_price, min_price, order_count, price_counts):
+        self.total_revenue = total_revenue
+        self.total_items = total_items
+        self.max_price = max_price
+        self.min_price = min_price
+        self.tables = tables
+        self.order_count = order_count
+        self._price_counts = price_counts.sort_index()
+        self._rankings = {}
+
+    @property
+    def median_price(self):
+        counts = self._price_counts
+        if not len(counts):
+            return np.nan
+        cumulative = counts.to_numpy().cumsum()
+        middle = (cumulative[-1] - 1) / 2
+        low = counts.index[cumulative.searchsorted(math.floor(middle), side='right')]
+        high = counts.index[cumulative.searchsorted(math.ceil(middle), side='right')]
+        return (low + high) / 2
+
+    @property
+    def average_order_value(self):
+        return self.total_revenue / self.order_count
@@ -0,0 +1,234 @@
+"""Generate synthetic POS exports in the schema of the files in data/
+
+    python datagen.py 1m --out ../bench-data/1m
+
+Writes Customer.csv, Inventory.csv, Detail.csv and Pricelist.csv with the
+requested number of detail rows (10k, 1m, 10m or any count). The data is
+skewed the way a real store's is: a few customers and products account
+for most orders, orders have one to a few lines, recent tickets are often
+not picked up or paid yet. Inventory has one row per ticket, and tickets
+are numbered in date order like the POS numbers them.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+# Rows written per to_csv call, to bound the memory spent formatting text
+WRITE_CHUNK_ROWS = 500_000
+
+FIRST_CID = 1000001
+FIRST_IID = 1204986
+FIRST_ITEM_ID = 1505918
+FIRST_PRICE_ITEM_ID = 30310
+END_DATE = pd.Timestamp('2025-09-08 19:00:00')
+HISTORY_DAYS = 730
+
+# (department, base items with a typical price); items priced 0 are add-ons
+CATALOG = [
+    ('Dry clean', [('2 piece suit', 16), ('Blouse', 10), ('Gown', 25), ('Sweater', 6.5), ('Pants', 6.5),
+                   ('Skirt', 6.5), ('Dress', 14), ('Coat', 18), ('Jacket', 9), ('Tie', 4.65), ('Vest', 5),
+                   ('Scarf', 5), ('Starch', 0), ('Stain treatment', 0), ('Rush', 0)]),
+    ('Shirt', [('Shirt hanger', 3.25), ('Shirt box', 3.75), ('Shirt starch', 0)]),
+    ('Laundry', [('Wash & fold', 1.75), ('Delicates', 4.5)]),
+    ('Household', [('Comforter', 35), ('Blanket', 22), ('Duvet cover', 18), ('Curtains', 15), ('Rug', 40)]),
+    ('Wf', [('Wash fold bag', 20), ('Wash fold lb', 1.95)])
+]
+VARIANTS = ['', ' - Silk', ' - Leather', ' - Long', ' - Pleated', ' - Kids', ' - Beaded', ' - Linen',
+            ' - Wool', ' - Cashmere', ' - Suede', ' - Velvet']
+
+FIRST_NAMES = ['Anna', 'James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'David',
+               'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah',
+               'Charles', 'Karen', 'Christopher', 'Lisa', 'Daniel', 'Nancy', 'Matthew', 'Betty', 'Anthony',
+               'Sandra', 'Mark', 'Ashley', 'Steven', 'Kimberly', 'Paul', 'Emily', 'Andrew', 'Donna', 'Joshua',
+               'Michelle', 'Kenneth', 'Carol', 'Kevin', 'Amanda', 'Brian', 'Melissa', 'George', 'Deborah',
+               'Timothy', 'Stephanie', 'Ronald', 'Rebecca', 'Jason', 'Laura', 'Edward', 'Helen', 'Jeffrey',
+               'Sharon', 'Ryan', 'Cynthia', 'Jacob', 'Kathleen', 'Gary', 'Amy', 'Nicholas', 'Angela', 'Eric',
+               'Shirley', 'Jonathan', 'Olivia', 'Stephen', 'Brenda', 'Larry', 'Pamela', 'Justin', 'Emma', 'Scott',
+               'Nicole', 'Brandon', 'Katrina', 'Benjamin', 'Samantha', 'Samuel', 'Katherine', 'Gregory',
+               'Christine', 'Alexander', 'Debra', 'Frank', 'Rachel', 'Patrick', 'Carolyn', 'Raymond', 'Janet',
+               'Jack', 'Catherine', 'Dennis', 'Maria', 'Jerry', 'Heather', 'Tyler', 'Diane']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+              'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore',
+              'Jackson', 'Martin', 'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark',
+              'Ramirez', 'Lewis', 'Robinson', 'Walker', 'Young', 'Allen', 'King', 'Wright', 'Scott', 'Torres',
+              'Nguyen', 'Hill', 'Flores', 'Green', 'Adams', 'Nelson', 'Baker', 'Hall', 'Rivera', 'Campbell',
+              'Mitchell', 'Carter', 'Roberts', 'Gomez', 'Phillips', 'Evans', 'Turner', 'Diaz', 'Parker',
+              'Cruz', 'Edwards', 'Collins', 'Reyes', 'Stewart', 'Morris', 'Morales', 'Murphy', 'Cook',
+              'Rogers', 'Gutierrez', 'Ortiz', 'Morgan', 'Cooper', 'Peterson', 'Bailey', 'Reed', 'Kelly',
+              'Howard', 'Ramos', 'Kim', 'Cox', 'Ward', 'Richardson', 'Watson', 'Brooks', 'Chavez', 'Wood',
+              'James', 'Bennett', 'Gray', 'Mendoza', 'Ruiz', 'Hughes', 'Price', 'Alvarez', 'Castillo',
+              'Sanders', 'Patel', 'Myers', 'Long', 'Ross', 'Foster', 'Wang', 'Owens']
+STREETS = ['Underwood', 'Mary', 'Oak', 'Maple', 'Cedar', 'Pine', 'Elm', 'Washington', 'Lake', 'Hill',
+           'Park', 'Main', 'Church', 'River', 'Sunset', 'Highland', 'Forest', 'Meadow', 'Spring', 'Valley']
+STREET_TYPES = ['Drive', 'Mews', 'Street', 'Avenue', 'Road', 'Lane', 'Court', 'Way', 'Place', 'Boulevard']
+CITY_PREFIXES = ['West', 'North', 'South', 'East', 'New', 'Port', 'Lake', 'Fort', 'Mount', '']
+CITY_NAMES = ['Roseside', 'William', 'Jamesfurt', 'Lisaview', 'Marystad', 'Kellyberg', 'Danielton',
+              'Brownmouth', 'Smithhaven', 'Clarkshire', 'Evansburgh', 'Hallport', 'Youngfort', 'Allenton',
+              'Kingville', 'Greenside', 'Adamsbury', 'Bakerland', 'Nelsonfurt', 'Carterview']
+STATES = ['NJ', 'NH', 'LA', 'MP', 'AK', 'RI', 'FM', 'CO', 'UT', 'NY', 'CA', 'TX', 'FL', 'WA', 'IL', 'PA',
+          'OH', 'GA', 'NC', 'MI', 'VA', 'AZ', 'MA', 'TN', 'IN', 'MO', 'MD', 'WI', 'MN', 'SC']
+EMAIL_DOMAINS = ['gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com', 'aol.com', 'icloud.com']
+
+
+def zipf_weights(count, exponent, rng):
+    """Popularity weights following a Zipf law, assigned to the count entries in random order"""
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def format_dates(values):
+    """datetime64 values as 'YYYY-MM-DD HH:MM:SS.mmm' strings like the POS writes, '' for NaT"""
+    text = np.datetime_as_string(values.astype('datetime64[ms]'), unit='ms')
+    text = np.char.replace(text, 'T', ' ')
+    return np.where(np.isnat(values), '', text)
+
+
+def write_csv(frame, path, date_columns=()):
+    """Write a frame in chunks, formatting its date columns the way the POS does"""
+    with open(path, 'w', newline='') as f:
+        for start in range(0, max(len(frame), 1), WRITE_CHUNK_ROWS):
+            chunk = frame.iloc[start:start + WRITE_CHUNK_ROWS]
+            chunk = chunk.assign(**{column: format_dates(chunk[column].to_numpy()) for column in date_columns})
+            chunk.to_csv(f, index=False, header=start == 0)
+
+
+def build_pricelist(rng):
+    """One price list entry per catalog item and variant"""
+    rows = []
+    for department, items in CATALOG:
+        for name, price in items:
+            for variant in VARIANTS:
+                factor = 1.0 if not variant else rng.choice([1.0, 1.25, 1.5, 2.0])
+                rows.append((f"{name}{variant}", round(price * factor, 2), department))
+    pricelist = pd.DataFrame(rows, columns=['name', 'baseprice', 'dept_name'])
+    pricelist.insert(0, 'item_id', np.arange(FIRST_PRICE_ITEM_ID, FIRST_PRICE_ITEM_ID + len(pricelist)))
+    return pricelist
+
+
+def generate(detail_rows, out_dir, seed=0):
+    """Write the four CSVs with detail_rows order lines to out_dir"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Orders: one to four lines each, numbered in date order
+    lines = rng.choice([1, 2, 3, 4], size=detail_rows, p=[0.63, 0.24, 0.12, 0.01])
+    order_count = int(np.searchsorted(np.cumsum(lines), detail_rows)) + 1
+    lines = lines[:order_count]
+    lines[-1] -= lines.sum() - detail_rows
+    customer_count = max(50, order_count // 6)
+
+    start = END_DATE - pd.Timedelta(days=HISTORY_DAYS)
+    day = rng.integers(0, HISTORY_DAYS, order_count)
+    # Quieter Sundays: move a share of them to the next day
+    weekday = (start.dayofweek + day) % 7
+    day = np.where((weekday == 6) & (rng.random(order_count) < 0.6), np.minimum(day + 1, HISTORY_DAYS - 1), day)
+    seconds = rng.integers(7 * 3600, 19 * 3600, order_count)
+    indate = np.sort(np.datetime64(start.normalize(), 'ms') + day.astype('timedelta64[D]')
+                     + seconds.astype('timedelta64[s]') + rng.integers(0, 1000, order_count).astype('timedelta64[ms]'))
+    age_days = (np.datetime64(END_DATE, 'ms') - indate) / np.timedelta64(1, 'D')
+    readydate = (indate.astype('datetime64[D]') + np.timedelta64(1, 'D')).astype('datetime64[ms]') + np.timedelta64(13, 'h')
+    picked_up = rng.random(order_count) < np.where(age_days < 7, 0.1, 0.75)
+    outdate = indate + (rng.exponential(10, order_count) * 86400_000).astype('timedelta64[ms]')
+    outdate = np.where(picked_up, outdate, np.datetime64('NaT'))
+    paid = picked_up | (rng.random(order_count) < 0.3)
+    customers = rng.choice(customer_count, size=order_count, p=zipf_weights(customer_count, 1.07, rng))
+
+    # Lines: popular products dominate, priced items more than add-ons
+    pricelist = build_pricelist(rng)
+    popularity = zipf_weights(len(pricelist), 1.2, rng) * np.where(pricelist['baseprice'] > 0, 4.0, 1.0)
+    products = rng.choice(len(pricelist), size=detail_rows, p=popularity / popularity.sum())
+    line_orders = np.repeat(np.arange(order_count), lines)
+    item_count = rng.choice([1, 2, 3, 5, 10], size=detail_rows, p=[0.97, 0.012, 0.008, 0.006, 0.004])
+    upcharge = rng.choice([0, 0.5, 1, 1.5, 2, 2.5, 3], size=detail_rows, p=[0.37, 0.16, 0.23, 0.01, 0.11, 0.09, 0.03])
+    baseprice = pricelist['baseprice'].to_numpy()[products]
+    subtotal = np.round(baseprice * item_count + upcharge, 2)
+    departments = pricelist['dept_name'].to_numpy()[products].astype(object)
+    departments[rng.random(detail_rows) < 0.02] = None
+
+    detail = pd.DataFrame({
+        'Item_ID': np.arange(FIRST_ITEM_ID, FIRST_ITEM_ID + detail_rows),
+        'IID': FIRST_IID + line_orders,
+        'item_name': pd.Categorical.from_codes(products, pricelist['name']),
+        'price_table_item_id': pricelist['item_id'].to_numpy()[products],
+        'item_count': item_count,
+        'item_baseprice': baseprice,
+        'dept_name': departments,
+        'item_pickup_date': outdate[line_orders],
+        'upChargeTotal': upcharge,
+        'standardSubtotal': subtotal
+    })
+    first_lines = np.cumsum(lines) - lines
+    inventory = pd.DataFrame({
+        'IID': FIRST_IID + np.arange(order_count),
+        'CID': FIRST_CID + customers,
+        'TICKETNO': np.char.add('A', np.char.zfill((np.arange(order_count) % 1_000_000).astype(str), 6)),
+        'CATEGORY': departments[first_lines],
+        'SUBTOTAL': np.round(np.bincount(line_orders, weights=subtotal, minlength=order_count), 2),
+        'PIECES': np.bincount(line_orders, weights=item_count, minlength=order_count).astype('int64'),
+        'INDATE': indate,
+        'READYDATE': readydate,
+        'OUTDATE': outdate,
+        'PIF': np.where(paid, 'Y', 'N'),
+        'payment_type': rng.choice(['', 'CASH', 'credit[visa', 'Charge'], size=order_count, p=[0.45, 0.45, 0.075, 0.025])
+    })
+
+    # Customers: year-to-date spend and last visit follow from their orders
+    first = rng.integers(0, len(FIRST_NAMES), customer_count)
+    last = rng.integers(0, len(LAST_NAMES), customer_count)
+    first_names = np.array(FIRST_NAMES)[first]
+    last_names = np.array(LAST_NAMES)[last]
+    this_year = indate >= np.datetime64(END_DATE.replace(month=1, day=1), 'ms')
+    ytd = np.bincount(customers[this_year], weights=inventory['SUBTOTAL'].to_numpy()[this_year], minlength=customer_count)
+    last_visit = pd.Series(indate).groupby(customers).max().reindex(range(customer_count)).to_numpy()
+    firstdate = (np.datetime64('2000-01-01', 'D') + rng.integers(0, 9000, customer_count).astype('timedelta64[D]')).astype('datetime64[ms]')
+    apartment = rng.choice(['Apt.', 'Suite', ''], customer_count, p=[0.45, 0.25, 0.3])
+    customer = pd.DataFrame({
+        'CID': FIRST_CID + np.arange(customer_count),
+        'FNAME1': first_names,
+        'LNAME': last_names,
+        'ADDRESS': [f"{number} {street} {kind}" for number, street, kind in zip(
+            rng.integers(1, 9999, customer_count), rng.choice(STREETS, customer_count), rng.choice(STREET_TYPES, customer_count))],
+        'APT': np.where(apartment == '', '', np.char.add(np.char.add(apartment.astype(str), ' '),
+                                                         rng.integers(1, 999, customer_count).astype(str))),
+        'CITY': np.char.strip(np.char.add(np.char.add(rng.choice(CITY_PREFIXES, customer_count), ' '),
+                                          rng.choice(CITY_NAMES, customer_count))),
+        'STATE': rng.choice(STATES, customer_count),
+        'ZIP': rng.integers(1000, 99999, customer_count),
+        'HAREA': rng.integers(200, 999, customer_count),
+        'HPHONE': rng.integers(2000000, 9999999, customer_count),
+        'YTD': np.round(ytd, 2),
+        'PRICETBL': rng.choice(['STANDARD', 'PREFERRED', 'CORPORATE'], customer_count, p=[0.8, 0.15, 0.05]),
+        'FIRSTDATE': firstdate,
+        'EMAIL': [f"{f.lower()}{l.lower()}{n}@{d}" for f, l, n, d in zip(
+            first_names, last_names, rng.integers(1, 999, customer_count), rng.choice(EMAIL_DOMAINS, customer_count))],
+        'pay_method': rng.choice(['CASH', 'Cash', 'Charge', 'Hotel'], customer_count, p=[0.5, 0.3, 0.17, 0.03]),
+        'LASTDATE': last_visit,
+        'InfoChangeDate': firstdate + (rng.integers(0, 3000, customer_count) * 86400_000).astype('timedelta64[ms]')
+    })
+
+    write_csv(customer, os.path.join(out_dir, 'Customer.csv'), ['FIRSTDATE', 'LASTDATE', 'InfoChangeDate'])
+    write_csv(inventory, os.path.join(out_dir, 'Inventory.csv'), ['INDATE', 'READYDATE', 'OUTDATE'])
+    write_csv(detail, os.path.join(out_dir, 'Detail.csv'), ['item_pickup_date'])
+    write_csv(pricelist[['item_id', 'name', 'baseprice']], os.path.join(out_dir, 'Pricelist.csv'))
+    return {'customers': customer_count, 'orders': order_count, 'detail_rows': detail_rows, 'products': len(pricelist)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic POS CSV exports')
+    parser.add_argument('size', help='detail rows: 10k, 1m, 10m or a number')
+    parser.add_argument('--out', required=True, help='directory to write the CSV files to')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rows = SIZES.get(args.size.lower()) or int(args.size)
+    counts = generate(rows, args.out, args.seed)
+    print(f"Wrote {counts['detail_rows']:,} detail rows, {counts['orders']:,} orders, "
+          f"{counts['customers']:,} customers and {counts['products']:,} products to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Gunicorn settings for serving the API in production
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app, and with it the CSV data, is loaded once in the master before
+the workers fork, so every worker starts with the tables in memory and
+shares their pages with the master instead of holding its own copy.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+preload_app = True
+
+# Threads don't survive fork, so the app leaves its background threads to post_fork
+os.environ.setdefault('START_BACKGROUND_TASKS', '0')
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach; otherwise a
+    # collection in a worker writes to every tracked object and un-shares its page
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app import start_background_tasks
+    start_background_tasks()
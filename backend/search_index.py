@@ -0,0 +1,158 @@
+"""Token and trigram search over entity names, for finding the entities a question mentions
+
+Each entity (a customer, a product) is indexed by the tokens of its name,
+and optionally by identifiers such as emails and phone numbers that only
+match exactly. Token postings hold the positions of the entities whose
+name has the token; trigram postings over the token vocabulary find
+tokens close to a misspelt one. Resolving a question is a handful of
+dictionary lookups and one pass over the matching postings, independent
+of how many entities there are.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+EMAIL_PATTERN = re.compile(r'[a-z0-9._%+-]+@[a-z0-9-]+(?:\.[a-z0-9-]+)+')
+PHONE_PATTERN = re.compile(r'\+?\(?\d[\d ().-]{5,}\d')
+
+# Fewest digits a phone number mention can have
+MIN_PHONE_DIGITS = 7
+
+# Shortest token looked up by trigram similarity, and how similar a token must be
+FUZZY_MIN_LENGTH = 4
+FUZZY_MIN_SIMILARITY = 0.6
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def identifiers_in(text):
+    """The emails and phone numbers (as digits) mentioned in a lowercased text"""
+    found = EMAIL_PATTERN.findall(text)
+    for phone in PHONE_PATTERN.findall(text):
+        digits = re.sub(r'\D', '', phone)
+        if len(digits) >= MIN_PHONE_DIGITS:
+            found.append(digits)
+    return found
+
+
+class Postings:
+    """For each key, the sorted positions of the entities that have it, all in one array"""
+
+    def __init__(self, keys, positions):
+        codes, uniques = pd.factorize(keys)
+        order = np.lexsort((positions, codes))
+        codes = codes[order]
+        positions = np.asarray(positions)[order]
+        distinct = np.ones(len(codes), dtype=bool)
+        distinct[1:] = (codes[1:] != codes[:-1]) | (positions[1:] != positions[:-1])
+        self.keys = pd.Index(uniques)
+        self.positions = positions[distinct].astype('int32')
+        self.offsets = np.searchsorted(codes[distinct], np.arange(len(uniques) + 1))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, key):
+        """Positions having key, or None"""
+        try:
+            code = self.keys.get_loc(key)
+        except KeyError:
+            return None
+        return self.positions[self.offsets[code]:self.offsets[code + 1]]
+
+
+class SearchIndex:
+    """Token postings, trigram postings and exact identifiers over a list of entities
+
+    names holds the name of each entity; identifiers is a list of sequences
+    aligned with it (e.g. every entity's email), whose values match only
+    when a question contains them exactly.
+    """
+
+    def __init__(self, names, identifiers=()):
+        names = pd.Series(np.asarray(names, dtype=object)).fillna('').astype(str)
+        self.names = names.to_numpy()
+        tokens = names.str.lower().str.findall(TOKEN_PATTERN.pattern).explode().dropna()
+        self.postings = Postings(tokens.to_numpy(dtype=object), tokens.index.to_numpy())
+        # How many distinct tokens each entity's name has, all of which a question must mention
+        self.token_counts = np.bincount(self.postings.positions, minlength=len(names)).astype('int32')
+
+        self.vocabulary = list(self.postings.keys)
+        vocabulary_trigrams = [trigrams(token) for token in self.vocabulary]
+        self.trigram_counts = np.array([len(grams) for grams in vocabulary_trigrams], dtype='int32')
+        grams = [gram for token_grams in vocabulary_trigrams for gram in token_grams]
+        token_ids = np.repeat(np.arange(len(self.vocabulary)), self.trigram_counts)
+        self.trigram_postings = Postings(np.array(grams, dtype=object), token_ids)
+
+        keys = []
+        positions = []
+        for values in identifiers:
+            values = pd.Series(np.asarray(values, dtype=object)).astype(str).str.strip().str.lower()
+            present = values.notna() & ~values.isin(('', 'nan', 'none', '<na>'))
+            keys.append(values[present].to_numpy(dtype=object))
+            positions.append(np.flatnonzero(present.to_numpy()))
+        self.identifiers = Postings(np.concatenate(keys) if keys else np.array([], dtype=object),
+                                    np.concatenate(positions) if positions else np.array([], dtype='int64'))
+
+    def similar_tokens(self, token):
+        """Vocabulary tokens whose trigram similarity (Jaccard) to token is at least FUZZY_MIN_SIMILARITY"""
+        grams = trigrams(token)
+        hits = [self.trigram_postings.get(gram) for gram in grams]
+        hits = [token_ids for token_ids in hits if token_ids is not None]
+        if not hits:
+            return []
+        token_ids, shared = np.unique(np.concatenate(hits), return_counts=True)
+        similarity = shared / (len(grams) + self.trigram_counts[token_ids] - shared)
+        return [self.vocabulary[token_id] for token_id in token_ids[similarity >= FUZZY_MIN_SIMILARITY]]
+
+    def match(self, text, common=frozenset()):
+        """(positions, score) of the entities text mentions best; positions is empty when there are none
+
+        An entity is mentioned when one of its identifiers is, or when every
+        token of its name is, allowing plurals and close misspellings. Words
+        in common (words any question has) may complete a name but never
+        make a match alone, and are never looked up fuzzily. The score is
+        the number of name tokens matched, so "2 piece suit" wins over
+        "suit"; entities tied on it (customers sharing a name) are all
+        returned. An identifier outranks any name.
+        """
+        text = str(text).lower()
+        found = [self.identifiers.get(key) for key in identifiers_in(text)]
+        found = [positions for positions in found if positions is not None]
+        if found:
+            return np.unique(np.concatenate(found)), np.inf
+
+        hits = []
+        distinctive = []
+        for token in dict.fromkeys(tokenize(text)):
+            positions = self.postings.get(token)
+            if positions is None and token.endswith('s'):
+                positions = self.postings.get(token[:-1])
+            if positions is None and token not in common and len(token) >= FUZZY_MIN_LENGTH:
+                similar = self.similar_tokens(token)
+                if similar:
+                    positions = np.unique(np.concatenate([self.postings.get(other) for other in similar]))
+            if positions is None:
+                continue
+            hits.append(positions)
+            if token not in common:
+                distinctive.append(positions)
+        if not distinctive:
+            return np.array([], dtype='int32'), 0
+
+        entities, counts = np.unique(np.concatenate(hits), return_counts=True)
+        mentioned = (counts >= self.token_counts[entities]) & np.isin(entities, np.concatenate(distinctive))
+        if not mentioned.any():
+            return np.array([], dtype='int32'), 0
+        entities, counts = entities[mentioned], counts[mentioned]
+        score = counts.max()
+        return entities[counts == score], int(score)
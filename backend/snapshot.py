@@ -0,0 +1,174 @@
+"""Columnar binary snapshots of the CSV tables for fast startup
+
+Each table column is written as a NumPy .npy file that later starts open
+with mmap_mode='r', so numeric columns are used straight from the page
+cache instead of being parsed out of the CSVs. Text columns are stored as
+integer codes plus a JSON list of their distinct values.
+
+A snapshot records the size, mtime and checksum of the CSV bytes it was
+built from. It is reused when the CSVs still match, or when an append-only
+CSV has only grown past the recorded prefix (the caller ingests the rest).
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Bump when the on-disk layout or the way tables are typed changes
+SNAPSHOT_FORMAT = 1
+
+MANIFEST = 'manifest.json'
+
+
+def file_checksum(path, length=None):
+    """blake2b of a file's first length bytes (the whole file by default)"""
+    digest = hashlib.blake2b(digest_size=16)
+    remaining = os.path.getsize(path) if length is None else length
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+class SnapshotStore:
+    """Reads and writes table snapshots in one directory"""
+
+    def __init__(self, directory, format_key=''):
+        self.directory = directory
+        self.format_key = f"{SNAPSHOT_FORMAT}:{format_key}"
+
+    def load(self, data_dir, source_files, append_only=()):
+        """Load the snapshot if it still matches the CSVs in data_dir
+
+        Returns (frames, sources) where sources maps each CSV filename to the
+        size/mtime/checksum the snapshot was built from, or None when there
+        is no usable snapshot.
+        """
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('format') != self.format_key:
+            return None
+
+        sources = manifest['sources']
+        for attr, filename in source_files.items():
+            recorded = sources.get(filename)
+            if recorded is None:
+                return None
+            try:
+                stat = os.stat(os.path.join(data_dir, filename))
+            except OSError:
+                return None
+            if (stat.st_size, stat.st_mtime_ns) == (recorded['size'], recorded['mtime_ns']):
+                continue
+            grown = attr in append_only and stat.st_size > recorded['size']
+            if stat.st_size != recorded['size'] and not grown:
+                return None
+            path = os.path.join(data_dir, filename)
+            if file_checksum(path, recorded['size']) != recorded['checksum']:
+                return None
+
+        table_dir = os.path.join(self.directory, manifest['key'])
+        frames = {}
+        for attr, table in manifest['tables'].items():
+            frames[attr] = self._read_table(os.path.join(table_dir, attr), table)
+        return frames, sources
+
+    def save(self, data_dir, source_files, frames, sizes):
+        """Write a snapshot of frames, built from the first sizes[attr] bytes of each CSV"""
+        sources = {}
+        for attr, filename in source_files.items():
+            path = os.path.join(data_dir, filename)
+            sources[filename] = {
+                'size': sizes[attr],
+                'mtime_ns': os.stat(path).st_mtime_ns,
+                'checksum': file_checksum(path, sizes[attr])
+            }
+        key = hashlib.sha1(json.dumps([self.format_key, sources], sort_keys=True).encode()).hexdigest()[:16]
+
+        os.makedirs(self.directory, exist_ok=True)
+        table_dir = os.path.join(self.directory, key)
+        staging = f"{table_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        tables = {}
+        for attr, frame in frames.items():
+            tables[attr] = self._write_table(os.path.join(staging, attr), frame)
+        shutil.rmtree(table_dir, ignore_errors=True)
+        os.replace(staging, table_dir)
+
+        # Swap the manifest last so readers never see a half-written snapshot
+        manifest = {'format': self.format_key, 'key': key, 'sources': sources, 'tables': tables}
+        manifest_tmp = os.path.join(self.directory, f"{MANIFEST}.tmp-{os.getpid()}")
+        with open(manifest_tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(manifest_tmp, os.path.join(self.directory, MANIFEST))
+
+        for name in os.listdir(self.directory):
+            if name not in (key, MANIFEST) and os.path.isdir(os.path.join(self.directory, name)):
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        return key
+
+    @staticmethod
+    def _write_table(table_dir, frame):
+        os.makedirs(table_dir)
+        columns = []
+        for position, name in enumerate(frame.columns):
+            series = frame[name]
+            stem = os.path.join(table_dir, str(position))
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                kind = 'category'
+                np.save(f"{stem}.npy", series.cat.codes.to_numpy())
+                values = series.cat.categories.tolist()
+            elif series.dtype.kind in 'biuf':
+                kind = 'numeric'
+                np.save(f"{stem}.npy", series.to_numpy())
+                values = None
+            elif series.dtype.kind == 'M':
+                kind = 'datetime'
+                np.save(f"{stem}.npy", series.to_numpy().view('int64'))
+                values = None
+            else:
+                kind = 'object'
+                codes, uniques = pd.factorize(series)
+                np.save(f"{stem}.npy", codes.astype('int32'))
+                values = uniques.tolist()
+            if values is not None:
+                with open(f"{stem}.json", 'w') as f:
+                    json.dump(values, f)
+            columns.append({'name': name, 'kind': kind, 'dtype': str(series.dtype)})
+        return {'columns': columns, 'rows': len(frame)}
+
+    @staticmethod
+    def _read_table(table_dir, table):
+        data = {}
+        for position, column in enumerate(table['columns']):
+            stem = os.path.join(table_dir, str(position))
+            # np.asarray drops the memmap subclass but keeps the mapped buffer
+            array = np.asarray(np.load(f"{stem}.npy", mmap_mode='r'))
+            kind = column['kind']
+            if kind == 'numeric':
+                data[column['name']] = array
+                continue
+            if kind == 'datetime':
+                data[column['name']] = array.view(column['dtype'])
+                continue
+            with open(f"{stem}.json") as f:
+                values = json.load(f)
+            if kind == 'category':
+                data[column['name']] = pd.Categorical.from_codes(array, dtype=pd.CategoricalDtype(values))
+            else:
+                # Code -1 marks a missing value and picks the trailing NaN
+                lookup = np.empty(len(values) + 1, dtype=object)
+                lookup[:-1] = values
+                lookup[-1] = np.nan
+                data[column['name']] = lookup[array]
+        return pd.DataFrame(data, copy=False)
@@ -0,0 +1,70 @@
+"""Hash-partitioned spill files for processing tables larger than memory
+
+Rows are split by an integer key into a fixed number of partitions, and
+each partition of each table is appended to its own file. Rows with the
+same key always land in the same partition, so joins and distinct counts
+on that key can be done one partition at a time with only that partition
+in memory.
+"""
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+
+import pandas as pd
+
+
+def _remove_directory(directory, owner_pid):
+    # Forked workers share their parent's spill files; only the creating process removes them
+    if os.getpid() == owner_pid:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class PartitionSpill:
+    """Partitioned tables in a private temporary directory, removed once the spill is garbage collected"""
+
+    def __init__(self, partitions, parent_dir=None):
+        if parent_dir:
+            os.makedirs(parent_dir, exist_ok=True)
+        self.partitions = partitions
+        self.directory = tempfile.mkdtemp(prefix='spill-', dir=parent_dir)
+        weakref.finalize(self, _remove_directory, self.directory, os.getpid())
+
+    def _path(self, table, partition):
+        return os.path.join(self.directory, f"{table}-{partition}.pkl")
+
+    def add(self, table, frame, key):
+        """Append a frame's rows to the partitions chosen by their key column"""
+        codes = frame[key].to_numpy() % self.partitions
+        for partition, part in frame.groupby(codes, sort=False):
+            self.put(table, int(partition), part)
+
+    def put(self, table, partition, frame):
+        """Append a frame to one partition of a table"""
+        with open(self._path(table, partition), 'ab') as f:
+            pickle.dump(frame, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def read(self, table, partition):
+        """All rows written to one partition of a table, or None when there are none"""
+        pieces = []
+        try:
+            with open(self._path(table, partition), 'rb') as f:
+                while True:
+                    try:
+                        pieces.append(pickle.load(f))
+                    except EOFError:
+                        break
+        except FileNotFoundError:
+            return None
+        return pd.concat(pieces, ignore_index=True) if len(pieces) > 1 else pieces[0].reset_index(drop=True)
+
+    def discard(self, table, partition):
+        try:
+            os.remove(self._path(table, partition))
+        except FileNotFoundError:
+            pass
+
+    def size(self):
+        """Bytes currently on disk"""
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory))
@@ -0,0 +1,390 @@
+"""SQLite storage for the tables, loaded once from the CSVs and kept across restarts
+
+The database file holds one table per CSV plus a record of how much of
+each CSV it holds (size, mtime, the offset parsed up to and the bytes just
+before it), so a restart or another worker process can tell whether it is
+still current. Rows appended to a CSV are inserted as they arrive; since
+rows are never deleted, rowids grow with file position and a reader can
+pin one version of a table by bounding its rowid.
+
+A changed database is rebuilt into a new file and swapped in, so readers
+keep a consistent (if stale) file until their next query reopens it.
+
+The query helpers below answer the cube, date range summaries, sketches
+and drill-downs for a data manager whose sql_store is a SQLiteStore;
+sql_bounds pins each query to the rows of the data version it reads.
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from cube import CUBE_DIMENSIONS, PrecomputedCube
+from sketches import DailySketches
+from tables import NAT_INT64, TABLE_SCHEMAS
+from telemetry import count_rows, span
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SOURCES_TABLE = 'smrt_sources'
+META_TABLE = 'smrt_meta'
+
+# Columns indexed in each SQLite table: the join keys, the order dates and the
+# ticket numbers orders are looked up by
+SQL_INDEXES = {
+    'customer_df': ['CID'],
+    'inventory_df': ['IID', 'CID', 'TICKETNO', 'INDATE', 'Order_Date'],
+    'detail_df': ['IID', 'price_table_item_id'],
+    'pricelist_df': ['price_table_item_id']
+}
+
+# Rows per chunk when copying Inventory and Detail into SQLite
+SQL_LOAD_CHUNK_ROWS = 200000
+
+# The joins of CSVDataManager._merge_tables over the SQLite tables, limited
+# to the rows of the data version being queried; queries extend the WHERE.
+# CROSS JOIN fixes the join order so every query starts from Inventory (by
+# the order date index when it has a date range) and looks the other rows
+# up by key; the unary + keeps the row bounds from being used as an index.
+MERGED_SQL = """inventory_df AS i
+    CROSS JOIN detail_df AS d ON d.IID = i.IID
+    CROSS JOIN customer_df AS c ON c.CID = i.CID
+    CROSS JOIN pricelist_df AS p ON p.price_table_item_id = d.price_table_item_id
+    WHERE +d.rowid <= :detail_rows AND +i.rowid <= :inventory_rows"""
+
+# The MERGED_SQL expression for each merged column the queries read
+SQL_COLUMNS = {
+    'Customer_Name': 'c.Customer_Name',
+    'Customer_Type': 'c.Customer_Type',
+    'CID': 'i.CID',
+    'Order_Date': 'i.Order_Date',
+    'IID': 'd.IID',
+    'Product_Name': 'd.Product_Name',
+    'Category': 'd.Category',
+    'Total_Price': 'd.Total_Price'
+}
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _column_type(dtype):
+    # Dates are stored as integer nanoseconds, which sort and compare like the dates
+    if dtype.kind in 'biuM':
+        return 'INTEGER'
+    if dtype.kind == 'f':
+        return 'REAL'
+    return 'TEXT'
+
+
+def _rows(frame):
+    """A frame's rows as tuples of Python values, with missing values as None"""
+    columns = {}
+    for name in frame.columns:
+        series = frame[name]
+        if series.dtype.kind == 'M':
+            columns[name] = pd.array(series.to_numpy().view('int64'), dtype='Int64')
+            columns[name][series.isna().to_numpy()] = pd.NA
+    values = frame.assign(**columns) if columns else frame
+    values = values.astype(object)
+    return values.where(values.notna(), None).itertuples(index=False, name=None)
+
+
+class SQLiteStore:
+    """Tables in one SQLite database file, with one connection per thread"""
+
+    def __init__(self, path, format_key=''):
+        self.path = path
+        self.format_key = format_key
+        self._local = threading.local()
+
+    def _connection(self):
+        """This thread's connection, reopened when the file was swapped for a rebuilt one
+
+        A forked worker inherits its parent's thread-local connection but must
+        not use it, so connections are also tied to the process that opened them.
+        """
+        opened_for = (os.stat(self.path).st_ino, os.getpid())
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.opened_for != opened_for:
+            if connection is not None and self._local.opened_for[1] == opened_for[1]:
+                connection.close()
+            # Autocommit, so writes manage their own transactions
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._local.connection = connection
+            self._local.opened_for = opened_for
+        return connection
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialize writers across processes, so no rebuild swaps the file under an append"""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def sources(self):
+        """The recorded state of each table's CSV, or {} when there is no usable database"""
+        try:
+            connection = self._connection()
+            (format_key,) = connection.execute(f"SELECT value FROM {META_TABLE} WHERE key = 'format'").fetchone()
+            if format_key != self.format_key:
+                return {}
+            rows = connection.execute(f"SELECT name, state, tail FROM {SOURCES_TABLE}").fetchall()
+        except (OSError, sqlite3.Error, TypeError):
+            return {}
+        return {name: dict(json.loads(state), tail=tail) for name, state, tail in rows}
+
+    def build(self, tables, indexes):
+        """Write every table to a new database file and swap it in
+
+        tables yields (name, frames, state): the frames of a table in file
+        order and the state of the CSV bytes they came from. indexes maps
+        table names to the columns to index.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        staging = f"{self.path}.tmp-{os.getpid()}"
+        if os.path.exists(staging):
+            os.remove(staging)
+        connection = sqlite3.connect(staging, isolation_level=None)
+        try:
+            connection.execute('PRAGMA synchronous = OFF')
+            connection.execute('BEGIN')
+            connection.execute(f"CREATE TABLE {META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+            connection.execute(f"CREATE TABLE {SOURCES_TABLE} (name TEXT PRIMARY KEY, state TEXT, tail BLOB)")
+            for name, frames, state in tables:
+                rows = 0
+                created = False
+                for frame in frames:
+                    if not created:
+                        self._create_table(connection, name, frame)
+                        created = True
+                    rows += self._insert(connection, name, frame)
+                if not created:
+                    connection.execute(f"CREATE TABLE IF NOT EXISTS {_quote(name)} "
+                                       f"({', '.join(_quote(column) for column in state['columns'])})")
+                self._record(connection, name, dict(state, rows=rows))
+            for name, columns in indexes.items():
+                existing = {row[1] for row in connection.execute(f"PRAGMA table_info({_quote(name)})")}
+                for column in columns:
+                    if column in existing:
+                        connection.execute(f"CREATE INDEX {_quote(f'{name}_{column}')} "
+                                           f"ON {_quote(name)} ({_quote(column)})")
+            connection.execute(f"INSERT INTO {META_TABLE} VALUES ('format', ?)", (self.format_key,))
+            connection.execute('COMMIT')
+            connection.execute('ANALYZE')
+        finally:
+            connection.close()
+        with self._write_lock():
+            os.replace(staging, self.path)
+
+    def replace(self, name, frame, state, index_columns=()):
+        """Rewrite one table in place, e.g. a small table whose CSV was edited"""
+        with self._write_lock():
+            connection = self._connection()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+                self._create_table(connection, name, frame)
+                rows = self._insert(connection, name, frame)
+                for column in index_columns:
+                    if column in frame.columns:
+                        connection.execute(f"CREATE INDEX {_quote(f'{name}_{column}')} "
+                                           f"ON {_quote(name)} ({_quote(column)})")
+                self._record(connection, name, dict(state, rows=rows))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def append(self, name, frame, expected_offset, state):
+        """Insert the rows appended to a CSV and record its new state
+
+        Only applies when the table still holds the CSV up to expected_offset.
+        Returns the state now recorded (also when another process already
+        inserted the same rows), or None when the database has moved on in a
+        way that needs a rebuild.
+        """
+        with self._write_lock():
+            connection = self._connection()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute(f"SELECT state FROM {SOURCES_TABLE} WHERE name = ?", (name,)).fetchone()
+                recorded = json.loads(row[0]) if row else None
+                if recorded is not None and recorded['offset'] == expected_offset:
+                    rows = recorded['rows'] + (self._insert(connection, name, frame) if frame is not None else 0)
+                elif recorded is not None and recorded['offset'] == state['offset']:
+                    rows = recorded['rows']
+                else:
+                    connection.execute('ROLLBACK')
+                    return None
+                state = dict(state, rows=rows)
+                self._record(connection, name, state)
+                connection.execute('COMMIT')
+                return state
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    @staticmethod
+    def _create_table(connection, name, frame):
+        columns = ', '.join(f"{_quote(column)} {_column_type(frame[column].dtype)}" for column in frame.columns)
+        connection.execute(f"CREATE TABLE {_quote(name)} ({columns})")
+
+    @staticmethod
+    def _insert(connection, name, frame):
+        placeholders = ', '.join('?' * len(frame.columns))
+        columns = ', '.join(_quote(column) for column in frame.columns)
+        connection.executemany(f"INSERT INTO {_quote(name)} ({columns}) VALUES ({placeholders})", _rows(frame))
+        return len(frame)
+
+    @staticmethod
+    def _record(connection, name, state):
+        recorded = {key: value for key, value in state.items() if key != 'tail'}
+        connection.execute(f"INSERT OR REPLACE INTO {SOURCES_TABLE} VALUES (?, ?, ?)",
+                           (name, json.dumps(recorded), state.get('tail', b'')))
+
+    def query(self, sql, params=()):
+        """Rows of a query as a DataFrame"""
+        return pd.read_sql_query(sql, self._connection(), params=params)
+
+    def query_chunks(self, sql, params=(), chunk_rows=100000):
+        """Rows of a query as DataFrames of up to chunk_rows rows each"""
+        return pd.read_sql_query(sql, self._connection(), params=params, chunksize=chunk_rows)
+
+    def row(self, sql, params=()):
+        """The first row of a query as a tuple"""
+        return self._connection().execute(sql, params).fetchone()
+
+
+def sql_query(data_manager, sql, **params):
+    """Rows of a query against the data manager's SQLite tables as a DataFrame"""
+    with span('sql'):
+        return data_manager.sql_store.query(sql, dict(data_manager.sql_bounds, **params))
+
+
+def sql_row(data_manager, sql, **params):
+    """The first row of a query against the data manager's SQLite tables"""
+    with span('sql'):
+        return data_manager.sql_store.row(sql, dict(data_manager.sql_bounds, **params))
+
+
+def sql_cube(data_manager):
+    """The AggregateCube rollups, grouped by SQLite"""
+    tables = {}
+    for name, column in CUBE_DIMENSIONS.items():
+        if name == 'order':
+            continue
+        source = SQL_COLUMNS[column]
+        table = sql_query(data_manager, f"""
+            SELECT {source} AS "{column}", TOTAL(d.Total_Price) AS "sum", COUNT(d.Total_Price) AS "count",
+                   COUNT(DISTINCT d.IID) AS "orders"
+            FROM {MERGED_SQL} AND {source} IS NOT NULL
+            GROUP BY {source}""").set_index(column).sort_index()
+        tables[name] = pd.DataFrame({
+            'sum': table['sum'],
+            'count': table['count'].astype('int64'),
+            'mean': table['sum'] / table['count'],
+            'orders': table['orders'].astype('int64')
+        })
+    revenue, items, max_price, min_price, orders = sql_row(data_manager, f"""
+        SELECT TOTAL(d.Total_Price), COUNT(*), MAX(d.Total_Price), MIN(d.Total_Price), COUNT(DISTINCT d.IID)
+        FROM {MERGED_SQL}""")
+    price_counts = sql_query(data_manager, f"""
+        SELECT d.Total_Price AS price, COUNT(*) AS lines
+        FROM {MERGED_SQL} AND d.Total_Price IS NOT NULL
+        GROUP BY d.Total_Price""")
+    count_rows('aggregate', items)
+    return PrecomputedCube(tables, revenue, items, np.nan if max_price is None else max_price,
+                           np.nan if min_price is None else min_price, orders,
+                           price_counts.set_index('price')['lines'])
+
+
+def sql_date_range(start, end):
+    """The MERGED_SQL condition for an order date in [start, end), and its params"""
+    conditions = ['i.Order_Date IS NOT NULL']
+    if start is not None:
+        conditions.append('i.Order_Date >= :start')
+    if end is not None:
+        conditions.append('i.Order_Date < :end')
+    params = {
+        'start': None if start is None else pd.Timestamp(start).value,
+        'end': None if end is None else pd.Timestamp(end).value
+    }
+    return ' AND '.join(conditions), params
+
+
+def sql_range_summary(data_manager, start, end):
+    """date_range_summary answered by SQLite through the order date index"""
+    condition, params = sql_date_range(start, end)
+    # Grouped by customer id, whose names are looked up in memory: cheaper
+    # than counting distinct names in SQL
+    by_customer = sql_query(data_manager, f"""
+        SELECT i.CID AS CID, COUNT(*) AS lines, TOTAL(d.Total_Price) AS revenue
+        FROM {MERGED_SQL} AND {condition}
+        GROUP BY i.CID""", **params)
+    rows = int(by_customer['lines'].sum())
+    count_rows('date_range', rows)
+    customers = data_manager.customer_df
+    return {
+        'period_orders': rows,
+        'period_revenue': round(float(by_customer['revenue'].sum()), 2),
+        'period_customers': customers.loc[customers['CID'].isin(by_customer['CID']), 'Customer_Name'].nunique()
+    }
+
+
+def sql_range_rows(data_manager, start, end):
+    """Customer_Name and Total_Price of the merged rows with an order date in [start, end)"""
+    condition, params = sql_date_range(start, end)
+    return sql_query(data_manager, f"""
+        SELECT c.Customer_Name AS Customer_Name, d.Total_Price AS Total_Price
+        FROM {MERGED_SQL} AND {condition}""", **params)
+
+
+def sql_sketches(data_manager):
+    """DailySketches of the merged rows, read from SQLite in chunks"""
+    parts = []
+    with span('sql'):
+        chunks = data_manager.sql_store.query_chunks(f"""
+            SELECT IFNULL(i.Order_Date, {NAT_INT64}) AS stamp, c.Customer_Name AS name, d.Total_Price AS price
+            FROM {MERGED_SQL}""", data_manager.sql_bounds, SQL_LOAD_CHUNK_ROWS)
+        for chunk in chunks:
+            count_rows('sketches', len(chunk))
+            parts.append(DailySketches.from_rows(chunk['stamp'], chunk['name'], chunk['price']))
+    return DailySketches.combine(parts)
+
+
+def sql_date_columns(data_manager, attr):
+    """The columns of a table stored as integer nanoseconds in SQLite"""
+    dates = TABLE_SCHEMAS[attr]['dates']
+    rules = data_manager.column_mapping.get(attr, {})
+    return dates + [name for name, rule in rules.items() if rule.get('source') in dates]
+
+
+def sql_rows(data_manager, attr, column, value):
+    """A SQLite table's rows at this data version where column equals value, through its index"""
+    bound = {'inventory_df': 'inventory_rows', 'detail_df': 'detail_rows'}[attr]
+    columns = sql_query(data_manager, f"PRAGMA table_info({attr})")['name']
+    dates = [name for name in sql_date_columns(data_manager, attr) if name in set(columns)]
+    # Missing dates read as NaT's integer, since a column with NULLs would be read as (lossy) floats
+    selected = ', '.join(f'IFNULL("{name}", {NAT_INT64}) AS "{name}"' if name in dates else f'"{name}"'
+                         for name in columns)
+    frame = sql_query(data_manager, f"""
+        SELECT {selected} FROM {attr} WHERE "{column}" = :value AND +rowid <= :{bound}
+        ORDER BY rowid""", value=value)
+    for name in dates:
+        frame[name] = frame[name].to_numpy(dtype='int64').view('datetime64[ns]')
+    return frame
@@ -0,0 +1,87 @@
+"""The POS tables as typed frames: their files, column types and date order
+
+Every CSV is parsed through read_typed_csv (or read_typed_csv_chunks), so
+whichever path loads a table - the in-memory load, an ingest of appended
+rows, the chunked out-of-core scan or the copy into SQLite - gives it the
+same dtypes.
+"""
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+# Source CSV file for each table held by CSVDataManager
+SOURCE_FILES = {
+    'customer_df': 'Customer.csv',
+    'inventory_df': 'Inventory.csv',
+    'detail_df': 'Detail.csv',
+    'pricelist_df': 'Pricelist.csv'
+}
+
+# Column types applied whenever a CSV is parsed. Low-cardinality text is
+# categorical, keys are int32 and date columns are parsed once at load
+# instead of on every request. Columns missing from a file are skipped.
+TABLE_SCHEMAS = {
+    'customer_df': {
+        'dtypes': {'CID': 'int32', 'STATE': 'category',
+                   'PRICETBL': 'category', 'pay_method': 'category'},
+        'dates': []
+    },
+    'inventory_df': {
+        'dtypes': {'IID': 'int32', 'CID': 'int32', 'CATEGORY': 'category', 'PIECES': 'int32',
+                   'PIF': 'category', 'payment_type': 'category'},
+        'dates': ['INDATE', 'READYDATE', 'OUTDATE']
+    },
+    'detail_df': {
+        'dtypes': {'Item_ID': 'int32', 'IID': 'int32', 'item_name': 'category',
+                   'price_table_item_id': 'int32', 'item_count': 'int32', 'dept_name': 'category'},
+        'dates': ['item_pickup_date']
+    },
+    'pricelist_df': {
+        'dtypes': {'item_id': 'int32'},
+        'dates': []
+    }
+}
+
+# Snapshots written under one schema must not be loaded under another
+SCHEMA_VERSION = hashlib.sha1(json.dumps(TABLE_SCHEMAS, sort_keys=True).encode()).hexdigest()[:8]
+
+# Tables kept sorted by a date column so date ranges are a contiguous block
+# found by binary search. The merged table is kept sorted by Order_Date.
+DATE_SORTED_TABLES = {'inventory_df': 'INDATE'}
+
+# NaT as an int64 timestamp; sorts before every real date
+NAT_INT64 = np.iinfo('int64').min
+
+NS_PER_DAY = 86400 * 10**9
+
+
+def read_typed_csv(attr, source, **kwargs):
+    """Parse a CSV for one table and apply its schema from TABLE_SCHEMAS"""
+    return parse_dates(attr, pd.read_csv(source, dtype=TABLE_SCHEMAS[attr]['dtypes'], **kwargs))
+
+
+def read_typed_csv_chunks(attr, source, chunk_rows):
+    """Like read_typed_csv, but yields the table in chunks of chunk_rows rows"""
+    with pd.read_csv(source, dtype=TABLE_SCHEMAS[attr]['dtypes'], chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield parse_dates(attr, chunk)
+
+
+def parse_dates(attr, frame):
+    """Convert a freshly parsed table's date columns"""
+    for column in TABLE_SCHEMAS[attr]['dates']:
+        if column in frame.columns:
+            frame[column] = pd.to_datetime(frame[column], format='ISO8601', errors='coerce')
+    return frame
+
+
+def sort_by_date(frame, column):
+    """Frame stably sorted by a date column with NaT first; returned as is when already in order"""
+    if column not in frame.columns:
+        return frame
+    stamps = frame[column].to_numpy().view('int64')
+    if (stamps[1:] >= stamps[:-1]).all():
+        return frame
+    return frame.take(np.argsort(stamps, kind='stable')).reset_index(drop=True)
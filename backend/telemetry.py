@@ -0,0 +1,165 @@
+"""Timing spans, counters and histograms exposed in the Prometheus text format
+
+Stages of a request are timed with span(); each span feeds a histogram and,
+while a trace is active (one per HTTP request), is also recorded in that
+request's stage breakdown for the slow-query log.
+
+Values are kept per process: under a pre-fork server every worker reports
+its own, so each sample carries the worker's pid.
+"""
+import contextvars
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+class Counter:
+    """Monotonic total per label set"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Observation counts per bucket, plus their sum and count, per label set"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][position] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        samples = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((f'{self.name}_bucket', key + (('le', repr(float(bound))),), cumulative))
+            samples.append((f'{self.name}_bucket', key + (('le', '+Inf'),), count))
+            samples.append((f'{self.name}_sum', key, total))
+            samples.append((f'{self.name}_count', key, count))
+        return samples
+
+
+class Registry:
+    """Holds the metrics of this process and renders them for a scrape"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation):
+        metric = Counter(name, documentation)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        pid = (('pid', str(os.getpid())),)
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_label_text(pid + labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram('smrt_stage_seconds', 'Time spent in each instrumented stage')
+ROWS_SCANNED = REGISTRY.counter('smrt_rows_scanned_total', 'Table rows read by each stage')
+
+# The active trace: {'stages': [(stage, seconds)], 'fields': {...}}
+_trace = contextvars.ContextVar('trace', default=None)
+
+
+def start_trace():
+    """Begin recording stages for the current request; returns a token for end_trace"""
+    return _trace.set({'stages': [], 'fields': {}})
+
+
+def end_trace(token):
+    """Stop recording and return the trace"""
+    trace = _trace.get()
+    _trace.reset(token)
+    return trace
+
+
+def annotate(**fields):
+    """Attach fields (e.g. the routed intent) to the active trace, if any"""
+    trace = _trace.get()
+    if trace is not None:
+        trace['fields'].update(fields)
+
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as one stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace['stages'].append((stage, elapsed))
+
+
+def count_rows(stage, rows):
+    ROWS_SCANNED.inc(rows, stage=stage)
+
+
+def normalize_query(text):
+    """Query text with case, punctuation, numbers and spacing normalized, for grouping in logs"""
+    text = re.sub(r'\d+(\.\d+)?', '#', text.lower())
+    text = re.sub(r'[^\w#\s]', ' ', text)
+    return ' '.join(text.split())
@@ -0,0 +1,35 @@
+"""Shared fixtures: the backend modules on the path and throwaway copies of the data"""
+import os
+import shutil
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(BACKEND_DIR), 'data')
+
+sys.path.insert(0, BACKEND_DIR)
+# app loads the sample data when imported; keep that from writing a snapshot or starting threads
+os.environ.setdefault('DATA_DIR', SAMPLE_DATA_DIR)
+os.environ.setdefault('SNAPSHOT_DIR', '')
+os.environ['START_BACKGROUND_TASKS'] = '0'
+
+
+@pytest.fixture
+def sample_data(tmp_path):
+    """A copy of the sample CSVs that a test may modify"""
+    directory = tmp_path / 'data'
+    directory.mkdir()
+    for name in os.listdir(SAMPLE_DATA_DIR):
+        if name.endswith('.csv'):
+            shutil.copy(os.path.join(SAMPLE_DATA_DIR, name), directory / name)
+    return str(directory)
+
+
+@pytest.fixture(scope='session')
+def generated_data(tmp_path_factory):
+    """CSVs from datagen.py, large enough to give every backend several chunks"""
+    import datagen
+    directory = tmp_path_factory.mktemp('generated')
+    datagen.generate(20_000, str(directory))
+    return str(directory)
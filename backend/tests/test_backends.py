@@ -0,0 +1,63 @@
+"""The pandas, chunked (MEMORY_BUDGET_MB) and SQLite (STORAGE_BACKEND=sqlite) backends give the same answers"""
+import re
+
+import pytest
+
+import app
+import benchmark
+
+
+@pytest.fixture(scope='session')
+def managers(generated_data, tmp_path_factory):
+    directory = tmp_path_factory.mktemp('backends')
+    chunked = app.CSVDataManager(generated_data, snapshot_dir='', memory_budget_mb=1,
+                                 spill_dir=str(directory / 'spill'))
+    assert chunked.out_of_core
+    return {
+        'pandas': app.CSVDataManager(generated_data, snapshot_dir=''),
+        'chunked': chunked,
+        'sqlite': app.CSVDataManager(generated_data, snapshot_dir='', storage='sqlite',
+                                     sqlite_path=str(directory / 'smrt.db'))
+    }
+
+
+def without_timestamps(body):
+    if isinstance(body, dict):
+        return {key: without_timestamps(value) for key, value in body.items() if key != 'timestamp'}
+    if isinstance(body, str):
+        return re.sub(r'Generated on: .*', '', body)
+    return body
+
+
+@pytest.fixture(scope='session')
+def answers(managers):
+    """Every benchmark case's response body from each backend"""
+    answers = {}
+    patch = pytest.MonkeyPatch()
+    try:
+        patch.setattr(app, 'data_manager', managers['pandas'])
+        cases = benchmark.build_cases(app)
+        for backend, manager in managers.items():
+            patch.setattr(app, 'data_manager', manager)
+            # The backends share a data version, so cached answers would leak between them
+            benchmark.clear_result_caches(app)
+            client = app.app.test_client()
+            for name, method, path, payload in cases:
+                response = benchmark.send(client, method, path, payload)
+                assert response.status_code == 200, (backend, name, response.get_data(as_text=True))
+                body = response.get_json() if response.is_json else response.get_data(as_text=True)
+                answers.setdefault(name, {})[backend] = without_timestamps(body)
+    finally:
+        patch.undo()
+        benchmark.clear_result_caches(app)
+    return answers
+
+
+@pytest.mark.parametrize('backend', ['chunked', 'sqlite'])
+def test_backends_agree(answers, backend):
+    different = [name for name, bodies in answers.items() if bodies[backend] != bodies['pandas']]
+    assert not different
+
+
+def test_cases_cover_every_endpoint(answers):
+    assert {name.split(':')[0] for name in answers} >= {'query', 'drilldown', 'report', 'chart', 'analysis'}
@@ -0,0 +1,104 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+
+def append_csv(data_dir, filename, rows):
+    with open(os.path.join(data_dir, filename), 'a') as f:
+        rows.to_csv(f, header=False, index=False)
+
+
+def read_raw(data_dir, filename):
+    return pd.read_csv(os.path.join(data_dir, filename), dtype=str, keep_default_na=False)
+
+
+def canonical(frame):
+    """frame with categories as plain values, in an order that doesn't depend on how it was built"""
+    frame = frame.apply(lambda column: column.astype(object) if isinstance(column.dtype, pd.CategoricalDtype)
+                        else column)
+    keys = ['Order_Date', 'Item_ID', 'IID', 'INDATE', 'CID']
+    return frame.sort_values(keys, kind='stable', na_position='first').reset_index(drop=True)
+
+
+def state(manager):
+    """Everything an ingest carries forward instead of rebuilding"""
+    metrics = manager.get_metrics()
+    cube = manager.get_aggregates()
+    sketches = manager.get_sketches()
+    return {
+        'merged': canonical(manager.get_merged_data()),
+        'total_orders': metrics['total_orders'],
+        'order_items': metrics['total_order_items'],
+        'revenue': round(cube.total_revenue, 6),
+        'products': cube.table('product').sort_index().round(6),
+        'customers': cube.table('customer').sort_index().round(6),
+        'days': sketches.days.tolist(),
+        'registers': sketches.registers.tobytes(),
+        'price_counts': sketches.price_counts.tobytes(),
+        'range': app.date_range_summary(manager, pd.Timestamp('2025-03-01'), pd.Timestamp('2025-06-01 12:00')),
+    }
+
+
+def assert_same_state(left, right):
+    pd.testing.assert_frame_equal(left.pop('merged'), right.pop('merged'), check_dtype=False)
+    for name in ('products', 'customers'):
+        pd.testing.assert_frame_equal(left.pop(name), right.pop(name), check_dtype=False)
+    assert left == right
+
+
+@pytest.fixture
+def manager(sample_data, monkeypatch):
+    manager = app.CSVDataManager(sample_data, snapshot_dir='')
+    # Built now, so the ingest has to fold the new rows into them
+    state(manager)
+
+    def no_reload():
+        raise AssertionError('appended rows were reloaded instead of ingested')
+    monkeypatch.setattr(manager, 'load_all_data', no_reload)
+    return manager
+
+
+def test_appended_orders_and_lines_match_a_reload(manager, sample_data):
+    inventory = read_raw(sample_data, 'Inventory.csv')
+    detail = read_raw(sample_data, 'Detail.csv')
+    orders = inventory.tail(3).copy()
+    orders['IID'] = [str(int(inventory['IID'].astype(int).max()) + k) for k in range(1, 4)]
+    # Out of date order: one order is back-dated into the middle of the data
+    orders['INDATE'] = ['2025-09-08 09:00:00.000', '2024-12-01 10:00:00.000', '']
+    lines = detail.tail(4).copy()
+    lines['Item_ID'] = [str(int(detail['Item_ID'].astype(int).max()) + k) for k in range(1, 5)]
+    lines['IID'] = list(orders['IID']) + [inventory['IID'].iloc[0]]
+    append_csv(sample_data, 'Inventory.csv', orders)
+    append_csv(sample_data, 'Detail.csv', lines)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', FutureWarning)
+        manager.refresh(wait=True)
+
+    assert_same_state(state(manager), state(app.CSVDataManager(sample_data, snapshot_dir='')))
+
+
+def test_lines_written_before_their_order_join_when_it_arrives(manager, sample_data):
+    inventory = read_raw(sample_data, 'Inventory.csv')
+    detail = read_raw(sample_data, 'Detail.csv')
+    order = inventory.tail(1).copy()
+    order['IID'] = str(int(inventory['IID'].astype(int).max()) + 1)
+    lines = detail.tail(2).copy()
+    lines['Item_ID'] = [str(int(detail['Item_ID'].astype(int).max()) + k) for k in range(1, 3)]
+    lines['IID'] = order['IID'].iloc[0]
+
+    append_csv(sample_data, 'Detail.csv', lines)
+    manager.refresh(wait=True)
+    append_csv(sample_data, 'Inventory.csv', order)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', FutureWarning)
+        manager.refresh(wait=True)
+
+    fresh = app.CSVDataManager(sample_data, snapshot_dir='')
+    assert np.isin(lines['Item_ID'].astype(int), manager.get_merged_data()['Item_ID']).all()
+    assert_same_state(state(manager), state(fresh))
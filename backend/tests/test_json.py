@@ -0,0 +1,56 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+
+def payload():
+    return {
+        'nan': float('nan'),
+        'infinities': [float('inf'), -np.inf],
+        'scalar': np.float64('nan'),
+        'float32': np.float32('inf'),
+        'array': np.array([np.nan, 1.5]),
+        'series': pd.Series([np.nan, 2.0], index=['a', 'b']),
+        'frame': pd.DataFrame({'x': [np.nan, 3.0]}),
+        'nested': ({'deep': [np.nan]},),
+        'when': pd.Timestamp('2025-01-02 03:04:05'),
+        'missing': pd.NaT,
+    }
+
+
+EXPECTED = {
+    'nan': None,
+    'infinities': [None, None],
+    'scalar': None,
+    'float32': None,
+    'array': [None, 1.5],
+    'series': [None, 2.0],
+    'frame': [{'x': None}, {'x': 3.0}],
+    'nested': [{'deep': [None]}],
+    'when': '2025-01-02T03:04:05',
+    'missing': None,
+}
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def provider(request, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(app, 'orjson', None)
+    elif app.orjson is None:
+        pytest.skip('orjson is not installed')
+    return app.app.json
+
+
+def test_non_finite_floats_are_null(provider):
+    body = provider.encode(payload())
+    assert json.loads(body, parse_constant=pytest.fail) == EXPECTED
+
+
+def test_non_string_keys_fall_back_to_the_same_output(provider):
+    # orjson rejects numpy integer keys, so this goes through the standard library encoder
+    body = provider.encode({'counts': {np.int64(1): float('nan'), np.int64(2): np.array([np.inf])}})
+    assert json.loads(body, parse_constant=pytest.fail) == {'counts': {'1': None, '2': [None]}}
@@ -0,0 +1,55 @@
+import json
+
+import app
+
+
+def post(query, **options):
+    return app.app.test_client().post('/api/query', json=dict(options, query=query))
+
+
+def test_ndjson_answers_a_named_customer_like_json():
+    name = app.data_manager.customer_df['Customer_Name'].iloc[5]
+    query = f"show me all customers like {name}"
+    as_json = post(query)
+    as_ndjson = post(query, format='ndjson')
+    assert as_json.get_json()['result']['customer'] == name
+    assert as_ndjson.mimetype == 'application/json'
+    assert as_ndjson.get_json()['result'] == as_json.get_json()['result']
+
+
+def test_ndjson_streams_list_intents():
+    response = post('show me all customers', format='ndjson', limit=3)
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(rows) == 3
+    assert int(response.headers['X-Total-Count']) == len(app.data_manager.customer_df)
+
+
+def period(start, end):
+    response = post('total revenue', start=start, end=end)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['result']
+
+
+def test_offset_start_is_compared_as_a_time():
+    # Midnight at +05:00 is 19:00 UTC the day before, so the range is not reversed
+    assert period('2025-05-01T00:00:00+05:00', '2025-05-01') == period('2025-04-30T19:00:00', '2025-05-01')
+    assert post('total revenue', start='2025-05-01T06:00:00+05:00', end='2025-05-01').status_code == 400
+    assert period('2025-05-01T04:00:00+05:00', '2025-05-01') == period('2025-04-30T23:00:00', '2025-05-01')
+    assert period('2025-02-01T00:00:00+05:00', '2025-08-01') == period('2025-01-31T19:00:00', '2025-08-01')
+
+
+def test_offset_end_slices_like_the_same_naive_time():
+    result = period('2025-02-01', '2025-08-01T02:00:00+02:00')
+    assert result == period('2025-02-01', '2025-08-01T00:00:00')
+    assert result['period_orders'] > 0
+    # 02:00 at +05:00 is 21:00 UTC the day before, which is before the start
+    response = post('total revenue', start='2025-08-01T01:00:00', end='2025-08-01T02:00:00+05:00')
+    assert response.status_code == 400
+
+
+def test_unparseable_bounds_are_rejected():
+    for value in ('not a date', 'NaT'):
+        response = post('total revenue', start=value)
+        assert response.status_code == 400
+        assert 'start must be an ISO date' in response.get_json()['error']
@@ -0,0 +1,32 @@
+import csv
+import io
+import re
+
+import app
+
+AMOUNT = re.compile(r'^-?\d+(\.\d{1,2})?$')
+
+
+def report(**params):
+    response = app.app.test_client().get('/api/reports/text', query_string=params)
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def numeric_cells(text):
+    rows = list(csv.reader(io.StringIO(text)))[1:]
+    return [cell for row in rows for cell in row if re.match(r'^-?[\d.]+$', cell)]
+
+
+def test_summary_csv_rounds_amounts_like_the_json_summary():
+    rows = dict(list(csv.reader(io.StringIO(report(type='summary', format='csv'))))[1:])
+    summary = app.data_manager.get_data_summary()
+    assert float(rows['avg_order_value']) == round(summary['avg_order_value'], 2)
+    assert float(rows['total_revenue']) == round(summary['total_revenue'], 2)
+    assert all(AMOUNT.match(cell) for cell in numeric_cells(report(type='summary', format='csv')))
+
+
+def test_customer_csv_rounds_amounts():
+    cells = numeric_cells(report(type='customer', format='csv', limit=20))
+    assert cells
+    assert all(AMOUNT.match(cell) for cell in cells)
@@ -0,0 +1,48 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture
+def manager(sample_data):
+    # One customer whose orders all lack a date
+    path = os.path.join(sample_data, 'Inventory.csv')
+    inventory = pd.read_csv(path, dtype=str, keep_default_na=False)
+    cid = inventory['CID'].value_counts().index[-1]
+    inventory.loc[inventory['CID'] == cid, 'INDATE'] = ''
+    inventory.to_csv(path, index=False)
+    manager = app.CSVDataManager(sample_data, snapshot_dir='')
+    manager.undated_cid = int(cid)
+    return manager
+
+
+def all_members(manager):
+    summary = app.rfm_analysis(manager, {})['rfm']
+    members = []
+    for segment in summary['segments']:
+        members += app.rfm_analysis(manager, {'segment': segment, 'limit': 1000})['rfm']['members']
+    return members
+
+
+def test_customers_without_a_dated_order_have_no_recency(manager):
+    members = {member['CID']: member for member in all_members(manager)}
+    assert members[manager.undated_cid]['recency_days'] is None
+    assert all(member['recency_days'] is not None for cid, member in members.items() if cid != manager.undated_cid)
+    body = app.app.json.encode(app.rfm_analysis(manager, {}))
+    json.loads(body, parse_constant=pytest.fail)
+
+
+def test_pages_reuse_the_scores(manager, monkeypatch):
+    calls = []
+    quantile_scores = app.quantile_scores
+    monkeypatch.setattr(app, 'quantile_scores', lambda *args: calls.append(args) or quantile_scores(*args))
+    first = app.rfm_analysis(manager, {'segment': 'Need Attention', 'limit': 5})['rfm']
+    second = app.rfm_analysis(manager, {'segment': 'Need Attention', 'limit': 5, 'cursor': first['next_cursor']})['rfm']
+    assert len(calls) == 3
+    assert not {member['CID'] for member in first['members']} & {member['CID'] for member in second['members']}
+    app.rfm_analysis(manager, {'bins': 3})
+    assert len(calls) == 6
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from search_index import SearchIndex
+
+NAMES = ['Maria Garcia', 'John Smith', 'John Smith', 'Suit', '2 Piece Suit', 'Dress Shirt', 'Alterations']
+EMAILS = ['maria@example.com', 'john.smith@example.com', '', None, None, None, None]
+# Phone numbers are indexed as their digits, as app.customer_identifiers gives them
+PHONES = ['5551234567', '5559876543', 'nan', None, None, None, None]
+COMMON = frozenset({'how', 'much', 'has', 'spent', 'sales', 'of', 'the', 'show', 'me', 'pressed'})
+
+
+@pytest.fixture(scope='module')
+def index():
+    return SearchIndex(NAMES, [EMAILS, PHONES])
+
+
+def matched(index, text):
+    positions, _ = index.match(text, COMMON)
+    return sorted(index.names[positions].tolist())
+
+
+@pytest.mark.parametrize('text, names', [
+    ('how much has maria garcia spent', ['Maria Garcia']),
+    ('sales of dress shirts', ['Dress Shirt']),
+    ('how much has mariah garcia spent', ['Maria Garcia']),
+    ('sales of alteratons', ['Alterations']),
+    # Every token of a name must be mentioned
+    ('how much has maria spent', []),
+    # Names that share a token: the one with more of it mentioned wins
+    ('sales of the 2 piece suit', ['2 Piece Suit']),
+    ('sales of suits', ['Suit']),
+])
+def test_names_match_by_their_tokens(index, text, names):
+    assert matched(index, text) == names
+
+
+def test_customers_sharing_a_name_are_all_returned(index):
+    positions, score = index.match('show me john smith', COMMON)
+    assert positions.tolist() == [1, 2]
+    assert score == 2
+
+
+@pytest.mark.parametrize('text', [
+    'what has maria@example.com bought',
+    'orders for MARIA@EXAMPLE.COM',
+    'customer 555-123-4567',
+    'customer (555) 123 4567',
+])
+def test_identifiers_match_exactly_and_outrank_names(index, text):
+    positions, score = index.match(f"{text} or john smith", COMMON)
+    assert positions.tolist() == [0]
+    assert score == np.inf
+
+
+def test_identifiers_only_match_whole(index):
+    # A country code makes it another number, so the names decide
+    assert matched(index, 'customer +1 555 123 4567 john smith') == ['John Smith', 'John Smith']
+    assert matched(index, 'customer nan') == []
+    assert index.identifiers.get('none') is None
+
+
+def test_common_words_never_match_alone():
+    index = SearchIndex(['Show Me', 'Pressed Shirt'])
+    assert matched(index, 'show me the sales') == []
+    # ...but may complete a name that has a distinctive token mentioned
+    assert matched(index, 'sales of pressed shirts') == ['Pressed Shirt']
+
+
+def test_common_words_are_not_looked_up_fuzzily():
+    index = SearchIndex(['Alterations'])
+    assert index.match('alteratons', frozenset())[0].tolist() == [0]
+    assert index.match('alteratons', frozenset({'alteratons'}))[0].tolist() == []
+
+
+def test_short_tokens_are_not_looked_up_fuzzily():
+    index = SearchIndex(['Tie'])
+    assert matched(index, 'sales of tie') == ['Tie']
+    assert matched(index, 'sales of tee') == []
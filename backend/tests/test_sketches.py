@@ -0,0 +1,76 @@
+import math
+
+import numpy as np
+import pytest
+
+from sketches import BUCKET_NS, DailySketches, HyperLogLog, LineSketch, QuantileSketch, UNDATED
+
+
+def hll_of(values):
+    return DailySketches.from_rows(np.full(len(values), UNDATED), values, np.ones(len(values))).total().customers
+
+
+@pytest.mark.parametrize('cardinality', [1, 10, 100, 1000, 10_000, 100_000])
+def test_distinct_count_is_within_three_standard_errors(cardinality):
+    values = [f"customer {i}" for i in range(cardinality)]
+    # Repeats must not count again
+    estimate = hll_of(values + values[:cardinality // 2]).count()
+    assert abs(estimate - cardinality) <= 3 * HyperLogLog.relative_error * cardinality + 1
+
+
+def test_merged_registers_equal_the_sketch_of_the_union():
+    first = [f"c{i}" for i in range(0, 3000)]
+    second = [f"c{i}" for i in range(2000, 5000)]
+    merged = hll_of(first).merge(hll_of(second))
+    assert np.array_equal(merged.registers, hll_of(first + second).registers)
+
+
+@pytest.mark.parametrize('q', [0.0, 0.01, 0.25, 0.5, 0.9, 0.99, 1.0])
+def test_quantiles_are_within_the_relative_accuracy(q):
+    prices = np.random.default_rng(7).lognormal(3, 1.5, 50_000).round(2)
+    prices = prices[prices >= 0.01]
+    sketch = QuantileSketch()
+    sketch.counts += np.bincount(QuantileSketch.bins(prices), minlength=QuantileSketch.size)
+    exact = np.sort(prices)[int(q * (len(prices) - 1))]
+    assert sketch.quantile(q) == pytest.approx(exact, rel=QuantileSketch.relative_error)
+
+
+def test_combined_parts_equal_one_sketch_of_all_rows():
+    rng = np.random.default_rng(11)
+    stamps = rng.integers(0, 30, 20_000) * BUCKET_NS + rng.integers(0, BUCKET_NS, 20_000)
+    stamps[::50] = UNDATED
+    customers = rng.integers(0, 3000, 20_000).astype(str).astype(object)
+    prices = rng.uniform(1, 500, 20_000)
+    whole = DailySketches.from_rows(stamps, customers, prices)
+    # Split so that the parts share days, as partitions and appended rows do
+    parts = DailySketches.combine(DailySketches.from_rows(stamps[i::3], customers[i::3], prices[i::3])
+                                  for i in range(3))
+
+    assert np.array_equal(parts.days, whole.days)
+    assert np.array_equal(parts.lines, whole.lines)
+    assert np.allclose(parts.revenue, whole.revenue)
+    assert np.array_equal(parts.registers, whole.registers)
+    assert np.array_equal(parts.price_counts, whole.price_counts)
+
+
+def test_whole_days_are_sketched_and_partial_days_left_to_the_caller():
+    stamps = np.array([0, BUCKET_NS, BUCKET_NS + 5, 2 * BUCKET_NS, UNDATED])
+    sketches = DailySketches.from_rows(stamps, ['a', 'b', 'c', 'd', 'e'], [1.0, 2.0, 3.0, 4.0, 5.0])
+
+    whole, edges = sketches.between(BUCKET_NS // 2, 2 * BUCKET_NS)
+    assert (whole.lines, whole.revenue) == (2, 5.0)
+    assert edges == [(BUCKET_NS // 2, BUCKET_NS)]
+
+    # Undated lines count towards the total but never towards a range
+    everything, edges = sketches.between(None, None)
+    assert (everything.lines, edges) == (4, [])
+    assert sketches.total().lines == 5
+
+
+def test_empty_input():
+    empty = DailySketches.from_rows([], [], [])
+    total = empty.total()
+    assert (total.lines, total.revenue, total.customers.count()) == (0, 0.0, 0)
+    assert math.isnan(total.prices.quantile(0.5))
+    assert DailySketches.combine([]).total().lines == 0
+    assert LineSketch.from_rows([], []).customers.count() == 0
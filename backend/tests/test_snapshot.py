@@ -0,0 +1,28 @@
+import os
+
+import pandas as pd
+
+import app
+
+
+def test_rejected_reload_keeps_the_snapshot(sample_data, tmp_path):
+    snapshot_dir = tmp_path / 'snapshot'
+    manager = app.CSVDataManager(sample_data, snapshot_dir=str(snapshot_dir))
+    manifest = (snapshot_dir / 'manifest.json').read_bytes()
+    customers = manager.customer_df
+
+    # Parses fine, but without the column every join needs
+    path = os.path.join(sample_data, 'Customer.csv')
+    pd.read_csv(path).drop(columns=['CID']).to_csv(path, index=False)
+    manager.refresh(wait=True)
+
+    assert manager.customer_df is customers
+    assert (snapshot_dir / 'manifest.json').read_bytes() == manifest
+
+
+def test_snapshot_is_reused_after_a_restart(sample_data, tmp_path):
+    snapshot_dir = str(tmp_path / 'snapshot')
+    first = app.CSVDataManager(sample_data, snapshot_dir=snapshot_dir)
+    second = app.CSVDataManager(sample_data, snapshot_dir=snapshot_dir)
+    pd.testing.assert_frame_equal(first.inventory_df, second.inventory_df)
+    assert first.get_metrics()['total_orders'] == second.get_metrics()['total_orders']